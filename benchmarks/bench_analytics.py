@@ -0,0 +1,105 @@
+""" Analytics benchmarks on a synthetic typing history. """
+import os
+import random
+import tempfile
+import time
+from array import array
+
+from pytouch import analytics
+from pytouch.analytics import Analytics
+from pytouch.model import Session, Lesson, get_engine, create_db
+from pytouch.recorder import SessionRecorder
+from pytouch.trainingmachine import KeyStrokeLog
+
+from common import longest_lessons, measure, record, RecordedMachine
+
+STROKES = 1000000
+
+
+def _history(text, strokes, seed=0):
+    """ Sessions typing the whole text with a typo and an undo on about every tenth character.
+
+    :return: A list of (codes, indices, times) arrays with a total of at least the given number of strokes.
+    """
+    rng = random.Random(seed)
+    sessions = list()
+    total = 0
+    while total < strokes:
+        codes, indices, times = array('i'), array('i'), array('q')
+        time = 0
+        for i, c in enumerate(text):
+            if rng.random() < 0.1 and c != '\n':
+                for code in (ord('\x00'), KeyStrokeLog.UNDO_CODE):
+                    time += rng.randrange(80000000, 400000000)
+                    codes.append(code)
+                    indices.append(i)
+                    times.append(time)
+            time += rng.randrange(80000000, 400000000)
+            codes.append(ord(c))
+            indices.append(i)
+            times.append(time)
+        sessions.append((codes, indices, times))
+        total += len(codes)
+    return sessions
+
+
+def bench_analytics_add():
+    """ Aggregation of a million key strokes with the vectorised and the pure Python implementation. """
+    text = max(longest_lessons().values(), key=lambda lesson: len(lesson.text)).text
+    sessions = _history(text, STROKES)
+
+    def add():
+        uut = Analytics()
+        for session in sessions:
+            uut.add(text, *session)
+
+    results = {'strokes': sum(len(s[0]) for s in sessions)}
+    numpy = analytics.numpy
+    if numpy is not None:
+        results['numpy'] = measure(add, repeat=3)
+    analytics.numpy = None
+    try:
+        results['python'] = measure(add, repeat=1)
+    finally:
+        analytics.numpy = numpy
+    return results
+
+
+def bench_analytics_update():
+    """ Incremental update from the database, first the whole history and then one new session. """
+    lesson = max(longest_lessons().values(), key=lambda lesson: len(lesson.text))
+    sessions = _history(lesson.text, STROKES // 4)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = get_engine({'sqlalchemy.url': 'sqlite:///{}'.format(os.path.join(directory, 'bench.sqlite')),
+                             'sqlite.profile': 'performance'})
+        create_db(engine)
+        session = Session(bind=engine)
+        lesson = Lesson(title=lesson.title, text=lesson.text)
+        session.add(lesson)
+        session.commit()
+
+        recorder = SessionRecorder(engine, lesson=lesson)
+
+        for strokes in sessions[:-1]:
+            record(recorder, RecordedMachine(*strokes)).result()
+
+        uut = Analytics()
+        start = time.perf_counter()
+        history = uut.update(session)
+        full = time.perf_counter() - start
+
+        record(recorder, RecordedMachine(*sessions[-1])).result()
+        start = time.perf_counter()
+        new = uut.update(session)
+        incremental = time.perf_counter() - start
+
+        recorder.close()
+        session.close()
+        engine.dispose()
+
+    return {
+        'history': {'strokes': history, 'time': full},
+        'incremental': {'strokes': new, 'time': incremental},
+        'numpy': analytics.numpy is not None,
+    }
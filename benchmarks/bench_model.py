@@ -0,0 +1,70 @@
+""" Model benchmarks. """
+import os
+import random
+import tempfile
+import time
+from array import array
+
+from pytouch.model import Lesson, SQLITE_PROFILES, get_engine, create_db
+from pytouch.recorder import SessionRecorder
+
+from common import longest_lessons, measure, record, RecordedMachine
+
+
+def bench_lesson_position():
+    results = dict()
+    for name, lesson in longest_lessons().items():
+        text = lesson.text
+        rng = random.Random(0)
+        indices = [rng.randrange(len(text)) for _ in range(10000)]
+
+        def build():
+            Lesson(text=text).line_offsets
+
+        def lookup():
+            for i in indices:
+                lesson.position(i)
+
+        results[name] = {
+            'chars': len(text),
+            'build': measure(build),
+            'lookup': measure(lookup, number=1),
+            'lookups': len(indices),
+        }
+    return results
+
+
+def bench_session_inserts():
+    """ Write throughput of training sessions for every SQLite profile.
+
+    Every session is written by a SessionRecorder flush in its own transaction with 200 key strokes.
+    """
+    sessions = 200
+    strokes = 200
+    indices = array('i', range(strokes))
+    codes = array('i', [ord('f')] * strokes)
+    times = array('q', range(0, strokes * 1000000, 1000000))
+    machine = RecordedMachine(codes, indices, times)
+
+    results = dict()
+    for profile in sorted(SQLITE_PROFILES):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = get_engine({'sqlalchemy.url': 'sqlite:///{}'.format(os.path.join(directory, 'bench.sqlite')),
+                                 'sqlite.profile': profile})
+            create_db(engine)
+            recorder = SessionRecorder(engine)
+
+            start = time.perf_counter()
+            for _ in range(sessions):
+                record(recorder, machine)
+            recorder.close()
+            duration = time.perf_counter() - start
+
+            engine.dispose()
+
+        results[profile] = {
+            'time': duration,
+            'sessions_per_second': sessions / duration,
+            'strokes_per_second': sessions * strokes / duration,
+        }
+    return results
@@ -0,0 +1,130 @@
+""" Course pipeline benchmarks. """
+import os
+import tempfile
+
+from pytouch.drill import NgramIndex
+from pytouch.model import get_engine, Session, Course, reset_db
+from pytouch.service import CourseService
+
+from common import course_files, service, parse_courses, measure
+
+
+def bench_parse_courses():
+    """ Parsing and validation of all course files. The records are the plain data, the models include building the ORM objects. """
+    files = course_files()
+    return {
+        'files': len(files),
+        'records': measure(lambda: service(files)._course_records(), repeat=3),
+        'models': measure(lambda: parse_courses(files), repeat=3),
+    }
+
+
+def bench_parse_courses_cached():
+    """ Like bench_parse_courses but loading from a warm course cache. """
+    files = course_files()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'courses.cache')
+        parse_courses(files, path)
+        return {
+            'files': len(files),
+            'records': measure(lambda: service(files, path)._course_records(), repeat=3),
+            'models': measure(lambda: parse_courses(files, path), repeat=3),
+        }
+
+
+def bench_parse_courses_parallel():
+    """ Parsing and validation of all course files on a process pool with one process per CPU, at least two.
+
+    The speedup is relative to the serial parser of the same run and includes starting the pool.
+    """
+    files = course_files()
+    serial = measure(lambda: service(files)._course_records(), repeat=3)
+
+    parallel_service = service(files)
+    parallel_service.jobs = max(os.cpu_count() or 1, 2)
+    parallel = measure(lambda: parallel_service._course_records(), repeat=3)
+
+    return {
+        'files': len(files),
+        'jobs': parallel_service.jobs,
+        'serial': serial,
+        'parallel': parallel,
+        'speedup': serial['min'] / parallel['min'],
+    }
+
+
+def bench_reset_database():
+    uut = service(course_files())
+
+    def reset():
+        engine = get_engine({'sqlalchemy.url': 'sqlite:///{}'.format(path)})
+        Session.configure(bind=engine)
+        reset_db(engine)
+        uut.init_courses()
+        engine.dispose()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite')
+        return measure(reset, repeat=3)
+
+
+def bench_drill():
+    """ Building, loading and querying the drill index of the largest courses. """
+    files = course_files()
+    with tempfile.TemporaryDirectory() as directory:
+        engine = get_engine({'sqlalchemy.url': 'sqlite:///{}'.format(os.path.join(directory, 'bench.sqlite'))})
+        Session.configure(bind=engine)
+        reset_db(engine)
+        service(files).init_courses()
+
+        session = Session()
+        courses = {course.uuid: course.title for course in session.query(Course)}
+        session.close()
+
+        def build_all():
+            session = Session()
+            try:
+                return [NgramIndex.build(lesson.text for lesson in course.lessons)
+                        for course in Course.find_all(session, with_text=True)]
+            finally:
+                session.close()
+
+        build = measure(build_all, repeat=3)
+        sizes = {uuid: len(CourseService.drill_index(uuid)) for uuid in courses}
+        largest = sorted(sizes, key=sizes.get)[-3:]
+
+        weights = {'e': 3, 'n': 2, 'er': 2, 'st': 1}
+        results = {'courses': len(courses), 'build_all': build}
+        for uuid in largest:
+            results[courses[uuid]] = {
+                'words': sizes[uuid],
+                'load': measure(lambda: CourseService.drill_index(uuid), repeat=10),
+                'drill': measure(lambda: CourseService.drill_index(uuid).drill(weights), repeat=10),
+            }
+        engine.dispose()
+        return results
+
+
+def bench_search_lessons():
+    """ Lesson searches by words and characters and by character set on a database with all courses. """
+    queries = {
+        'word': (['quelltext'], ''),
+        'prefix': (['qu*'], ''),
+        'words_and_chars': (['Grund*'], 'ö'),
+        'chars': ([], 'ß'),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        engine = get_engine({'sqlalchemy.url': 'sqlite:///{}'.format(os.path.join(directory, 'bench.sqlite'))})
+        Session.configure(bind=engine)
+        reset_db(engine)
+        service(course_files()).init_courses()
+
+        results = {name: dict(measure(lambda: CourseService.search_lessons(words, chars), repeat=20),
+                              matches=len(CourseService.search_lessons(words, chars)))
+                   for name, (words, chars) in queries.items()}
+
+        for name, kwargs in {'only': {'only': 'asdfjklöei'}, 'including': {'including': 'qx'}}.items():
+            results['charset_' + name] = dict(measure(lambda: CourseService.find_lessons_by_chars(**kwargs), repeat=20),
+                                              matches=len(CourseService.find_lessons_by_chars(**kwargs)))
+        engine.dispose()
+        return results
@@ -0,0 +1,72 @@
+""" Startup benchmarks.
+
+Every command runs in a fresh interpreter with -X importtime. The import time is the sum of the cumulative times
+of all top-level imports, the wall time includes the interpreter startup and the command itself.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Wall time targets in seconds
+TARGETS = {
+    'help': 0.15,
+    'reset-database': 1.5,
+}
+
+# Modules a command should only load if it needs them
+HEAVY_MODULES = ('sqlalchemy', 'lxml', 'pkg_resources', 'tkinter')
+
+
+def _import_times(stderr):
+    """ Get the cumulative import time in seconds of every imported module and whether it is a top-level import. """
+    rv = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            rv[name.strip()] = (int(cumulative) / 1e6, not name.startswith('  '))
+    return rv
+
+
+def _run(args, repeat=5):
+    code = 'from pytouch.main import manage; manage()'
+    env = dict(os.environ, PYTHONPATH=ROOT_PATH)
+    walls = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code] + args, env=env,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        walls.append(time.perf_counter() - start)
+    imports = _import_times(process.stderr)
+    top = {name: cumulative for name, (cumulative, top_level) in imports.items() if top_level}
+    return {
+        'min': min(walls),
+        'mean': sum(walls) / len(walls),
+        'imports': sum(top.values()),
+        'slowest': sorted(top, key=top.get, reverse=True)[:5],
+        'heavy': sorted(set(name.split('.')[0] for name in imports) & set(HEAVY_MODULES)),
+    }
+
+
+def _check(name, result):
+    result['target'] = TARGETS[name]
+    result['ok'] = result['min'] <= TARGETS[name]
+    return result
+
+
+def bench_startup_help():
+    return _check('help', _run(['--help']))
+
+
+def bench_startup_reset_database():
+    """ Reset a new database from the course cache, the first run fills the cache. """
+    with tempfile.TemporaryDirectory() as path:
+        args = ['--database', 'sqlite:///' + os.path.join(path, 'pytouch.sqlite'),
+                'reset-database', '--course-cache', os.path.join(path, 'courses.cache')]
+        _run(args, repeat=1)
+        return _check('reset-database', _run(args))
@@ -0,0 +1,99 @@
+""" TrainingMachine benchmarks on the largest bundled lessons. """
+import time
+
+from pytouch.trainingmachine import TrainingMachine, Event
+
+from common import longest_lessons, measure
+
+
+def _events(text):
+    """ Input events typing the whole text with a typo and an undo on every tenth character. """
+    events = list()
+    for i, c in enumerate(text):
+        if i % 10 == 3 and c != '\n':
+            events.append(Event.input_event(i, '\x00'))
+            events.append(Event.undo_event(i + 1))
+        events.append(Event.input_event(i, c))
+    return events
+
+
+def bench_construction():
+    return {name: dict(measure(lambda: TrainingMachine(lesson.text), repeat=10), chars=len(lesson.text))
+            for name, lesson in longest_lessons().items()}
+
+
+def bench_event_latency():
+    """ Per event latency while typing the whole lesson.
+
+    The scaling is the ratio of the mean latency of the last and the first tenth of the events.
+    It should stay close to 1, anything that grows with the text length shows up here.
+    """
+    results = dict()
+    for name, lesson in longest_lessons().items():
+        tm = TrainingMachine(lesson.text, auto_unpause=True)
+        events = _events(tm._chars)
+        latencies = list()
+        for event in events:
+            start = time.perf_counter()
+            tm.process_event(event)
+            latencies.append(time.perf_counter() - start)
+
+        tenth = max(len(latencies) // 10, 1)
+        first = sum(latencies[:tenth]) / tenth
+        last = sum(latencies[-tenth:]) / tenth
+        latencies.sort()
+        results[name] = {
+            'events': len(events),
+            'mean': sum(latencies) / len(latencies),
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[int(len(latencies) * 0.99)],
+            'max': latencies[-1],
+            'scaling': last / first,
+        }
+    return results
+
+
+def bench_key_latency_overhead():
+    """ Cost of the per key stroke latency instrumentation of the training widget.
+
+    The handler work around process_event is replayed without Tk: disabled is the attribute check of the widget,
+    enabled records all stages and a redraw every tenth event.
+    """
+    from pytouch.gui.tk.latency import KeyLatency
+
+    results = dict()
+    for name, lesson in longest_lessons().items():
+        events = _events(lesson.text + '\n')
+
+        def disabled():
+            tm = TrainingMachine(lesson.text, auto_unpause=True)
+            latency = None
+            for event in events:
+                if latency is not None:
+                    latency.key_press(0)
+                tm.process_event(event)
+                if latency is not None:
+                    latency.processed()
+
+        def enabled():
+            tm = TrainingMachine(lesson.text, auto_unpause=True)
+            latency = KeyLatency()
+            tm.add_observer(latency)
+            for i, event in enumerate(events):
+                if latency is not None:
+                    latency.key_press(i)
+                tm.process_event(event)
+                if latency is not None:
+                    latency.processed()
+                if i % 10 == 9:
+                    latency.painted()
+
+        off = measure(disabled)
+        on = measure(enabled)
+        results[name] = {
+            'events': len(events),
+            'disabled': off,
+            'enabled': on,
+            'per_event': (on['min'] - off['min']) / len(events),
+        }
+    return results
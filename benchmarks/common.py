@@ -0,0 +1,71 @@
+""" Helpers shared by the benchmarks. """
+import gc
+import time
+
+from pkg_resources import resource_listdir
+
+from pytouch.service import CourseService
+from pytouch.trainingmachine import KeyStrokeLog
+
+LARGE_COURSES = ('bg2.xml', 'de.neo.xml', 'de.dvorak.xml')
+
+
+def course_files():
+    return tuple(sorted(f for f in resource_listdir(CourseService.RESOURCE, '') if f.endswith('.xml')))
+
+
+def service(file_names, cache_path=None):
+    """ Get a :class:`CourseService` for the given course files. The course cache is disabled by default. """
+    class Service(CourseService):
+        _course_file_names = file_names
+
+    Service.cache_path = cache_path
+    return Service
+
+
+def parse_courses(file_names, cache_path=None):
+    """ Parse the given course files into model objects. """
+    return list(service(file_names, cache_path)._parse_courses())
+
+
+def longest_lessons(file_names=LARGE_COURSES):
+    """ Get the longest lesson of each given course file as {file name: lesson}. """
+    return {course_file: max(course.lessons, key=lambda lesson: len(lesson.text or ''))
+            for course_file, course in zip(file_names, parse_courses(file_names))}
+
+
+class RecordedMachine(object):
+    """ Stands in for a :class:`TrainingMachine` whose key stroke log holds the given arrays. """
+
+    def __init__(self, codes, indices, times):
+        self.log = KeyStrokeLog(0)
+        self.log.codes, self.log.indices, self.log.times = codes, indices, times
+        self.hits = self.keystrokes = len(codes)
+
+    def elapsed_ns(self):
+        return self.log.times[-1] if self.log.times else 0
+
+
+def record(recorder, machine):
+    """ Record the key strokes of machine as a new finished session.
+
+    :return: A :class:`concurrent.futures.Future` of the write.
+    """
+    recorder.on_restart(machine)
+    recorder.on_unpause(machine)
+    return recorder.flush(machine, finished=True)
+
+
+def measure(fun, repeat=5, number=1):
+    """ Call fun number times per run and return the statistics of repeat runs.
+
+    :return: A dict with min, mean and max time per call in seconds.
+    """
+    times = list()
+    gc.collect()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fun()
+        times.append((time.perf_counter() - start) / number)
+    return {'min': min(times), 'mean': sum(times) / len(times), 'max': max(times), 'repeat': repeat, 'number': number}
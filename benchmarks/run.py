@@ -0,0 +1,77 @@
+#!/bin/env python3
+""" Run the benchmark suite and emit the results as JSON.
+
+All functions named bench_* in the modules bench_*.py next to this file are run.
+Every benchmark returns a dict of measurements. Times are given in seconds.
+A failing benchmark is reported with its error and the others still run.
+"""
+import argparse
+import fnmatch
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import traceback
+
+ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, ROOT_PATH)
+sys.path.insert(1, os.path.dirname(ROOT_PATH))
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_PATH, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _benchmarks(patterns):
+    for filename in sorted(os.listdir(ROOT_PATH)):
+        if not (filename.startswith('bench_') and filename.endswith('.py')):
+            continue
+        module = importlib.import_module(filename[:-3])
+        for name in sorted(dir(module)):
+            fun = getattr(module, name)
+            full_name = '{}.{}'.format(module.__name__, name)
+            if name.startswith('bench_') and callable(fun) and (not patterns or any(fnmatch.fnmatch(full_name, p) for p in patterns)):
+                yield full_name, fun
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output', '-o', type=str, help='Write results to file instead of stdout')
+    parser.add_argument('patterns', nargs='*', help='Only run benchmarks matching one of these glob patterns (module.function)')
+    args = parser.parse_args()
+
+    results = dict()
+    for name, fun in _benchmarks(args.patterns):
+        print('Running {}'.format(name), file=sys.stderr)
+        start = time.perf_counter()
+        try:
+            results[name] = fun()
+        except Exception as e:
+            traceback.print_exc()
+            results[name] = {'error': '{}: {}'.format(type(e).__name__, e)}
+        results[name]['wall'] = time.perf_counter() - start
+
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
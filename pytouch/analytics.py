@@ -0,0 +1,337 @@
+""" Per-character and per-bigram typing statistics across training sessions.
+
+Every key stroke is attributed to the character expected at its index and to the bigram formed with the
+preceding character of the text. For every key the numbers of hits, misses and undos are counted and the
+latencies of hits are collected in a :class:`Histogram`. Only clean transitions are timed, i.e. hits whose
+preceding key stroke was a hit at the preceding index, so corrections and pauses of thought after a typo
+don't distort the latencies.
+
+The aggregates are additive. :class:`Analytics` consumes sessions incrementally, from a :class:`TrainingMachine`
+or from the key strokes stored in the database, and can be pickled to a file to avoid reprocessing the history.
+The heavy lifting is vectorised with numpy if it is installed and falls back to plain Python otherwise.
+"""
+import logging
+import os
+import pickle
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+from pytouch.histogram import Histogram
+from pytouch.trainingmachine import KeyStrokeLog
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = [
+    'KeyStats',
+    'KeySummary',
+    'Analytics',
+]
+
+# Latencies are collected in microseconds, longer latencies are clamped to about a minute.
+LATENCY_BITS = 5
+LATENCY_MAX = 2 ** 26
+
+# Bigram keys are packed into one integer by the vectorised implementation.
+_CODE_SPACE = 0x110000
+
+KeySummary = namedtuple('KeySummary', ['key', 'attempts', 'error_rate', 'undo_rate', 'mean', 'p50', 'p90', 'p99'])
+KeySummary.__doc__ = """ Statistics of a character or bigram. Latencies are in milliseconds or None if never timed. """
+
+
+class KeyStats(object):
+    """ Aggregated key strokes of a character or bigram. """
+
+    __slots__ = ('hits', 'misses', 'undos', 'latency')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.undos = 0
+        self.latency = Histogram(LATENCY_BITS, LATENCY_MAX)
+
+    def __getstate__(self):
+        return self.hits, self.misses, self.undos, self.latency
+
+    def __setstate__(self, state):
+        self.hits, self.misses, self.undos, self.latency = state
+
+    @property
+    def attempts(self):
+        """ Number of typed characters without undos. """
+        return self.hits + self.misses
+
+    def summary(self, key):
+        """ Get the :class:`KeySummary` of this key. """
+        attempts = self.attempts
+        latency = self.latency
+
+        def ms(us):
+            return us / 1000 if us is not None else None
+
+        return KeySummary(key, attempts,
+                          self.misses / attempts if attempts else 0.0,
+                          self.undos / attempts if attempts else 0.0,
+                          ms(latency.mean), ms(latency.percentile(50)), ms(latency.percentile(90)), ms(latency.percentile(99)))
+
+
+class Analytics(object):
+    """ Incrementally updated key statistics of many training sessions. """
+
+    VERSION = 1
+
+    def __init__(self, profile_name=None):
+        """ Create empty statistics.
+
+        :param profile_name: Restrict :meth:`update` to the sessions of the given profile. None for all sessions.
+        """
+        self.profile_name = profile_name
+        self.strokes = 0
+        self._chars = dict()
+        self._bigrams = dict()
+        # Id of the last key stroke consumed from the database
+        self._last_stroke_id = 0
+        # Last consumed key stroke (index, code, time) of each unfinished database session
+        self._tails = dict()
+
+    @classmethod
+    def load(cls, path, profile_name=None):
+        """ Load statistics saved with :meth:`save`.
+
+        Empty statistics are returned if the file does not exist, can't be read or belongs to another version
+        or profile.
+        """
+        try:
+            with open(path, 'rb') as file:
+                data = pickle.load(file)
+        except FileNotFoundError:
+            return cls(profile_name)
+        except Exception as e:
+            logging.warning('Ignoring unreadable analytics cache {}: {}'.format(path, e))
+            return cls(profile_name)
+
+        if data.get('version') != cls.VERSION or data['analytics'].profile_name != profile_name:
+            logging.info('Ignoring analytics cache {} of version {}'.format(path, data.get('version')))
+            return cls(profile_name)
+        return data['analytics']
+
+    def save(self, path):
+        """ Write the statistics to the given file. """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as file:
+            pickle.dump({'version': Analytics.VERSION, 'analytics': self}, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def chars(self, min_attempts=1):
+        """ Get the statistics of all characters typed at least min_attempts times.
+
+        :return: A list of :class:`KeySummary` ordered by character.
+        """
+        return self._summaries(self._chars, min_attempts)
+
+    def bigrams(self, min_attempts=1):
+        """ Get the statistics of all bigrams typed at least min_attempts times.
+
+        :return: A list of :class:`KeySummary` ordered by bigram.
+        """
+        return self._summaries(self._bigrams, min_attempts)
+
+    def char(self, char):
+        """ Get the :class:`KeyStats` of a character or None if it was never typed. """
+        return self._chars.get(char)
+
+    def bigram(self, bigram):
+        """ Get the :class:`KeyStats` of a bigram or None if it was never typed. """
+        return self._bigrams.get(bigram)
+
+    @staticmethod
+    def _summaries(table, min_attempts):
+        return [stats.summary(key) for key, stats in sorted(table.items()) if stats.attempts >= min_attempts]
+
+    def add(self, text, codes, indices, times, start=0):
+        """ Add the key strokes of a session.
+
+        The key strokes are given in the format of a :class:`KeyStrokeLog`. Key strokes before start are not counted,
+        they only serve as context for the timing of the following ones.
+
+        :param text: The lesson text.
+        :param codes: The typed code points, :attr:`KeyStrokeLog.UNDO_CODE` for undos.
+        :param indices: The indices in the text the key strokes were expected at.
+        :param times: The elapsed session times of the key strokes in nanoseconds.
+        :param start: The number of the first key stroke to count.
+        :return: The number of counted key strokes.
+        """
+        count = len(codes) - start
+        if count <= 0:
+            return 0
+        # The machine trains the text with a final NL
+        if not text.endswith('\n'):
+            text += '\n'
+        if numpy is not None:
+            self._add_numpy(text, codes, indices, times, start)
+        else:
+            self._add_python(text, codes, indices, times, start)
+        self.strokes += count
+        return count
+
+    def add_machine(self, machine):
+        """ Add all key strokes recorded by a :class:`TrainingMachine`. """
+        log = machine.log
+        return self.add(machine.text, log.codes, log.indices, log.times)
+
+    def update(self, session):
+        """ Add all key strokes stored in the database since the last update.
+
+        Sessions of lessons that are not in the database (anymore) are skipped, their text is unknown.
+
+        :param session: A database session.
+        :return: The number of added key strokes.
+        """
+        from pytouch.model import Lesson
+        from pytouch.model.training import TrainingSession, KeyStroke
+
+        strokes = session.query(KeyStroke.session_uuid, KeyStroke.id, KeyStroke.index, KeyStroke.char, KeyStroke.time) \
+            .join(TrainingSession, KeyStroke.session_uuid == TrainingSession.uuid) \
+            .filter(KeyStroke.id > self._last_stroke_id)
+        if self.profile_name is not None:
+            strokes = strokes.filter(TrainingSession.profile_name == self.profile_name)
+
+        pending = strokes.with_entities(KeyStroke.session_uuid)
+        sessions = {uuid: (finished, text) for uuid, finished, text in
+                    session.query(TrainingSession.uuid, TrainingSession.finished, Lesson.text)
+                    .join(Lesson, TrainingSession.lesson_uuid == Lesson.uuid)
+                    .filter(TrainingSession.uuid.in_(pending))}
+
+        added = 0
+        encode = KeyStrokeLog.encode
+        last_id = self._last_stroke_id
+        for uuid, rows in groupby(strokes.order_by(KeyStroke.session_uuid, KeyStroke.id), key=itemgetter(0)):
+            rows = list(rows)
+            last_id = max(last_id, rows[-1][1])
+            if uuid not in sessions:
+                continue
+            finished, text = sessions[uuid]
+
+            tail = self._tails.pop(uuid, None)
+            indices = [row[2] for row in rows]
+            codes = [encode(row[3]) for row in rows]
+            times = [row[4] for row in rows]
+            if tail is not None:
+                indices.insert(0, tail[0])
+                codes.insert(0, tail[1])
+                times.insert(0, tail[2])
+
+            added += self.add(text, codes, indices, times, start=int(tail is not None))
+            if not finished:
+                self._tails[uuid] = (indices[-1], codes[-1], times[-1])
+
+        self._last_stroke_id = last_id
+        logging.debug('Added {} key strokes to analytics'.format(added))
+        return added
+
+    def _stats(self, table, key):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = KeyStats()
+        return stats
+
+    def _add_python(self, text, codes, indices, times, start):
+        chars = self._chars
+        bigrams = self._bigrams
+        undo_code = KeyStrokeLog.UNDO_CODE
+
+        # Preceding key stroke (index, hit, time)
+        previous = (None, False, None)
+        for n, (code, index, time) in enumerate(zip(codes, indices, times)):
+            expected = text[index]
+            hit = code == ord(expected)
+            if n >= start:
+                timed = hit and previous[1] and previous[0] == index - 1
+                keys = ((chars, expected), (bigrams, text[index - 1:index + 1])) if index > 0 else ((chars, expected),)
+                for table, key in keys:
+                    stats = self._stats(table, key)
+                    if hit:
+                        stats.hits += 1
+                        if timed:
+                            stats.latency.record((time - previous[2]) // 1000)
+                    elif code == undo_code:
+                        stats.undos += 1
+                    else:
+                        stats.misses += 1
+            previous = (index, hit, time)
+
+    def _add_numpy(self, text, codes, indices, times, start):
+        text_codes = numpy.frombuffer(text.encode('utf-32-le'), dtype='<u4').astype(numpy.int64)
+        codes = numpy.asarray(codes, dtype=numpy.int64)
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        times = numpy.asarray(times, dtype=numpy.int64)
+
+        expected = text_codes[indices]
+        hit = codes == expected
+        undo = codes == KeyStrokeLog.UNDO_CODE
+        miss = ~hit & ~undo
+        timed = numpy.zeros_like(hit)
+        timed[1:] = hit[1:] & hit[:-1] & (indices[:-1] == indices[1:] - 1)
+        latency = numpy.zeros_like(times)
+        latency[1:] = (times[1:] - times[:-1]) // 1000
+
+        expected, indices, hit, undo, miss, timed, latency = \
+            (a[start:] for a in (expected, indices, hit, undo, miss, timed, latency))
+
+        self._accumulate(self._chars, expected, hit, undo, miss, timed, latency, chr)
+
+        bigram = indices > 0
+        keys = text_codes[indices[bigram] - 1] * _CODE_SPACE + expected[bigram]
+        self._accumulate(self._bigrams, keys, hit[bigram], undo[bigram], miss[bigram], timed[bigram], latency[bigram],
+                         lambda key: chr(key // _CODE_SPACE) + chr(key % _CODE_SPACE))
+
+    def _accumulate(self, table, keys, hit, undo, miss, timed, latency, decode):
+        """ Add vectorised key stroke classifications to the statistics of their keys. """
+        if not len(keys):
+            return
+        unique, inverse = numpy.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        size = len(unique)
+        hits = numpy.bincount(inverse[hit], minlength=size)
+        undos = numpy.bincount(inverse[undo], minlength=size)
+        misses = numpy.bincount(inverse[miss], minlength=size)
+
+        # Bucket all timed latencies at once, one histogram row per key.
+        template = Histogram(LATENCY_BITS, LATENCY_MAX)
+        buckets = len(template.counts)
+        owners = inverse[timed]
+        values = numpy.maximum(latency[timed], 0)
+        rows = numpy.bincount(owners * buckets + _buckets(template, values), minlength=size * buckets).reshape(size, buckets)
+        timings = numpy.bincount(owners, minlength=size)
+        totals = numpy.bincount(owners, weights=values, minlength=size)
+        minima = numpy.full(size, LATENCY_MAX * 2 ** 16, dtype=numpy.int64)
+        maxima = numpy.full(size, -1, dtype=numpy.int64)
+        numpy.minimum.at(minima, owners, values)
+        numpy.maximum.at(maxima, owners, values)
+
+        for i, key in enumerate(unique.tolist()):
+            stats = self._stats(table, decode(key))
+            stats.hits += int(hits[i])
+            stats.undos += int(undos[i])
+            stats.misses += int(misses[i])
+            if timings[i]:
+                # The counts array shares its memory with the view
+                latency = stats.latency
+                numpy.frombuffer(latency.counts, dtype=numpy.int64)[:] += rows[i]
+                latency.record_summary(int(timings[i]), int(totals[i]), int(minima[i]), int(maxima[i]))
+
+
+def _buckets(histogram, values):
+    """ Vectorised :meth:`Histogram.bucket` for an array of non-negative values. """
+    values = numpy.minimum(values, histogram.max_value)
+    bits = histogram.significant_bits
+    sub = 1 << bits
+    half = sub >> 1
+    # frexp yields the bit length of integers that are exactly representable as float.
+    exponent = numpy.maximum(numpy.frexp(values.astype(numpy.float64))[1] - bits, 1)
+    large = sub + (exponent - 1) * half + (values >> exponent) - half
+    return numpy.where(values < sub, values, large)
@@ -0,0 +1,84 @@
+""" Character set signatures of lessons.
+
+The signature of a lesson is a bitmap of the keys its text uses, with one bit per character of the alphabet of
+the keyboard layout of its course. Whitespace is left out, space and return are part of every lesson.
+The alphabets are stored in the meta table and only ever grow, so the bit of a character never changes and
+signatures stay valid when new courses are imported.
+"""
+from pytouch.model.meta import Meta
+
+__all__ = [
+    'Alphabets',
+    'key_chars',
+    'encode',
+    'decode',
+]
+
+ALPHABET_KEY = 'alphabet:'
+
+
+def key_chars(text):
+    """ Get the set of characters of the text that are typed with their own key. """
+    return set(c for c in text or '' if not c.isspace())
+
+
+def encode(bitmap):
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+
+
+def decode(signature):
+    return int.from_bytes(signature, 'little')
+
+
+class Alphabets(object):
+    """ The append-only alphabets of all keyboard layouts in the database. """
+
+    def __init__(self, session):
+        """ Load all alphabets. New characters are added to the meta table of the given session. """
+        self._session = session
+        self._metas = {meta.key[len(ALPHABET_KEY):]: meta
+                       for meta in session.query(Meta).filter(Meta.key.startswith(ALPHABET_KEY))}
+        self._bits = {layout: {c: bit for bit, c in enumerate(meta.value or '')} for layout, meta in self._metas.items()}
+
+    def alphabet(self, layout):
+        """ Get the characters of the alphabet of a layout in bit order. """
+        meta = self._metas.get(layout or '')
+        return meta.value or '' if meta is not None else ''
+
+    def signature(self, layout, text):
+        """ Get the encoded signature of a text. Unknown characters are appended to the alphabet of the layout. """
+        layout = layout or ''
+        bits = self._bits.get(layout)
+        if bits is None:
+            bits = self._bits[layout] = dict()
+            self._metas[layout] = Meta(key=ALPHABET_KEY + layout, value='')
+            self._session.add(self._metas[layout])
+
+        bitmap = 0
+        added = list()
+        for c in sorted(key_chars(text)):
+            bit = bits.get(c)
+            if bit is None:
+                bit = bits[c] = len(bits)
+                added.append(c)
+            bitmap |= 1 << bit
+        if added:
+            meta = self._metas[layout]
+            meta.value = (meta.value or '') + ''.join(added)
+        return encode(bitmap)
+
+    def mask(self, layout, chars):
+        """ Get the bitmap of the given characters in the alphabet of a layout.
+
+        :return: The bitmap of all known characters and the set of characters that are not in the alphabet.
+        """
+        bits = self._bits.get(layout or '', {})
+        bitmap = 0
+        unknown = set()
+        for c in key_chars(chars):
+            bit = bits.get(c)
+            if bit is None:
+                unknown.add(c)
+            else:
+                bitmap |= 1 << bit
+        return bitmap, unknown
@@ -0,0 +1,181 @@
+""" Practice texts targeting the weakest characters and bigrams of a user.
+
+The words of a course are indexed once by the characters and bigrams they contain. The index is stored in the
+database next to the course, so generating a drill only loads the index and never scans the lesson texts.
+"""
+import logging
+import math
+import pickle
+import random
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+from pytouch.model import Lesson, LessonList, DrillIndex
+
+__all__ = [
+    'NgramIndex',
+    'weakest',
+]
+
+
+class NgramIndex(object):
+    """ The distinct words of a course with their frequency and, for every character and bigram, the words containing it. """
+
+    VERSION = 1
+
+    def __init__(self, words, counts, postings):
+        """ Create an index. Use :meth:`build` or :meth:`for_course` instead.
+
+        :param words: A sequence of distinct words.
+        :param counts: The number of occurrences of every word.
+        :param postings: A dict mapping every character and bigram to an array of the numbers of the words containing it.
+        """
+        self.words = words
+        self.counts = counts
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.words)
+
+    @classmethod
+    def build(cls, texts):
+        """ Index the words of the given texts. Words are separated by whitespace. """
+        counter = Counter()
+        for text in texts:
+            if text:
+                counter.update(text.split())
+
+        words = tuple(sorted(counter))
+        counts = array('i', (counter[word] for word in words))
+        postings = dict()
+        for number, word in enumerate(words):
+            ngrams = set(word)
+            ngrams.update(word[i:i + 2] for i in range(len(word) - 1))
+            for ngram in ngrams:
+                posting = postings.get(ngram)
+                if posting is None:
+                    posting = postings[ngram] = array('i')
+                posting.append(number)
+        return cls(words, counts, postings)
+
+    def dumps(self):
+        return pickle.dumps((self.words, self.counts, self.postings), pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def loads(cls, data):
+        return cls(*pickle.loads(data))
+
+    @classmethod
+    def for_course(cls, session, course_uuid):
+        """ Get the index of a course from the database. It is built and added to the session if it does not exist yet.
+
+        The index of a course is dropped when the course is synchronized, see :meth:`CourseService.sync_courses`.
+
+        :param session: The database session, the caller has to commit it to persist a new index.
+        :param course_uuid: The uuid of the :class:`Course`.
+        :raises ValueError: If the course does not exist or has no lessons.
+        """
+        row = session.query(DrillIndex).filter(DrillIndex.course_uuid == course_uuid).first()
+        if row is not None and row.version == cls.VERSION:
+            return cls.loads(row.data)
+
+        texts = session.query(Lesson.text).join(LessonList, LessonList.lesson_uuid == Lesson.uuid) \
+            .filter(LessonList.course_uuid == course_uuid).all()
+        if not texts:
+            raise ValueError('No lessons in course {}'.format(course_uuid))
+        index = cls.build(text for text, in texts)
+        logging.info('Built drill index of course {} with {} words'.format(course_uuid, len(index)))
+
+        if row is None:
+            session.add(DrillIndex(course_uuid=course_uuid, version=cls.VERSION, data=index.dumps()))
+        else:
+            row.version = cls.VERSION
+            row.data = index.dumps()
+        return index
+
+    def scores(self, weights):
+        """ Sum up the weights of the characters and bigrams contained in every word.
+
+        :param weights: A dict mapping characters and bigrams to their weight.
+        :return: A dict mapping word numbers to their score. Words without any weighted n-gram are left out.
+        """
+        scores = dict()
+        get = scores.get
+        for ngram, weight in weights.items():
+            for number in self.postings.get(ngram, ()):
+                scores[number] = get(number, 0) + weight
+        return scores
+
+    def drill(self, weights, length=600, line_length=60, rng=None, title='Drill'):
+        """ Create a practice text from words containing the weighted characters and bigrams.
+
+        Words are drawn with a probability proportional to their score per character, common words are preferred.
+        Without any word of a positive score all words are drawn by frequency.
+
+        :param weights: A dict mapping characters and bigrams to their weight, e.g. from :func:`weakest`.
+        :param length: The minimal length of the text.
+        :param line_length: The maximal length of a line unless a single word is longer.
+        :param rng: A :class:`random.Random` to draw the words with.
+        :param title: The title of the lesson.
+        :return: A transient :class:`Lesson`.
+        """
+        if not self.words:
+            raise ValueError('Unable to create a drill from an empty index')
+        rng = rng if rng is not None else random.Random()
+
+        # Words that can't be drawn would stall the check for repeated words
+        scores = {number: score for number, score in self.scores(weights).items() if score > 0}
+        if scores:
+            numbers = list(scores)
+            words = [self.words[n] for n in numbers]
+            ranks = [scores[n] / len(self.words[n]) * math.log2(1 + self.counts[n]) for n in numbers]
+        else:
+            words = self.words
+            ranks = self.counts
+
+        cum_ranks = list(accumulate(ranks))
+        lines = list()
+        line = list()
+        line_len = size = 0
+        previous = None
+        while size < length:
+            word = rng.choices(words, cum_weights=cum_ranks)[0]
+            if word == previous and len(words) > 1:
+                continue
+            previous = word
+            if line and line_len + 1 + len(word) > line_length:
+                lines.append(' '.join(line))
+                line = list()
+                line_len = 0
+            line_len += len(word) + bool(line)
+            size += len(word) + 1
+            line.append(word)
+        lines.append(' '.join(line))
+
+        focus = ''.join(sorted(set(''.join(weights))))
+        return Lesson(title=title, new_chars=focus, text='\n'.join(lines))
+
+
+def weakest(analytics, limit=8, min_attempts=5):
+    """ Find the weakest characters and bigrams of a user.
+
+    A key is weak if it is mistyped or undone often or typed slowly compared to the median latency of all keys.
+    Keys containing whitespace are left out, they can't be drilled with words.
+
+    :param analytics: The :class:`Analytics` of the user.
+    :param limit: The maximal number of keys returned.
+    :param min_attempts: Keys typed less often are ignored.
+    :return: A dict mapping the weakest characters and bigrams to their weight, at least 1.
+    """
+    summaries = [summary for summary in analytics.chars(min_attempts) + analytics.bigrams(min_attempts)
+                 if not any(c.isspace() for c in summary.key)]
+    latencies = sorted(summary.p50 for summary in summaries if summary.p50)
+    median = latencies[len(latencies) // 2] if latencies else None
+
+    def weight(summary):
+        slowness = summary.p50 / median if summary.p50 and median else 1.0
+        return (1 + 10 * (summary.error_rate + summary.undo_rate)) * max(slowness, 1.0)
+
+    ranked = sorted(((weight(summary), summary.key) for summary in summaries), reverse=True)
+    return {key: rank for rank, key in ranked[:limit]}
@@ -0,0 +1,63 @@
+import logging
+
+__all__ = [
+    'FontScaler',
+]
+
+logger = logging.getLogger(__name__)
+
+
+class FontScaler(object):
+    """ Finds the largest font size showing a line within a given width.
+
+    Measured widths are cached per (size, line). The width of a line grows about linearly with the font size, so
+    the size is solved in one step from the width per pixel of size of a single measurement and corrected by a
+    few measurements around the result only where hinting rounds the widths.
+
+    Use one instance per font family and style.
+    """
+
+    def __init__(self, measure, extra=0):
+        """ Create a scaler.
+
+        :param measure: A function measuring the width of a line at a font size, both in pixels.
+        :param extra: Pixels needed next to the line, e.g. for the cursor.
+        """
+        self.extra = extra
+        self._measure = measure
+        self._widths = dict()
+        self._ratios = dict()
+
+    @property
+    def measurements(self):
+        """ Number of widths measured so far. """
+        return len(self._widths)
+
+    def width(self, size, line):
+        """ Get the width of a line at a font size in pixels. """
+        key = (size, line)
+        width = self._widths.get(key)
+        if width is None:
+            width = self._widths[key] = self._measure(size, line)
+        return width
+
+    def fit(self, width, line, size):
+        """ Get the largest font size that shows the line within the width.
+
+        :param width: The available width in pixels.
+        :param line: The line to show.
+        :param size: The current font size in pixels. Its width is measured if the line was not measured before.
+        :return: The font size in pixels, at least 1.
+        """
+        ratio = self._ratios.get(line)
+        if ratio is None:
+            ratio = self._ratios[line] = self.width(size, line) / size
+        if not ratio:
+            return size
+
+        fit = max(int((width - self.extra) / ratio), 1)
+        while fit > 1 and self.width(fit, line) + self.extra > width:
+            fit -= 1
+        while self.width(fit + 1, line) + self.extra <= width:
+            fit += 1
+        return fit
@@ -0,0 +1,168 @@
+import json
+import logging
+import time
+from datetime import datetime
+
+from pytouch.histogram import Histogram
+from pytouch.trainingmachine import TrainingMachineObserver
+
+__all__ = [
+    'STAGES',
+    'KeyLatency',
+]
+
+logger = logging.getLogger(__name__)
+
+# queue: From the key event to its handler.
+# machine: From the handler to the first observer callback.
+# observers: From the first observer callback until the machine returns.
+# paint: From the machine returning until Tk redrew the widget.
+# total: From the key event until Tk redrew the widget.
+STAGES = ('queue', 'machine', 'observers', 'paint', 'total')
+
+# X server timestamps are milliseconds in 32 bits
+EVENT_TIME_WRAP = 2 ** 32
+
+
+class KeyLatency(TrainingMachineObserver):
+    """ Measures the latency of every key stroke split into :data:`STAGES`.
+
+    The origin of a key stroke is the time field of its Tk event. The event time is taken by the X server on
+    another clock, it is mapped to the local clock with the smallest difference seen between both clocks,
+    which is the difference for a key that was handled without any delay.
+
+    Add the instance as first observer of the machine and call :meth:`key_press` and :meth:`processed` around
+    :meth:`TrainingMachine.process_event` and :meth:`painted` once the widget was redrawn. Durations are recorded
+    in microseconds, recording is O(1) and does not allocate beyond the keys waiting for the redraw.
+    """
+
+    def __init__(self, clock=time.perf_counter_ns):
+        """ Create an instrumentation.
+
+        :param clock: A monotonic clock returning integer nanoseconds.
+        """
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self._clock = clock
+        # Smallest difference between the local clock and the event time in nanoseconds
+        self._offset = None
+        self._last_event_time = None
+        # [origin, handled, notified, drawn] of the key in process_event
+        self._key = None
+        # (origin, processed) of the keys waiting for the redraw
+        self._unpainted = list()
+
+    @property
+    def count(self):
+        """ Number of key strokes measured completely. """
+        return self.histograms['total'].count
+
+    def key_press(self, event_time=None):
+        """ Note the start of handling a key event.
+
+        :param event_time: The time field of the Tk event in milliseconds. The handler is the origin if None.
+        """
+        now = self._clock()
+        origin = now
+        if event_time:
+            if self._last_event_time is not None and event_time < self._last_event_time - EVENT_TIME_WRAP // 2:
+                # The server time wrapped around, the clocks have to be synchronized again
+                self._offset = None
+            self._last_event_time = event_time
+            offset = now - event_time * 1000000
+            if self._offset is None or offset < self._offset:
+                self._offset = offset
+            origin = event_time * 1000000 + self._offset
+        self._key = [origin, now, None, False]
+
+    def processed(self):
+        """ Note that the machine processed the key of the last :meth:`key_press`.
+
+        Keys that caused no hit, miss or undo change nothing on screen and are dropped, even if they unpaused
+        the machine.
+        """
+        key = self._key
+        self._key = None
+        if key is None or not key[3]:
+            return
+        now = self._clock()
+        origin, handled, notified, _ = key
+        histograms = self.histograms
+        histograms['queue'].record((handled - origin) // 1000)
+        histograms['machine'].record((notified - handled) // 1000)
+        histograms['observers'].record((now - notified) // 1000)
+        self._unpainted.append((origin, now))
+
+    def painted(self):
+        """ Note that the widget was redrawn, all processed keys are on screen now. """
+        if not self._unpainted:
+            return
+        now = self._clock()
+        paint = self.histograms['paint']
+        total = self.histograms['total']
+        for origin, processed in self._unpainted:
+            paint.record((now - processed) // 1000)
+            total.record((now - origin) // 1000)
+        self._unpainted = list()
+
+    def summary(self):
+        """ Get count, p50, p99 and max of every stage in milliseconds. """
+        rv = dict()
+        for stage in STAGES:
+            histogram = self.histograms[stage]
+            if histogram.count:
+                rv[stage] = {
+                    'count': histogram.count,
+                    'p50': histogram.percentile(50) / 1000,
+                    'p99': histogram.percentile(99) / 1000,
+                    'max': histogram.max / 1000,
+                }
+        return rv
+
+    def export(self, path, **fields):
+        """ Append the summary of all measured key strokes to a file as one JSON line and start over.
+
+        :param path: The file to append to.
+        :param fields: Additional fields of the line, e.g. the lesson.
+        """
+        if not self.count:
+            return
+        record = dict(fields, time=datetime.now().isoformat(), stages=self.summary())
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record, sort_keys=True) + '\n')
+        logger.info('Exported latency of {} key strokes to {}'.format(self.count, path))
+        self.clear()
+
+    def clear(self):
+        for histogram in self.histograms.values():
+            histogram.clear()
+        self._key = None
+        self._unpainted = list()
+
+    def _notified(self, drawn=True):
+        key = self._key
+        if key is not None:
+            if key[2] is None:
+                key[2] = self._clock()
+            key[3] = key[3] or drawn
+
+    def on_hit(self, sender, index, typed):
+        self._notified()
+
+    def on_miss(self, sender, index, typed, expected):
+        self._notified()
+
+    def on_undo(self, sender, index, expect):
+        self._notified()
+
+    def on_pause(self, sender):
+        pass
+
+    def on_unpause(self, sender):
+        # The observers of the unpause belong to the key, but the key is only drawn with a hit, miss or undo
+        self._notified(drawn=False)
+
+    def on_end(self, sender):
+        pass
+
+    def on_restart(self, sender):
+        pass
@@ -0,0 +1,167 @@
+import logging
+import time
+
+from pytouch.histogram import Histogram
+
+__all__ = [
+    'RENDER_MODES',
+    'MIN_WINDOW_LINES',
+    'RenderScheduler',
+]
+
+logger = logging.getLogger(__name__)
+
+# immediate: Apply every change right away.
+# idle: Apply all changes once the event queue is empty, i.e. once per batch of input events.
+# frame: Like idle but at most once per frame interval.
+RENDER_MODES = ('immediate', 'idle', 'frame')
+
+# Smallest window of lesson lines, it leaves a margin of one line around the cursor
+MIN_WINDOW_LINES = 4
+
+
+class RenderScheduler(object):
+    """ Collects the changes of the training text and the statistics and applies them at once.
+
+    Changed characters are kept per index, so a typo that is undone before the next frame costs nothing.
+    Runs of consecutive characters with the same tags are applied with a single replace.
+
+    The time from an input event to the screen update is measured in every mode: A second idle callback
+    queued after applying the changes runs after Tk has redrawn the widget.
+    """
+
+    def __init__(self, widget, apply_chars, apply_stats, mode='idle', frame_ms=16, clock=time.perf_counter_ns,
+                 on_paint=None):
+        """ Create a scheduler.
+
+        :param widget: The Tk widget used to schedule callbacks.
+        :param apply_chars: Called with a list of (index, chars, tags) runs and the new cursor index.
+        :param apply_stats: Called to update the statistics.
+        :param mode: One of :data:`RENDER_MODES`.
+        :param frame_ms: The frame interval in milliseconds of the frame mode.
+        :param clock: A monotonic clock returning integer nanoseconds.
+        :param on_paint: Called without arguments once the changes caused by input events are on screen.
+        """
+        if mode not in RENDER_MODES:
+            raise ValueError('Unknown render mode: {}'.format(mode))
+        self.mode = mode
+        self.frame_ms = frame_ms
+        self._widget = widget
+        self._apply_chars = apply_chars
+        self._apply_stats = apply_stats
+        self._clock = clock
+        self._on_paint_callback = on_paint
+
+        self._chars = dict()
+        self._cursor = None
+        self._stats = False
+        self._flush_id = None
+        self._paint_id = None
+
+        # Time of the last input event until it causes a change
+        self._input = None
+        # Times of the input events whose changes are not on screen yet
+        self._inputs = list()
+        # Input to paint latency in microseconds
+        self.latency = Histogram()
+        self.frames = 0
+
+    @property
+    def pending(self):
+        return self._flush_id is not None or bool(self._chars) or self._cursor is not None or self._stats
+
+    @property
+    def cursor(self):
+        """ The cursor index after the pending changes or None if the cursor is not moved by them. """
+        return self._cursor
+
+    def input(self):
+        """ Note the arrival of an input event. Call it before the event is processed.
+
+        The event is only measured if it changes something, events that are ignored draw nothing.
+        """
+        self._input = self._clock()
+
+    def char(self, index, char, tags, cursor):
+        """ Show char with the given tags at index and move the cursor. """
+        self._chars[index] = (char, tags)
+        self._cursor = cursor
+        self._take_input()
+        self._schedule()
+
+    def stats(self):
+        """ Mark the statistics as changed. """
+        self._stats = True
+        self._take_input()
+        self._schedule()
+
+    def _take_input(self):
+        if self._input is not None:
+            self._inputs.append(self._input)
+            self._input = None
+
+    def flush(self):
+        """ Apply all pending changes now. """
+        if self._flush_id is not None:
+            self._widget.after_cancel(self._flush_id)
+            self._flush_id = None
+
+        if self._chars or self._cursor is not None:
+            self._apply_chars(self.runs(self._chars), self._cursor)
+            self._chars = dict()
+            self._cursor = None
+        if self._stats:
+            self._stats = False
+            self._apply_stats()
+        self.frames += 1
+
+        if self._inputs and self._paint_id is None:
+            self._paint_id = self._widget.after_idle(self._on_paint)
+
+    def cancel(self):
+        """ Drop all pending changes. """
+        for callback_id in (self._flush_id, self._paint_id):
+            if callback_id is not None:
+                self._widget.after_cancel(callback_id)
+        self._flush_id = self._paint_id = None
+        self._chars = dict()
+        self._cursor = None
+        self._stats = False
+        self._input = None
+        self._inputs = list()
+
+    @staticmethod
+    def runs(chars):
+        """ Merge changed characters at consecutive indices with the same tags.
+
+        :param chars: A dict mapping indices to (char, tags).
+        :return: A list of (index, chars, tags) ordered by index.
+        """
+        runs = list()
+        for index in sorted(chars):
+            char, tags = chars[index]
+            if runs:
+                start, text, run_tags = runs[-1]
+                if start + len(text) == index and run_tags == tags:
+                    runs[-1] = (start, text + char, tags)
+                    continue
+            runs.append((index, char, tags))
+        return runs
+
+    def _schedule(self):
+        if self.mode == 'immediate':
+            self.flush()
+        elif self._flush_id is None:
+            if self.mode == 'idle':
+                self._flush_id = self._widget.after_idle(self.flush)
+            else:
+                self._flush_id = self._widget.after(self.frame_ms, self.flush)
+
+    def _on_paint(self):
+        self._paint_id = None
+        now = self._clock()
+        for start in self._inputs:
+            self.latency.record((now - start) // 1000)
+        self._inputs = list()
+        if self._on_paint_callback is not None:
+            self._on_paint_callback()
@@ -1,12 +1,14 @@
 import logging
-from datetime import timedelta
-from math import floor
 
 from tkinter import font
 from tkinter import *
 from tkinter import ttk
 
 from pytouch.trainingmachine import *
+from pytouch.recorder import SessionRecorder
+from pytouch.gui.tk.render import RenderScheduler, MIN_WINDOW_LINES
+from pytouch.gui.tk.fontscale import FontScaler
+from pytouch.gui.tk.latency import KeyLatency
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +23,8 @@ FILTERED_KEYS = ('Cancel', 'Tab', 'Shift_L', 'Control_L', 'Alt_L', 'Pause', 'Cap
                  'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9', 'F10', 'F11', 'F12', 'Num_Lock', 'Scroll_Lock')
 
 ZERO = '00:00.0'
+# Clock interval in milliseconds while the user does not type
+IDLE_CLOCK_MS = 1000
 
 
 class StatsElement(ttk.Frame):
@@ -35,6 +39,9 @@ class StatsElement(ttk.Frame):
 
         self._title_string = StringVar(value=title)
         self._title_label = ttk.Label(self, textvariable=self._title_string, font=self._title_font)
+        # The shown values are cached to spare a Tcl call when a value did not change
+        self._main = main
+        self._sub = sub
         self._main_string = StringVar(value=main)
         self._main_label = ttk.Label(self, textvariable=self._main_string, font=self._main_font)
         self._sub_string = StringVar(value=sub)
@@ -49,19 +56,23 @@ class StatsElement(ttk.Frame):
 
     @property
     def main(self):
-        return self._main_string.get()
+        return self._main
 
     @main.setter
     def main(self, value):
-        self._main_string.set(value)
+        if value != self._main:
+            self._main = value
+            self._main_string.set(value)
 
     @property
     def sub(self):
-        return self._sub_string.get()
+        return self._sub
 
     @sub.setter
     def sub(self, value):
-        self._sub_string.set(value)
+        if value != self._sub:
+            self._sub = value
+            self._sub_string.set(value)
 
     @property
     def text_width(self):
@@ -103,14 +114,57 @@ class PauseDialog(ttk.Frame):
 
 
 class TrainingWidget(TrainingMachineObserver, Text):
-    def __init__(self, master):
+    def __init__(self, master, render_mode='idle', clock_ms=100, idle_ms=5000, window_lines=None, resize_ms=50,
+                 latency_path=None):
+        """ Create the widget.
+
+        :param master: The master widget.
+        :param render_mode: When changes are drawn, one of :data:`RENDER_MODES`.
+        :param clock_ms: The update interval of the elapsed time while the user types.
+        :param idle_ms: The clock falls back to :data:`IDLE_CLOCK_MS` if the user does not type for this long.
+        :param window_lines: Number of lesson lines kept in the text widget around the cursor or None for all.
+            At least :data:`MIN_WINDOW_LINES`.
+        :param resize_ms: The font is scaled once the width did not change for this long.
+        :param latency_path: Measure the latency of every key stroke and append a summary to this file at the
+            end of every session. Nothing is measured if None.
+        """
+        if window_lines is not None and window_lines < MIN_WINDOW_LINES:
+            raise ValueError('Window of {} lines is smaller than {}'.format(window_lines, MIN_WINDOW_LINES))
         super(TrainingWidget, self).__init__(master)
 
         self.tm = None
+        self.recorder = None
         self._tick_id = None
+        self._tick_ms = None
+        self._clock_ms = clock_ms
+        self._idle_ms = idle_ms
+        # Elapsed time of the last stroke in nanoseconds
+        self._stroke_ns = 0
+        self._mapped = True
+        # Index of the next char to type, kept in sync by the machine callbacks
+        self._cursor = 0
+        # The lesson lines [first, last) shown in the text widget
+        self._window_lines = window_lines
+        self._first = 0
+        self._last = 0
+        # Per key stroke latency instrumentation or None
+        self._key_latency = KeyLatency() if latency_path is not None else None
+        self._latency_path = latency_path
+        self._latency_export = False
+        self._render = RenderScheduler(self, self._render_chars, self._render_stats, mode=render_mode,
+                                       on_paint=self._on_paint if self._key_latency is not None else None)
+
+        # Width of the text widget, the font is scaled to it after a resize
+        self._width = None
+        self._resize_ms = resize_ms
+        self._resize_id = None
 
         # text and scrollbar widget
         self._font = font.Font(family='mono', size=-40)
+        # Widths are measured with a font that is not shown, configuring it does not relayout the text.
+        # It seems to be impossible to determine the width of the cursor therefore the 25 pixels extra width.
+        self._measure_font = font.Font(family='mono', size=-40)
+        self._scaler = FontScaler(self._measure, extra=25)
 
         self._content_frame = Frame(self)
         self._text = Text(self._content_frame, wrap=NONE, exportselection=0, undo=False)
@@ -131,6 +185,8 @@ class TrainingWidget(TrainingMachineObserver, Text):
         self._text.bind('<KeyPress>', self.on_key_press)
         self._text.bind('<Any-Button>', self.on_button)
         self._text.bind('<Motion>', lambda e: 'break')
+        self._text.bind('<Map>', self.on_map)
+        self._text.bind('<Unmap>', self.on_unmap)
 
         # statistics widgets
         self._time_elem = StatsElement(self, 'Elapsed time', ZERO, ZERO)
@@ -164,52 +220,230 @@ class TrainingWidget(TrainingMachineObserver, Text):
 
     def load_lesson(self, lesson):
         self.tm = TrainingMachine.from_lesson(lesson, auto_unpause=True)
+        if self._key_latency is not None:
+            # First observer, it notes when the machine starts to notify
+            self._key_latency.clear()
+            self.tm.add_observer(self._key_latency)
         self.tm.add_observer(self)
 
-        self._text.insert(index='1.0', chars=lesson.text)
+        if self.recorder is not None:
+            self.recorder.close()
+        self.recorder = SessionRecorder(lesson=lesson)
+        self.tm.add_observer(self.recorder)
+
+        self._text.delete('1.0', END)
+        self._cursor = 0
+        if self._window_lines is None:
+            self._first, self._last = 0, lesson.line_count
+            self._text.insert(index='1.0', chars=lesson.text)
+            self._text.tag_add('base', '1.0', '{}.end'.format(lesson.line_count))
+            self._text.tag_add('untyped', '1.0', '{}.end'.format(lesson.line_count))
+        else:
+            self._first = self._last = 0
+            self._move_window(0)
 
         self._text.mark_set(INSERT, '1.0')
 
-        self._text.tag_add('base', '1.0', '{}.end'.format(lesson.line_count))
-        self._text.tag_add('untyped', '1.0', '{}.end'.format(lesson.line_count))
-
         # TODO: Use .tag_bind() to bind event to specific char. This is quite convenient. Qt should have a look at it :D
         # TODO: Use .see(index) to scroll to text out of scope. But how to center? .scan_mark(x, y)?
         # self.text_widget.tag_bind('untyped')  # Use it to bind event
 
         self._text.focus_set()
-        self._update_font_size(self._text.cget('width'))
+        if self._width is not None:
+            self._on_resize()
 
         return self.tm
 
+    def close(self):
+        """ Store the current session and wait until all training data is written.
+
+        Call it while the Tk interpreter still exists, pending callbacks are cancelled.
+        """
+        self._stop_clock()
+        if self._resize_id is not None:
+            self.after_cancel(self._resize_id)
+            self._resize_id = None
+        self._log_latency()
+        self._render.cancel()
+        if self.tm is None:
+            return
+        self._export_latency()
+        if self.recorder is not None:
+            if self.tm.running:
+                self.recorder.flush(self.tm)
+            self.recorder.close()
+            self.recorder = None
+
     @property
     def idx(self):
-        chars = self._text.count('1.0', INSERT, 'chars')
-        return chars[0] if chars else 0
+        return self._cursor
+
+    @property
+    def latency(self):
+        """ The :class:`Histogram` of the input to paint latency in microseconds since the end of the last session. """
+        return self._render.latency
+
+    def _line(self, index):
+        """ Get the lesson line of a machine index. """
+        lesson = self.tm.lesson
+        return lesson.position(index)[0] if index < lesson.length else lesson.line_count - 1
+
+    def _line_end(self, line):
+        """ Get the index behind the line feed of a lesson line or the length of the text for the last line. """
+        lesson = self.tm.lesson
+        return lesson.line_offsets[line + 1] if line + 1 < lesson.line_count else lesson.length
+
+    def _tk_index(self, index):
+        """ Get the Tk text index 'row.column' of a machine index from the line table of the lesson. """
+        lesson = self.tm.lesson
+        if index < lesson.length:
+            line, column = lesson.position(index)
+        else:
+            # Behind the lesson text, i.e. the line feed appended by the machine or the end of the text
+            line, column = lesson.line_count - 1, len(lesson.lines[-1]) + index - lesson.length
+        return '{}.{}'.format(line - self._first + 1, column)
 
-    def _replace_char(self, index, char, tags):
-        """ Replace a char at the given text index. """
-        self._text.replace('1.0+{}c'.format(index), '1.0+{}c'.format(index + 1), char, tags)
+    def _lines_state(self, first, last):
+        """ Get the current state of the lesson lines [first, last) as a flat list of chars and tags for Text.insert.
+
+        Lines behind the cursor are untyped, the state of all others is read from the key stroke log of the machine.
+        """
+        lesson = self.tm.lesson
+        start = lesson.line_offsets[first]
+        end = self._line_end(last - 1)
+        typed = min(max(self._cursor, start), end)
+
+        chars = dict()
+        if typed > start:
+            text = self.tm.text
+            last_code = self.tm.log.last_code
+            for index in range(start, typed):
+                code = last_code(index)
+                if code == ord(text[index]):
+                    chars[index] = (text[index], ('base', 'hit'))
+                elif code is None or code == KeyStrokeLog.UNDO_CODE:
+                    chars[index] = (text[index], ('base', 'untyped'))
+                else:
+                    chars[index] = (chr(code), ('base', 'miss'))
+
+        rv = list()
+        for index, run, tags in RenderScheduler.runs(chars):
+            rv += (run, tags)
+        if typed < end:
+            rv += (lesson.text[typed:end], ('base', 'untyped'))
+        return rv
+
+    def _move_window(self, cursor):
+        """ Page lesson lines in and out of the text widget to keep a margin of lines around the cursor.
+
+        The widget holds the lesson lines [first, last) including their line feeds.
+        """
+        lesson = self.tm.lesson
+        count = lesson.line_count
+        size = self._window_lines
+        margin = size // 4
+        line = self._line(cursor)
+        if self._last > self._first and (self._first + margin <= line or self._first == 0) \
+                and (line < self._last - margin or self._last == count):
+            return
+
+        first = min(max(line - margin, 0), max(count - size, 0))
+        last = min(first + size, count)
+        logger.debug('Moving window [{}, {}) -> [{}, {})'.format(self._first, self._last, first, last))
+
+        if first >= self._last or last <= self._first:
+            self._text.delete('1.0', END)
+            self._text.insert('1.0', *self._lines_state(first, last))
+        else:
+            # Rows are relative to the current first line, change the bottom first
+            if last < self._last:
+                self._text.delete('{}.0'.format(last - self._first + 1), 'end-1c')
+            elif last > self._last:
+                self._text.insert('end-1c', *self._lines_state(self._last, last))
+            if first > self._first:
+                self._text.delete('1.0', '{}.0'.format(first - self._first + 1))
+            elif first < self._first:
+                self._text.insert('1.0', *self._lines_state(first, self._first))
+        self._first, self._last = first, last
+
+    def _render_chars(self, runs, cursor):
+        """ Replace runs of chars at the given text indices and move the insert mark. """
+        if self._window_lines is not None:
+            # Lines paged in show the current state already, runs outside of the window are dropped.
+            self._move_window(cursor)
+            low = self.tm.lesson.line_offsets[self._first]
+            high = self._line_end(self._last - 1)
+            runs = [(max(index, low), chars[max(low - index, 0):high - index], tags)
+                    for index, chars, tags in runs if index < high and index + len(chars) > low]
+        for index, chars, tags in runs:
+            self._text.replace(self._tk_index(index), self._tk_index(index + len(chars)), chars, tags)
+        self._text.mark_set(INSERT, self._tk_index(cursor))
+        self._text.see(INSERT)
+
+    def _render_stats(self):
+        self._accuracy_elem.main = '{:.1%}'.format(self.tm.hits / self.tm.keystrokes) if self.tm.keystrokes else '0 %'
+        self._progressbar.configure(value=self.tm.progress * 100)
+
+        self._stroke_ns = self.tm.elapsed_ns()
+        if self._tick_ms is not None and self._tick_ms != self._clock_ms:
+            # Back from idle, show tenths of seconds again
+            self._stop_clock()
+            self._start_clock()
+
+    def _log_latency(self):
+        latency = self._render.latency
+        if latency.count:
+            logger.info('Input to paint latency ({} mode, {} strokes, {} frames): '
+                        'p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'
+                        .format(self._render.mode, latency.count, self._render.frames,
+                                latency.percentile(50) / 1000, latency.percentile(99) / 1000, latency.max / 1000))
+            latency.clear()
+
+    def _export_latency(self):
+        self._latency_export = False
+        if self._key_latency is not None:
+            self._key_latency.export(self._latency_path, lesson=self.tm.lesson.uuid, title=self.tm.lesson.title,
+                                     render_mode=self._render.mode)
+
+    def _on_paint(self):
+        self._key_latency.painted()
+        if self._latency_export:
+            self._export_latency()
+
+    def _measure(self, size, line):
+        self._measure_font.configure(size=-size)
+        return self._measure_font.measure(line)
 
     def _update_font_size(self, width):
-        # It seems to be impossible to determine the width of the cursor therefore the 25 pixels extra width.
-        scale_factor = width / (self._font.measure(self.tm.lesson.longest_line) + 25)
-        new_font_size = min(floor(self._font.cget('size') * scale_factor), -1)
+        # Tk font sizes are negative for pixels
+        size = -self._font.cget('size')
+        new_size = self._scaler.fit(width, self.tm.lesson.longest_line, size)
 
-        if self._font.cget('size') != new_font_size:
-            logger.debug('Updating font size: {} -> {}'.format(self._font.cget('size'), new_font_size))
+        if size != new_size:
+            logger.debug('Updating font size: {} -> {}'.format(-size, -new_size))
 
-            self._font.configure(size=new_font_size)
-            self._text.tag_config('base', spacing1=-new_font_size / 2)
+            self._font.configure(size=-new_size)
+            self._text.tag_config('base', spacing1=new_size / 2)
 
-    def on_configure(self, event):
-        if event.width != self.cget('width'):
-            logger.debug('update width {} -> {}'.format(self.cget('width'), event.width))
-            pad = event.width * 0.03
-            width = event.width - 2 * pad
+    def _on_resize(self):
+        if self._resize_id is not None:
+            self.after_cancel(self._resize_id)
+            self._resize_id = None
 
+        pad = self._width * 0.03
+        width = self._width - 2 * pad
+        if self.tm is not None:
             self._update_font_size(width)
-            self._text.configure(padx=pad, pady=pad)
+        self._text.configure(padx=pad, pady=pad)
+
+    def on_configure(self, event):
+        """ Scale the font once the width settled, resizing a window produces a stream of events. """
+        if event.width != self._width:
+            logger.debug('update width {} -> {}'.format(self._width, event.width))
+            self._width = event.width
+            if self._resize_id is not None:
+                self.after_cancel(self._resize_id)
+            self._resize_id = self.after(self._resize_ms, self._on_resize)
 
     def on_button(self, event):
         """ On any mouse button handler.
@@ -232,11 +466,15 @@ class TrainingWidget(TrainingMachineObserver, Text):
 
     def on_backspace_press(self, event):
         """ Produce an undo TrainingMachine event on BackSpace. """
+        self._render.input()
+        latency = self._key_latency
+        if latency is not None:
+            latency.key_press(event.time)
         if self.tm.paused:
             self.tm.process_event(Event.unpause_event())
         self.tm.process_event(Event.undo_event(self.idx))
-
-        self._text.see(INSERT)
+        if latency is not None:
+            latency.processed()
         return 'break'
 
     def on_key_press(self, event):
@@ -251,60 +489,88 @@ class TrainingWidget(TrainingMachineObserver, Text):
         # if tm.paused(self.tm):
         #     tm.process_event(self.tm, tm.Event.unpause_event())
         if event.char and event.keysym not in FILTERED_KEYS:
+            self._render.input()
+            latency = self._key_latency
+            if latency is not None:
+                latency.key_press(event.time)
             self.tm.process_event(Event.input_event(self.idx, event.char))
-
-        self._text.see(INSERT)
+            if latency is not None:
+                latency.processed()
         return 'break'
 
-    def _on_tick(self):
-        self._tick_id = self.after(100, self._on_tick)
+    def _start_clock(self):
+        """ Start the clock if the session is running and the widget is visible. """
+        if self._tick_id is None and self._mapped and self.tm is not None and self.tm.running:
+            self._on_tick()
 
-        elapsed_seconds = timedelta.total_seconds(self.tm.elapsed())
+    def _stop_clock(self):
+        if self._tick_id is not None:
+            self.after_cancel(self._tick_id)
+            self._tick_id = None
+            self._tick_ms = None
+
+    def _show_time(self, elapsed_ns):
+        elapsed_seconds = elapsed_ns / 1e9
         minutes, seconds = divmod(elapsed_seconds, 60)
         self._time_elem.main = '{minutes:02.0f}:{seconds:02.1f}'.format(minutes=minutes, seconds=seconds)
+        if elapsed_seconds:
+            self._strokes_elem.main = '{:.0f}'.format((self.tm.keystrokes / elapsed_seconds) * 60)
+
+    def _on_tick(self):
+        """ Show the elapsed time and wake up again when it shows the next value.
+
+        The clock runs at the configured rate while the user types and slows down to full seconds when idle.
+        """
+        elapsed_ns = self.tm.elapsed_ns()
+        self._show_time(elapsed_ns)
+
+        idle = elapsed_ns - self._stroke_ns > self._idle_ms * 1000000
+        self._tick_ms = IDLE_CLOCK_MS if idle else self._clock_ms
+        interval_ns = self._tick_ms * 1000000
+        self._tick_id = self.after((interval_ns - elapsed_ns % interval_ns) // 1000000 + 1, self._on_tick)
 
-        self._strokes_elem.main = '{:.0f}'.format((self.tm.keystrokes / elapsed_seconds) * 60)
+    def on_map(self, event):
+        self._mapped = True
+        self._start_clock()
+
+    def on_unmap(self, event):
+        """ Stop the clock while the widget is not visible, e.g. the window is iconified. """
+        self._mapped = False
+        self._stop_clock()
 
     def on_hit(self, sender, index, typed):
         """ TrainingMachine hit handler. """
         logger.debug('on_hit: insert {!r} at {}'.format(typed, index))
-        self._replace_char(index, typed, ('base', 'hit'))
-
-        self._accuracy_elem.main = '{:.1%}'.format(self.tm.hits / self.tm.keystrokes)
-        self._progressbar.configure(value=self.tm.progress * 100)
+        self._cursor = index + 1
+        self._render.char(index, typed, ('base', 'hit'), self._cursor)
+        self._render.stats()
 
     def on_miss(self, sender, index, typed, expected):
         """ TrainingMachine miss handler. """
         if typed != '<UNDO>':
-            if typed != '\n':  # Do not output wrong linefeeds
-                logger.debug('on_miss: typed {!r} expected {!r} at {}'.format(typed, expected, index))
-                self._replace_char(index, typed, ('base', 'miss'))
+            logger.debug('on_miss: typed {!r} expected {!r} at {}'.format(typed, expected, index))
+            self._cursor = index + 1
+            self._render.char(index, typed, ('base', 'miss'), self._cursor)
         else:
             # TODO: Consequences?
             logger.debug('on_miss: typed {!r} expected {!r} at {}'.format(typed, expected, index))
             print('UNDO MISS')
 
-        self._accuracy_elem.main = '{:.1%}'.format(self.tm.hits / self.tm.keystrokes)
-        self._progressbar.configure(value=self.tm.progress * 100)
+        self._render.stats()
 
     def on_undo(self, sender, index, expect):
         """ TrainingMachine undo handler. """
         logger.debug('on_undo: undo at {} expecting {!r}'.format(index, expect))
-        self._replace_char(index, expect, ('base', 'untyped'))
-        self._text.mark_set(INSERT, '1.0+{}c'.format(index))
-
-        self._accuracy_elem.main = '{:.1%}'.format(self.tm.hits / self.tm.keystrokes)
-        self._progressbar.configure(value=self.tm.progress * 100)
+        self._cursor = index
+        self._render.char(index, expect, ('base', 'untyped'), self._cursor)
+        self._render.stats()
 
     def on_pause(self, sender):
         """ TrainingMachine pause handler. """
         logger.debug('on_pause: ...')
 
-        if self._tick_id is None:
-            logger.warning('Timer not running')
-            return
-        self.after_cancel(self._tick_id)
-        self._tick_id = None
+        self._stop_clock()
+        self._show_time(self.tm.elapsed_ns())
 
         self.after(0, self._show_pause_dialog)
 
@@ -315,29 +581,33 @@ class TrainingWidget(TrainingMachineObserver, Text):
         if self._tick_id is not None:
             logger.warning('Timer already running')
             return
-        self._tick_id = self.after(100, self._on_tick)
+        self._stroke_ns = self.tm.elapsed_ns()
+        self._start_clock()
 
     def on_restart(self, sender):
         """ TrainingMachine restart handler. """
         logger.debug('on_restart: ...')
 
-        self.after_cancel(self._tick_id)
-        self._tick_id = None
+        self._stop_clock()
+        self._stroke_ns = 0
 
         self._time_elem.main = ZERO
         self._strokes_elem.main = '0'
-        self._accuracy_elem.main('0 %')
+        self._accuracy_elem.main = '0 %'
         self._progressbar.configure(value=0)
 
     def on_end(self, sender):
         """ TrainingMachine end handler. """
         logger.debug('on_end: End reached')
 
-        self.after_cancel(self._tick_id)
-        self._tick_id = None
+        self._stop_clock()
+        self._show_time(self.tm.elapsed_ns())
 
-        self._accuracy_elem.main = '{:.1%}'.format(self.tm.hits / self.tm.keystrokes)
-        self._progressbar.configure(value=self.tm.progress * 100)
+        self._render.stats()
+        self._render.flush()
+        self._log_latency()
+        # The last key stroke is not on screen yet, export once it is
+        self._latency_export = True
 
         # def show_pause_dialog(self):
         # TODO: Build your own ttk PauseDialog grid it into all columns and rows and lift it above all other widgets.
@@ -10,7 +10,13 @@ logger = logging.getLogger(__name__)
 
 
 class MainWindow(ttk.Frame):
-    def __init__(self, master=Tk()):
+    def __init__(self, master=None, render_mode='idle', window_lines=None, latency_path=None):
+        """ Create the main window.
+
+        :param master: The master widget, a new Tk root window is created if None.
+        """
+        if master is None:
+            master = Tk()
         super(MainWindow, self).__init__(master)
 
         # Pack self to expand to root
@@ -20,12 +26,14 @@ class MainWindow(ttk.Frame):
         top.rowconfigure(0, weight=1)
         top.columnconfigure(0, weight=1)
 
+        top.protocol('WM_DELETE_WINDOW', self.on_close)
         top.wm_title('PyTouch Typing Tutor')
         top.wm_iconname('PyTouch')
         # TODO: Add icon image
         # top.wm_iconphoto()
 
-        self.training_widget = TrainingWidget(self)
+        self.training_widget = TrainingWidget(self, render_mode=render_mode, window_lines=window_lines,
+                                              latency_path=latency_path)
         self.training_widget.grid(column=0, row=0, sticky=N + E + S + W)
 
         self.columnconfigure(0, weight=1)
@@ -42,3 +50,10 @@ class MainWindow(ttk.Frame):
         self.master.minsize(self.master.winfo_width(), self.master.winfo_height())
 
         self.master.mainloop()
+
+    def on_close(self):
+        """ Store the training data before the window and the Tk interpreter are destroyed. """
+        try:
+            self.training_widget.close()
+        finally:
+            self.winfo_toplevel().destroy()
@@ -0,0 +1,123 @@
+from array import array
+
+__all__ = [
+    'Histogram',
+]
+
+
+class Histogram(object):
+    """ Fixed-size histogram of non-negative integer values with log-linear buckets (HDR style).
+
+    Values below 2**significant_bits are counted exactly. Larger values share a bucket with
+    values of the same magnitude, the relative error of a bucket is below 2**(1 - significant_bits).
+    Values above max_value are counted in the last bucket, min, max and the sum stay exact.
+
+    Recording a value is O(1) and does not allocate, which makes it suitable for hot paths.
+    """
+
+    def __init__(self, significant_bits=6, max_value=2 ** 32):
+        """ Create an empty histogram.
+
+        :param significant_bits: Number of significant bits of a value that are kept.
+        :param max_value: The largest value that is bucketed properly.
+        """
+        self.significant_bits = significant_bits
+        self.max_value = max_value
+        self._sub = 1 << significant_bits
+        self._half = self._sub >> 1
+        self.counts = array('q', [0]) * (self.bucket(max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def bucket(self, value):
+        """ Get the index of the bucket the given value is counted in. """
+        if value < self._sub:
+            return value
+        exponent = value.bit_length() - self.significant_bits
+        return self._sub + (exponent - 1) * self._half + (value >> exponent) - self._half
+
+    def bucket_range(self, bucket):
+        """ Get the lowest and highest value counted in the given bucket. """
+        if bucket < self._sub:
+            return bucket, bucket
+        exponent, mantissa = divmod(bucket - self._sub, self._half)
+        exponent += 1
+        mantissa += self._half
+        return mantissa << exponent, ((mantissa + 1) << exponent) - 1
+
+    def record(self, value, count=1):
+        """ Count a value. Negative values are counted as 0. """
+        if value < 0:
+            value = 0
+        bucket = self.bucket(value) if value <= self.max_value else len(self.counts) - 1
+        self.counts[bucket] += count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def record_buckets(self, counts, total, minimum, maximum):
+        """ Add values that were bucketed elsewhere.
+
+        :param counts: An iterable of (bucket, count) pairs.
+        :param total: The sum of the values.
+        :param minimum: The smallest value.
+        :param maximum: The largest value.
+        """
+        added = 0
+        for bucket, count in counts:
+            self.counts[bucket] += count
+            added += count
+        self.record_summary(added, total, minimum, maximum)
+
+    def record_summary(self, count, total, minimum, maximum):
+        """ Account for count values that were added to :attr:`counts` directly, e.g. by a vectorised caller. """
+        if not count:
+            return
+        self.count += count
+        self.total += total
+        self.min = minimum if self.min is None else min(self.min, minimum)
+        self.max = maximum if self.max is None else max(self.max, maximum)
+
+    def merge(self, other):
+        """ Add all values of another histogram with the same layout. """
+        if len(other.counts) != len(self.counts) or other.significant_bits != self.significant_bits:
+            raise ValueError('Histogram layouts differ')
+        self.record_buckets(((bucket, count) for bucket, count in enumerate(other.counts) if count),
+                            other.total, other.min, other.max)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """ Get the value below or equal to which the given percentage of all values lie.
+
+        The result is the highest value of the bucket the percentile falls into, but never more than max.
+        Percentiles in the bucket of clamped values yield max.
+
+        :param percent: The percentile between 0 and 100.
+        :return: The value or None for an empty histogram.
+        """
+        if not self.count:
+            return None
+        rank = max(int(self.count * percent / 100 + 0.5), 1)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if bucket == len(self.counts) - 1:
+                    return self.max
+                return min(self.bucket_range(bucket)[1], self.max)
+        return self.max
+
+    def clear(self):
+        self.counts = array('q', [0]) * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
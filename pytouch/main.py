@@ -1,28 +1,116 @@
 import logging
 import argparse
 
-from pytouch.model import get_engine, Session, reset_db
-from pytouch.gui.tk import window
+# Subcommands import what they need, so that e.g. --help starts without loading SQLAlchemy, lxml or Tk.
+from pytouch.settings import SQLITE_PROFILES, SQLITE_PRAGMAS
+from pytouch.gui.tk.render import RENDER_MODES, MIN_WINDOW_LINES
 
 
 def init_db(args):
+    from pytouch.model import get_engine, Session
+
     db_uri = getattr(args, 'database')
     logging.debug('Database URI: {}'.format(db_uri))
-    engine = get_engine({'sqlalchemy.url': db_uri})
+    settings = {'sqlalchemy.url': db_uri, 'sqlite.profile': args.database_profile}
+    for option in args.database_option:
+        key, _, value = option.partition('=')
+        prefix = 'sqlite.' if key in SQLITE_PRAGMAS else 'sqlalchemy.'
+        settings[prefix + key] = value
+    engine = get_engine(settings)
     Session.configure(bind=engine)
 
 
+def window_lines(value):
+    lines = int(value)
+    if lines < MIN_WINDOW_LINES:
+        raise argparse.ArgumentTypeError('must be at least {}'.format(MIN_WINDOW_LINES))
+    return lines
+
+
+def configure_courses(args):
+    from pytouch.service import CourseService
+
+    if args.no_course_cache:
+        CourseService.cache_path = None
+    elif args.course_cache is not None:
+        CourseService.cache_path = args.course_cache
+    CourseService.jobs = args.jobs
+
+
 def reset_database(args):
+    from pytouch.model import reset_db
     from pytouch.service import CourseService
 
+    configure_courses(args)
     init_db(args)
     reset_db()
     CourseService.init_courses()
 
 
+def sync_courses(args):
+    from pytouch.model import create_db
+    from pytouch.service import CourseService
+
+    configure_courses(args)
+    init_db(args)
+    create_db()
+    result = CourseService.sync_courses()
+    print('courses changed: {}'.format(result.courses))
+    print('lessons inserted: {}, updated: {}, deleted: {}'.format(result.inserted, result.updated, result.deleted))
+
+
+def search_lessons(args):
+    from pytouch.service import CourseService
+
+    init_db(args)
+    if not args.words and not args.chars:
+        raise SystemExit('Nothing to search for, give words or --chars')
+    try:
+        matches = CourseService.search_lessons(args.words, args.chars, args.limit)
+    except RuntimeError as e:
+        raise SystemExit('Unable to search lessons: {}'.format(e))
+    for match in matches:
+        print('{}  {} / {}'.format(match.uuid, match.course or '-', match.title))
+        if match.snippet:
+            print('    {}'.format(' '.join(match.snippet.split())))
+
+
+def replay_session(args):
+    from pytouch import replay
+
+    if args.lesson is not None:
+        from pytouch.service import CourseService
+
+        init_db(args)
+        lesson = CourseService.find_lesson(args.lesson)
+        if lesson is None:
+            raise SystemExit('Lesson not found: {}'.format(args.lesson))
+        text = lesson.text
+    else:
+        with open(args.text, encoding='utf-8') as file:
+            text = file.read()
+
+    with open(args.recording, encoding='utf-8') as file:
+        strokes = replay.load(file)
+
+    result = replay.replay(text, strokes, undo_typo=args.undo_typo)
+
+    print('hits: {}'.format(result.hits))
+    print('keystrokes: {}'.format(result.keystrokes))
+    print('accuracy: {:.1%}'.format(result.accuracy))
+    print('elapsed: {}'.format(result.elapsed))
+    print('events/s: {:.0f}'.format(result.events_per_second))
+
+
 def run(args=None):
+    from pytouch.model import create_db
+    from pytouch.gui.tk import window
+
     init_db(args)
-    window.MainWindow().show()
+    # Training sessions are recorded to tables a database of an older version may lack
+    create_db()
+    window.MainWindow(render_mode=args.render_mode, window_lines=args.window_lines,
+                      latency_path=args.latency_log).show()
 
 
 def manage():
@@ -35,11 +123,46 @@ def manage():
 
     # FIXME: Database path incorrect! Depends on installation path!
     parser.add_argument('--database', type=str, default='sqlite:///tests.sqlite', help='Change the default database')
+    parser.add_argument('--database-profile', type=str, default='default', choices=sorted(SQLITE_PROFILES),
+                        help='SQLite performance profile')
+    parser.add_argument('--database-option', type=str, action='append', default=[], metavar='KEY=VALUE',
+                        help='SQLite pragma ({}) or engine option like pool_size. Can be given multiple times'.format(', '.join(SQLITE_PRAGMAS)))
+    parser.add_argument('--render-mode', type=str, default='idle', choices=RENDER_MODES,
+                        help='Draw every keystroke immediately, once the input queue is empty or once per frame')
+    parser.add_argument('--window-lines', type=window_lines, metavar='LINES',
+                        help='Keep only this many lesson lines around the cursor in the text widget, '
+                             'at least {}'.format(MIN_WINDOW_LINES))
+    parser.add_argument('--latency-log', type=str, metavar='PATH',
+                        help='Measure the latency of every key stroke and append p50/p99/max per session to this file')
     parser.set_defaults(fun=run)
 
-    parser_setup = subparsers.add_parser('reset-database')
+    # Options of all commands that load the course files
+    course_parser = argparse.ArgumentParser(add_help=False)
+    course_parser.add_argument('--course-cache', type=str, help='Path of the precompiled course cache')
+    course_parser.add_argument('--no-course-cache', action='store_true', help='Always parse and validate all course files')
+    course_parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of processes parsing course files, 0 for one per CPU')
+
+    parser_setup = subparsers.add_parser('reset-database', parents=[course_parser])
     parser_setup.set_defaults(fun=reset_database)
 
+    parser_sync = subparsers.add_parser('sync-courses', parents=[course_parser],
+                                        help='Update the builtin courses without touching other data')
+    parser_sync.set_defaults(fun=sync_courses)
+
+    parser_search = subparsers.add_parser('search', help='Find lessons by words or characters')
+    parser_search.add_argument('words', type=str, nargs='*', help='Words that must occur, a trailing * matches prefixes')
+    parser_search.add_argument('--chars', '-c', type=str, default='', help='Characters that must occur in the text')
+    parser_search.add_argument('--limit', '-n', type=int, default=20, help='Maximal number of results')
+    parser_search.set_defaults(fun=search_lessons)
+
+    parser_replay = subparsers.add_parser('replay', help='Replay a recorded typing session without GUI')
+    parser_replay.add_argument('recording', type=str, help='File with one JSON encoded [time, char] pair per line')
+    lesson_group = parser_replay.add_mutually_exclusive_group(required=True)
+    lesson_group.add_argument('--lesson', type=str, help='UUID of the lesson in the database')
+    lesson_group.add_argument('--text', type=str, help='File containing the lesson text')
+    parser_replay.add_argument('--undo-typo', action='store_true', help='Count undos as typos')
+    parser_replay.set_defaults(fun=replay_session)
+
     args = parser.parse_args()
 
     lut_verbosity = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}
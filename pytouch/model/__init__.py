@@ -1,18 +1,24 @@
 import logging
+import re
 from contextlib import contextmanager
+from functools import partial
 
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import configure_mappers
 from sqlalchemy.engine import Engine
 from sqlalchemy import engine_from_config
-from sqlalchemy import event
+from sqlalchemy import event, inspect, text
 
 # import or define all models here to ensure they are attached to the
 # Base.metadata prior to any initialization routines
 from pytouch.model.course import Course, LessonList, Lesson
 from pytouch.model.profile import Profile
 from pytouch.model.meta import Meta
+from pytouch.model.training import TrainingSession, KeyStroke
+from pytouch.model.drill import DrillIndex
+from pytouch.model.search import create_search_index
 from pytouch.model.super import Base
+from pytouch.settings import SQLITE_PROFILES, SQLITE_PRAGMAS
 
 
 @event.listens_for(Engine, "connect")
@@ -27,10 +33,62 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
 configure_mappers()
 
 
+SQLITE_PREFIX = 'sqlite.'
+
+
+def sqlite_pragmas(settings):
+    """ Get the pragmas configured by the given settings.
+
+    The profile named by 'sqlite.profile' is applied first, single pragmas can be overridden by
+    'sqlite.<pragma>' entries.
+
+    :return: A list of (pragma, value) tuples in the order they have to be applied.
+    """
+    profile = settings.get(SQLITE_PREFIX + 'profile', 'default')
+    try:
+        pragmas = dict(SQLITE_PROFILES[profile])
+    except KeyError:
+        raise ValueError('Unknown SQLite profile: {}'.format(profile))
+
+    for key, value in settings.items():
+        if key.startswith(SQLITE_PREFIX) and key != SQLITE_PREFIX + 'profile':
+            pragma = key[len(SQLITE_PREFIX):]
+            if pragma not in SQLITE_PRAGMAS:
+                raise ValueError('Unsupported SQLite pragma: {}'.format(pragma))
+            pragmas[pragma] = str(value)
+
+    for pragma, value in pragmas.items():
+        if not re.match(r'^-?\w+$', value):
+            raise ValueError('Invalid value for SQLite pragma {}: {!r}'.format(pragma, value))
+
+    return [(pragma, pragmas[pragma]) for pragma in SQLITE_PRAGMAS if pragma in pragmas]
+
+
+def _set_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in pragmas:
+        cursor.execute('PRAGMA {}={}'.format(pragma, value))
+    cursor.close()
+
+
 def get_engine(settings=None, prefix='sqlalchemy.'):
+    """ Create an engine from the given settings.
+
+    Entries starting with the prefix are passed to :func:`sqlalchemy.engine_from_config`, e.g. pool options
+    like 'sqlalchemy.pool_size'. SQLite databases are additionally configured by the 'sqlite.' entries,
+    see :func:`sqlite_pragmas`.
+    """
     if settings is None:
         settings = {'sqlalchemy.url': 'sqlite:///:memory:'}
-    return engine_from_config(settings, prefix)
+    engine = engine_from_config(settings, prefix)
+
+    if engine.dialect.name == 'sqlite':
+        pragmas = sqlite_pragmas(settings)
+        if pragmas:
+            logging.debug('SQLite pragmas: {}'.format(pragmas))
+            event.listen(engine, 'connect', partial(_set_sqlite_pragmas, pragmas))
+
+    return engine
 
 
 Session = sessionmaker()
@@ -59,3 +117,26 @@ def reset_db(engine=None):
     logging.warning('Resetting database')
     Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
+
+
+def create_db(engine=None):
+    """ Create all missing tables. Existing tables and their content are left alone. """
+    if engine is None:
+        engine = Session().get_bind()
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        _add_missing_columns(connection)
+        # Databases created before the search index existed get it with their current lessons
+        create_search_index(connection)
+
+
+def _add_missing_columns(connection):
+    """ Add nullable columns that were introduced after the tables of the database were created. """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = set(column['name'] for column in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name not in existing and column.nullable and not column.primary_key:
+                logging.info('Adding column {}.{}'.format(table.name, column.name))
+                connection.execute(text('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table.name, column.name, column.type.compile(dialect=connection.dialect))))
@@ -1,10 +1,11 @@
 import uuid
-from operator import add
+from array import array
+from bisect import bisect_right
 
 from sqlalchemy.ext.orderinglist import ordering_list
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import relationship, backref
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy.orm import relationship, backref, deferred, selectinload
+from sqlalchemy import Column, Integer, String, Boolean, LargeBinary, ForeignKey, Index
 
 from pytouch.model.super import Base
 from pytouch.utils import cached_property
@@ -16,8 +17,11 @@ class Lesson(Base):
     uuid = Column('pkLessonUuid', String, primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column('cLessonTitle', String, nullable=False)
     new_chars = Column('cNewChars', String)
+    # Bitmap of the keys the text uses over the alphabet of the keyboard layout, see pytouch.charset
+    charset = Column('cCharset', LargeBinary)
     builtin = Column('cLessonBuiltin', Boolean, default=False)
-    text = Column('cText', String)
+    # Lesson bodies can be large, load them on first access only
+    text = deferred(Column('cText', String))
     course = relationship('LessonList', backref=backref('lesson'), cascade="all, delete-orphan")
 
     def __repr__(self):
@@ -28,20 +32,51 @@ class Lesson(Base):
         return self.text.split('\n')
 
     @cached_property
-    def index_list(self):
-        line = 0
-        column = 0
-        rv = list()
-        for c in list(self.text):
-            rv.append((line, column))
-            column += 1
-            if c == '\n':
-                line += 1
-                column = 0
+    def length(self):
+        return len(self.text)
+
+    @cached_property
+    def line_offsets(self):
+        """ Index of the first character of every line. """
+        rv = array('l', [0])
+        find = self.text.find
+        i = find('\n')
+        while i != -1:
+            rv.append(i + 1)
+            i = find('\n', i + 1)
         return rv
 
     def position(self, index, offset=(0, 0)):
-        return tuple(map(add, list(offset), list(self.index_list[index])))
+        """ Get the (line, column) of the character at the given index. A line feed belongs to the line it ends.
+
+        :param index: The index in the text. Negative values count from the end.
+        :param offset: Added to the result, e.g. (1, 0) for Tk text indices.
+        :raises IndexError: If the index is out of range.
+        """
+        length = self.length
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('lesson index out of range')
+        offsets = self.line_offsets
+        line = bisect_right(offsets, index) - 1
+        return offset[0] + line, offset[1] + index - offsets[line]
+
+    def index(self, line, column, offset=(0, 0)):
+        """ Get the index of the character at the given position. This is the reverse of :meth:`position`.
+
+        :raises IndexError: If the position is out of range.
+        """
+        line -= offset[0]
+        column -= offset[1]
+        offsets = self.line_offsets
+        if not 0 <= line < len(offsets):
+            raise IndexError('lesson line out of range')
+        end = offsets[line + 1] if line + 1 < len(offsets) else self.length
+        index = offsets[line] + column
+        if not 0 <= column or not index < end:
+            raise IndexError('lesson column out of range')
+        return index
 
     @cached_property
     def line_count(self):
@@ -49,7 +84,7 @@ class Lesson(Base):
 
     @cached_property
     def longest_line(self):
-        return max(self.lines)
+        return max(self.lines, key=len)
 
     @cached_property
     def longest_line_len(self):
@@ -61,9 +96,13 @@ class LessonList(Base):
 
     id = Column('pkLessonListId', Integer, primary_key=True, autoincrement=True)
     course_uuid = Column('fkCourseUuid', String, ForeignKey('tblCourse.pkCourseUuid', onupdate='CASCADE', ondelete='CASCADE'))
-    lesson_uuid = Column('fkLessonUuid', String, ForeignKey('tblLesson.pkLessonUuid', onupdate='CASCADE', ondelete='CASCADE'))
+    lesson_uuid = Column('fkLessonUuid', String, ForeignKey('tblLesson.pkLessonUuid', onupdate='CASCADE', ondelete='CASCADE'), index=True)
     position = Column('position', Integer)
 
+    __table_args__ = (
+        Index('ix_tblLessonList_fkCourseUuid_position', 'fkCourseUuid', 'position'),
+    )
+
     def __init__(self, lesson=None, **kw):
         if lesson is not None:
             kw['lesson'] = lesson
@@ -85,5 +124,20 @@ class Course(Base):
         return '{self.uuid} -- builtin: {self.builtin!s:>5} -- lesson count: {lessons:2} -- {self.title}'.format(self=self, lessons=len(self.lessons))
 
     @staticmethod
-    def find_all(session):
-        return session.query(Course)
+    def find_all(session, with_text=False):
+        """ Query all courses with their lessons loaded eagerly.
+
+        Iterating all courses and their lessons takes a constant number of queries.
+
+        :param session: The session to query.
+        :param with_text: True to load the lesson texts as well.
+        """
+        lessons = selectinload(Course._lessons).selectinload(LessonList.lesson)
+        if with_text:
+            lessons = lessons.undefer(Lesson.text)
+        return session.query(Course).options(lessons)
+
+    @staticmethod
+    def find(session, uuid, with_text=False):
+        """ Query a single course with its lessons loaded eagerly. """
+        return Course.find_all(session, with_text).filter(Course.uuid == uuid).first()
@@ -0,0 +1,14 @@
+from sqlalchemy.orm import relationship, backref
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey
+
+from pytouch.model.super import Base
+
+
+class DrillIndex(Base):
+    """ Serialized n-gram index over the lesson texts of a course, see :class:`pytouch.drill.NgramIndex`. """
+    __tablename__ = 'tblDrillIndex'
+
+    course_uuid = Column('pkCourseUuid', String, ForeignKey('tblCourse.pkCourseUuid', onupdate='CASCADE', ondelete='CASCADE'), primary_key=True)
+    version = Column('cVersion', Integer, nullable=False)
+    data = Column('cData', LargeBinary, nullable=False)
+    course = relationship('Course', backref=backref('drill_index', uselist=False, cascade='all, delete-orphan', passive_deletes=True))
@@ -0,0 +1,109 @@
+""" SQLite FTS5 full-text index over the lessons.
+
+The index is a virtual table next to tblLesson that is kept up to date by triggers, so every way of writing
+lessons, including bulk statements and cascading deletes, keeps it in sync. The virtual table is addressed by
+rowid, the map table relates these rowids to the lesson uuids.
+"""
+import logging
+import sqlite3
+from functools import lru_cache
+
+from sqlalchemy import event, text
+
+from pytouch.model.course import Lesson
+
+__all__ = [
+    'SEARCH_TABLE',
+    'fts5_available',
+    'has_search_index',
+    'create_search_index',
+    'drop_search_index',
+]
+
+SEARCH_TABLE = 'tblLessonSearch'
+
+# Diacritics are kept, 'a' and 'ä' are different keys for a typist.
+_CREATE = (
+    "CREATE VIRTUAL TABLE tblLessonSearch USING fts5(title, new_chars, text, tokenize = 'unicode61 remove_diacritics 0')",
+    "CREATE TABLE tblLessonSearchMap (pkLessonUuid VARCHAR PRIMARY KEY, cSearchId INTEGER NOT NULL)",
+    "CREATE TRIGGER trLessonSearchInsert AFTER INSERT ON tblLesson BEGIN "
+    "INSERT INTO tblLessonSearch (title, new_chars, text) VALUES (new.cLessonTitle, new.cNewChars, new.cText); "
+    "INSERT INTO tblLessonSearchMap (pkLessonUuid, cSearchId) VALUES (new.pkLessonUuid, last_insert_rowid()); "
+    "END",
+    "CREATE TRIGGER trLessonSearchDelete AFTER DELETE ON tblLesson BEGIN "
+    "DELETE FROM tblLessonSearch WHERE rowid = (SELECT cSearchId FROM tblLessonSearchMap WHERE pkLessonUuid = old.pkLessonUuid); "
+    "DELETE FROM tblLessonSearchMap WHERE pkLessonUuid = old.pkLessonUuid; "
+    "END",
+    "CREATE TRIGGER trLessonSearchUpdate AFTER UPDATE OF pkLessonUuid, cLessonTitle, cNewChars, cText ON tblLesson BEGIN "
+    "DELETE FROM tblLessonSearch WHERE rowid = (SELECT cSearchId FROM tblLessonSearchMap WHERE pkLessonUuid = old.pkLessonUuid); "
+    "DELETE FROM tblLessonSearchMap WHERE pkLessonUuid = old.pkLessonUuid; "
+    "INSERT INTO tblLessonSearch (title, new_chars, text) VALUES (new.cLessonTitle, new.cNewChars, new.cText); "
+    "INSERT INTO tblLessonSearchMap (pkLessonUuid, cSearchId) VALUES (new.pkLessonUuid, last_insert_rowid()); "
+    "END",
+)
+
+_DROP = (
+    "DROP TRIGGER IF EXISTS trLessonSearchInsert",
+    "DROP TRIGGER IF EXISTS trLessonSearchDelete",
+    "DROP TRIGGER IF EXISTS trLessonSearchUpdate",
+    "DROP TABLE IF EXISTS tblLessonSearchMap",
+    "DROP TABLE IF EXISTS tblLessonSearch",
+)
+
+
+@lru_cache(maxsize=None)
+def fts5_available():
+    """ Check if the SQLite library was built with FTS5. """
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.execute('CREATE VIRTUAL TABLE probe USING fts5(content)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+def has_search_index(connection):
+    """ Check if the database of the given connection contains the search index. """
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {'name': SEARCH_TABLE}).first() is not None
+
+
+def create_search_index(connection):
+    """ Create the search index and fill it with all existing lessons. Nothing is done if it exists already.
+
+    :return: True if the index was created.
+    """
+    if connection.dialect.name != 'sqlite' or has_search_index(connection):
+        return False
+    if not fts5_available():
+        logging.warning('SQLite is built without FTS5, lessons can not be searched')
+        return False
+
+    for statement in _CREATE:
+        connection.execute(text(statement))
+    connection.execute(text('INSERT INTO tblLessonSearch (rowid, title, new_chars, text) '
+                            'SELECT rowid, cLessonTitle, cNewChars, cText FROM tblLesson'))
+    connection.execute(text('INSERT INTO tblLessonSearchMap (pkLessonUuid, cSearchId) SELECT pkLessonUuid, rowid FROM tblLesson'))
+    logging.debug('Created lesson search index')
+    return True
+
+
+def drop_search_index(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in _DROP:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Lesson.__table__, 'after_create')
+def _after_create(target, connection, **kw):
+    create_search_index(connection)
+
+
+@event.listens_for(Lesson.__table__, 'before_drop')
+def _before_drop(target, connection, **kw):
+    drop_search_index(connection)
@@ -0,0 +1,40 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy.orm import relationship, backref
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+
+from pytouch.model.super import Base
+
+
+class TrainingSession(Base):
+    __tablename__ = 'tblTrainingSession'
+
+    uuid = Column('pkSessionUuid', String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    profile_name = Column('fkProfileName', String, ForeignKey('tblProfile.pkProfileName', onupdate='CASCADE', ondelete='CASCADE'))
+    lesson_uuid = Column('fkLessonUuid', String, ForeignKey('tblLesson.pkLessonUuid', onupdate='CASCADE', ondelete='SET NULL'))
+    started = Column('cStarted', DateTime, default=datetime.utcnow)
+    # Elapsed time without pauses in nanoseconds
+    elapsed = Column('cElapsed', Integer, nullable=False, default=0)
+    hits = Column('cHits', Integer, nullable=False, default=0)
+    keystrokes = Column('cKeystrokes', Integer, nullable=False, default=0)
+    finished = Column('cFinished', Boolean, nullable=False, default=False)
+    profile = relationship('Profile', backref=backref('sessions', cascade='all, delete-orphan', passive_deletes=True))
+    lesson = relationship('Lesson')
+    strokes = relationship('KeyStroke', backref=backref('session'), cascade='all, delete-orphan', passive_deletes=True, order_by='KeyStroke.id')
+
+    def __repr__(self):
+        return '{self.uuid} -- finished: {self.finished!s:>5} -- hits: {self.hits} -- keystrokes: {self.keystrokes}'.format(self=self)
+
+
+class KeyStroke(Base):
+    __tablename__ = 'tblKeyStroke'
+
+    id = Column('pkKeyStrokeId', Integer, primary_key=True, autoincrement=True)
+    session_uuid = Column('fkSessionUuid', String, ForeignKey('tblTrainingSession.pkSessionUuid', onupdate='CASCADE', ondelete='CASCADE'), nullable=False, index=True)
+    # Index in the lesson text the key stroke was expected at
+    index = Column('cIndex', Integer, nullable=False)
+    # Typed character or '<UNDO>'
+    char = Column('cChar', String, nullable=False)
+    # Elapsed session time in nanoseconds
+    time = Column('cTime', Integer, nullable=False)
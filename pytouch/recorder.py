@@ -0,0 +1,144 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pytouch.model import Session
+from pytouch.model.training import TrainingSession, KeyStroke
+from pytouch.trainingmachine import TrainingMachineObserver, KeyStrokeLog
+
+__all__ = [
+    'SessionRecorder',
+]
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRecorder(TrainingMachineObserver):
+    """ Persist the training sessions of a :class:`TrainingMachine`.
+
+    The key strokes are not copied on input. The key stroke log of the machine serves as buffer
+    and only the not yet written part of it is taken on pause and at the end of a session. That part
+    is written by a single background thread with one bulk insert per flush, so neither the input nor
+    the pause handling ever waits on the database.
+    """
+
+    def __init__(self, engine=None, lesson=None, profile=None):
+        """ Create a recorder. Add it as observer to a machine to start recording.
+
+        :param engine: The engine to write to. Defaults to the one bound to the Session.
+        :param lesson: The :class:`Lesson` that is trained, if stored in the database.
+        :param profile: The :class:`Profile` of the user.
+        """
+        self._engine = engine if engine is not None else Session().get_bind()
+        self._lesson_uuid = lesson.uuid if lesson is not None else None
+        self._profile_name = profile.name if profile is not None else None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        self._session_uuid = None
+        self._started = None
+        # The uuid of the last session inserted into the database, only used by the background thread
+        self._created = None
+        # Key stroke rows of failed writes, retried by the next write of their session, only used by the background thread
+        self._unwritten = list()
+        self._flushed = 0
+
+    @property
+    def session_uuid(self):
+        """ The uuid of the current session or None if it has not started yet. """
+        return self._session_uuid
+
+    def flush(self, sender, finished=False):
+        """ Schedule writing of all key strokes recorded since the last flush.
+
+        The key strokes of a failed write are written with the next flush of the same session.
+
+        :param sender: The recorded machine.
+        :param finished: True if the session has ended.
+        :return: A :class:`concurrent.futures.Future` of the write.
+        """
+        log = sender.log
+        end = len(log)
+        start, self._flushed = self._flushed, end
+
+        session = {
+            'pkSessionUuid': self._session_uuid,
+            'fkProfileName': self._profile_name,
+            'fkLessonUuid': self._lesson_uuid,
+            'cStarted': self._started,
+            'cElapsed': sender.elapsed_ns(),
+            'cHits': sender.hits,
+            'cKeystrokes': sender.keystrokes,
+            'cFinished': finished,
+        }
+        # Array slices are copies, the log may grow while the worker is busy.
+        strokes = (log.indices[start:end], log.codes[start:end], log.times[start:end])
+
+        future = self._executor.submit(self._write, session, strokes)
+        future.add_done_callback(self._on_written)
+        return future
+
+    def close(self):
+        """ Wait for all pending writes and stop the background thread. """
+        self._executor.shutdown(wait=True)
+
+    def _write(self, session, strokes):
+        sessions = TrainingSession.__table__
+        session_uuid = session['pkSessionUuid']
+        # Decided here and not on flush, a failed insert is retried by the next write of the session
+        create = self._created != session_uuid
+        rows = [{'fkSessionUuid': session_uuid, 'cIndex': index, 'cChar': KeyStrokeLog.decode(code), 'cTime': time}
+                for index, code, time in zip(*strokes)]
+        unwritten, self._unwritten = self._unwritten, list()
+        if unwritten and unwritten[0]['fkSessionUuid'] != session_uuid:
+            logger.error('Dropping %d unwritten key strokes of session %s', len(unwritten), unwritten[0]['fkSessionUuid'])
+            unwritten = list()
+        rows = unwritten + rows
+
+        try:
+            with self._engine.begin() as connection:
+                if create:
+                    connection.execute(sessions.insert(), session)
+                else:
+                    connection.execute(sessions.update().where(sessions.c.pkSessionUuid == session_uuid), session)
+                if rows:
+                    connection.execute(KeyStroke.__table__.insert(), rows)
+        except Exception:
+            self._unwritten = rows
+            raise
+        self._created = session_uuid
+
+        logger.debug('Wrote session %s with %d key strokes', session_uuid, len(rows))
+
+    @staticmethod
+    def _on_written(future):
+        if future.exception() is not None:
+            logger.error('Unable to write training session: %s', future.exception())
+
+    def _start_session(self):
+        self._session_uuid = str(uuid.uuid4())
+        self._started = datetime.utcnow()
+        self._flushed = 0
+
+    def on_pause(self, sender):
+        self.flush(sender)
+
+    def on_unpause(self, sender):
+        if self._session_uuid is None:
+            self._start_session()
+
+    def on_hit(self, sender, index, typed):
+        pass
+
+    def on_miss(self, sender, index, typed, expected):
+        pass
+
+    def on_undo(self, sender, index, expect):
+        pass
+
+    def on_end(self, sender):
+        self.flush(sender, finished=True)
+
+    def on_restart(self, sender):
+        # The machine has cleared its log, the next unpause starts a new session.
+        self._session_uuid = None
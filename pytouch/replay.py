@@ -0,0 +1,139 @@
+""" Headless replay of recorded typing sessions.
+
+A recording is a sequence of :class:`Stroke` entries, each holding the time of the key stroke in nanoseconds
+and the typed character. Undos are recorded as '<UNDO>', pauses as '<PAUSE>' and '<UNPAUSE>'.
+The input position is derived from the machine feedback the same way the training widget does it,
+so a recording only needs to contain what the user actually typed.
+"""
+import json
+import time
+from collections import namedtuple
+
+from pytouch.trainingmachine import TrainingMachine, TrainingMachineObserver, KeyStrokeLog, LightEvent
+
+__all__ = [
+    'Stroke',
+    'ReplayResult',
+    'VirtualClock',
+    'load',
+    'dump',
+    'from_log',
+    'replay',
+]
+
+Stroke = namedtuple('Stroke', ['time', 'char'])
+
+
+class ReplayResult(namedtuple('ReplayResult', ['hits', 'keystrokes', 'elapsed', 'events', 'duration'])):
+    """ Result of a replay.
+
+    The elapsed time is the session time as :class:`datetime.timedelta`, the duration
+    is the wall time in seconds the replay took.
+    """
+
+    __slots__ = ()
+
+    @property
+    def accuracy(self):
+        return self.hits / self.keystrokes if self.keystrokes else 0.0
+
+    @property
+    def events_per_second(self):
+        return self.events / self.duration if self.duration else float('inf')
+
+
+class VirtualClock(object):
+    """ A clock that only advances when told so. """
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Cursor(TrainingMachineObserver):
+    """ Tracks the input position of a machine like the training widget does. """
+
+    def __init__(self):
+        self.index = 0
+
+    def on_pause(self, sender):
+        pass
+
+    def on_unpause(self, sender):
+        pass
+
+    def on_hit(self, sender, index, typed):
+        self.index = index + 1
+
+    def on_miss(self, sender, index, typed, expected):
+        if typed != '<UNDO>':
+            self.index = index + 1
+
+    def on_undo(self, sender, index, expect):
+        self.index = index
+
+    def on_end(self, sender):
+        pass
+
+    def on_restart(self, sender):
+        self.index = 0
+
+
+def load(file):
+    """ Load a recording from a file object containing one JSON encoded [time, char] pair per line.
+
+    :return: A list of :class:`Stroke`.
+    """
+    return [Stroke(*json.loads(line)) for line in file if line.strip()]
+
+
+def dump(strokes, file):
+    """ Write a recording to the given file object in the format understood by :func:`load`. """
+    for stroke in strokes:
+        file.write(json.dumps(list(stroke)))
+        file.write('\n')
+
+
+def from_log(log):
+    """ Create a recording from the :class:`KeyStrokeLog` of a machine.
+
+    The times in the log are already free of pauses, so no pause strokes are generated.
+    """
+    return [Stroke(t, KeyStrokeLog.decode(c)) for t, c in zip(log.times, log.codes)]
+
+
+def replay(text, strokes, **kwargs):
+    """ Replay a recording on a new :class:`TrainingMachine` using a virtual clock.
+
+    Additional arguments are passed to the machine.
+
+    :param text: The lesson text.
+    :param strokes: An iterable of :class:`Stroke` or (time, char) pairs.
+    :return: A :class:`ReplayResult`.
+    """
+    clock = VirtualClock()
+    tm = TrainingMachine(text, auto_unpause=True, clock=clock, **kwargs)
+    cursor = Cursor()
+    tm.add_observer(cursor)
+
+    process = tm.process_event
+    count = 0
+    start = time.perf_counter()
+    for t, char in strokes:
+        clock.now = t
+        if char == '<UNDO>':
+            if tm.paused:
+                process(LightEvent.unpause_event())
+            process(LightEvent.undo_event(cursor.index))
+        elif char == '<PAUSE>':
+            process(LightEvent.pause_event())
+        elif char == '<UNPAUSE>':
+            process(LightEvent.unpause_event())
+        else:
+            process(LightEvent.input_event(cursor.index, char))
+        count += 1
+    duration = time.perf_counter() - start
+
+    return ReplayResult(tm.hits, tm.keystrokes, tm.elapsed(), count, duration)
@@ -1,57 +1,562 @@
-from pkg_resources import resource_stream, resource_listdir
+import copy
+import hashlib
+import json
 import logging
-from lxml import etree
+import os
+import pickle
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from sqlalchemy import text
+from sqlalchemy.orm import undefer
 from pytouch.model import session_scope, Session
-from pytouch.model.course import Course, Lesson
+from pytouch.model.search import has_search_index
+from pytouch.model.course import Course, LessonList, Lesson
+from pytouch.model.meta import Meta
+from pytouch.model.drill import DrillIndex
+from pytouch.drill import NgramIndex
+from pytouch.charset import Alphabets, decode as charset_decode
+from pytouch.utils import cached_classproperty
+
+# lxml and pkg_resources are slow to import and only needed to read course files, they are imported on first use.
+
+# Plain data records of the course files. In contrast to the model objects they can be cached and passed between processes.
+LessonRecord = namedtuple('LessonRecord', ['uuid', 'title', 'new_chars', 'text'])
+CourseRecord = namedtuple('CourseRecord', ['uuid', 'title', 'description', 'keyboard_layout', 'lessons'])
+
+
+@lru_cache(maxsize=None)
+def course_schema():
+    """ Get the compiled course schema. It is compiled on first use. """
+    from pkg_resources import resource_stream
+    from lxml import etree
+
+    return etree.XMLSchema(etree.parse(resource_stream(CourseService.RESOURCE, 'course.xsd')))
+
+
+@lru_cache(maxsize=None)
+def element_schema():
+    """ Get the course schema extended by a global lesson element, so that single lessons can be validated. """
+    from pkg_resources import resource_stream
+    from lxml import etree
+
+    xsd = etree.parse(resource_stream(CourseService.RESOURCE, 'course.xsd'))
+    etree.SubElement(xsd.getroot(), '{http://www.w3.org/2001/XMLSchema}element', name='lesson', type='lesson')
+    return etree.XMLSchema(xsd)
+
+
+@lru_cache(maxsize=None)
+def schema_digest():
+    """ Get the SHA-256 digest of the course schema. Validation results are only valid for the same schema. """
+    from pkg_resources import resource_string
+
+    return hashlib.sha256(resource_string(CourseService.RESOURCE, 'course.xsd')).hexdigest()
+
+
+def default_cache_path():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pytouch', 'courses.cache')
+
+
+def _read_course_file(cls, filename, data):
+    """ Worker function of the parallel parser, cls is the service class whose parser is used. """
+    return cls._read_file(filename, data)
+
+
+class CourseCache(object):
+    """ Precompiled course records keyed by the SHA-256 digest of their source file.
+
+    A digest of a file that failed validation maps to None. The entries are only valid for the schema
+    they were validated with, a cache written with another schema is ignored.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, schema=None):
+        """ Load the cache.
+
+        :param path: The cache file.
+        :param schema: The digest of the schema the course files are validated with.
+        """
+        self.path = path
+        self.schema = schema
+        self._entries = dict()
+        self._used = set()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as file:
+                data = pickle.load(file)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logging.warning('Ignoring unreadable course cache {}: {}'.format(self.path, e))
+            return
+
+        if data.get('version') != CourseCache.VERSION:
+            logging.info('Ignoring course cache {} of version {}'.format(self.path, data.get('version')))
+        elif data.get('schema') != self.schema:
+            logging.info('Ignoring course cache {} of another course schema'.format(self.path))
+        else:
+            self._entries = data['entries']
+
+    def __contains__(self, digest):
+        return digest in self._entries
+
+    def __getitem__(self, digest):
+        self._used.add(digest)
+        return self._entries[digest]
+
+    def __setitem__(self, digest, record):
+        self._used.add(digest)
+        self._entries[digest] = record
+        self._dirty = True
+
+    def save(self):
+        """ Write the cache if anything changed. Entries that were not used since loading are dropped. """
+        if not self._dirty and self._used == set(self._entries):
+            return
+
+        entries = {digest: self._entries[digest] for digest in self._used}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp, 'wb') as file:
+            pickle.dump({'version': CourseCache.VERSION, 'schema': self.schema, 'entries': entries}, file,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        logging.debug('Wrote course cache: {}'.format(self.path))
+
+
+def record_digest(record):
+    """ Get the SHA-256 digest of the content of a :class:`CourseRecord`. """
+    return hashlib.sha256(json.dumps(record, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+SyncResult = namedtuple('SyncResult', ['courses', 'inserted', 'updated', 'deleted'])
+
+# A lesson found by CourseService.search_lessons. Rank and snippet are None for character only searches.
+# A lesson contained in several courses is found once with the first of them by title.
+LessonMatch = namedtuple('LessonMatch', ['uuid', 'title', 'course', 'rank', 'snippet'])
+
+
+def fts_query(words):
+    """ Build an FTS5 query matching all given words. A trailing '*' makes a word a prefix. """
+    terms = list()
+    for word in words:
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"{}"{}'.format(word.replace('"', '""'), '*' if prefix else ''))
+    return ' '.join(terms)
 
 
 class CourseService(object):
     RESOURCE = 'pytouch.resources.courses'
-    _schema = etree.XMLSchema(etree.parse(resource_stream(RESOURCE, 'course.xsd')))
-    _course_file_names = (f for f in resource_listdir(RESOURCE, '') if f.endswith('.xml'))
+
+    @cached_classproperty
+    def _course_file_names(cls):
+        from pkg_resources import resource_listdir
+
+        return tuple(f for f in resource_listdir(cls.RESOURCE, '') if f.endswith('.xml'))
+
+    # Path of the precompiled course cache, None to disable it.
+    cache_path = default_cache_path()
+    # Number of processes used to parse course files, None for one per CPU.
+    jobs = 1
 
     @staticmethod
-    def _parse_lesson(lesson_element):
-        id = lesson_element.find('id').text
-        title = lesson_element.find('title').text
-        new_chars = lesson_element.find('newCharacters').text
-        text = lesson_element.find('text').text
+    def _read_lesson(lesson_element):
+        return LessonRecord(uuid=lesson_element.find('id').text,
+                            title=lesson_element.find('title').text,
+                            new_chars=lesson_element.find('newCharacters').text,
+                            text=lesson_element.find('text').text)
+
+    @staticmethod
+    def _read_course(course_element):
+        lessons_element = course_element.find('lessons')
+        return CourseRecord(uuid=course_element.find('id').text,
+                            title=course_element.find('title').text,
+                            description=course_element.find('description').text,
+                            keyboard_layout=course_element.find('keyboardLayout').text,
+                            lessons=tuple(CourseService._read_lesson(e) for e in lessons_element.iter('lesson')))
+
+    @staticmethod
+    def _build_lesson(record):
+        return Lesson(uuid=record.uuid, title=record.title, new_chars=record.new_chars, builtin=True, text=record.text)
 
-        return Lesson(uuid=id, title=title, new_chars=new_chars, builtin=True, text=text)
+    @staticmethod
+    def _build_course(record, alphabets=None):
+        """ Build a :class:`Course` from a record. The lesson signatures are computed if alphabets are given. """
+        course = Course(uuid=record.uuid, title=record.title, description=record.description, builtin=True,
+                        keyboard_layout=record.keyboard_layout)
+        for lesson_record in record.lessons:
+            lesson = CourseService._build_lesson(lesson_record)
+            if alphabets is not None:
+                lesson.charset = alphabets.signature(record.keyboard_layout, lesson_record.text)
+            course.lessons.append(lesson)
+        return course
+
+    @staticmethod
+    def _parse_lesson(lesson_element):
+        return CourseService._build_lesson(CourseService._read_lesson(lesson_element))
 
     @staticmethod
     def _parse_course(course_element):
-        id = course_element.find('id').text
-        title = course_element.find('title').text
-        description = course_element.find('description').text
-        keyboard_layout = course_element.find('keyboardLayout').text
+        return CourseService._build_course(CourseService._read_course(course_element))
 
-        course = Course(uuid=id, title=title, description=description, builtin=True, keyboard_layout=keyboard_layout)
+    @classmethod
+    def _read_file(cls, filename, data):
+        """ Parse and validate the content of a course file with :meth:`stream_course`.
 
-        lessons_element = course_element.find('lessons')
-        for lesson_element in lessons_element.iter('lesson'):
-            course.lessons.append(CourseService._parse_lesson(lesson_element))
+        :return: A :class:`CourseRecord` or None if the file is invalid.
+        """
+        from lxml import etree
 
-        return course
+        try:
+            course, *lessons = cls.stream_course(BytesIO(data))
+        except etree.DocumentInvalid:
+            logging.warning('Unable to validate file: {}'.format(filename))
+            return None
+        logging.debug('Validated file: {}'.format(filename))
+        return course._replace(lessons=tuple(lessons))
 
     @classmethod
-    def _parse_courses(cls):
+    def stream_course(cls, file):
+        """ Parse a course file incrementally.
+
+        First a :class:`CourseRecord` without lessons is yielded, followed by a :class:`LessonRecord` for every lesson.
+        Every lesson is validated on its own and dropped from the tree after it has been read, so the memory
+        needed is bounded by the largest lesson instead of the whole file. At the end the remaining skeleton of
+        the course is validated, so a file is accepted exactly if it is valid as a whole.
+
+        :param file: A file name or a file object opened in binary mode.
+        :raises lxml.etree.DocumentInvalid: As soon as an invalid element is encountered.
+        """
+        from lxml import etree
+
+        schema = element_schema()
+        lessons_element = None
+        context = etree.iterparse(file, events=('start', 'end'), tag=('lessons', 'lesson'))
+        for event, element in context:
+            if event == 'start' and element.tag == 'lessons':
+                lessons_element = element
+                # The course header precedes the lessons and is complete at this point.
+                course_element = element.getparent()
+                stub = etree.Element(course_element.tag)
+                for child in course_element:
+                    if child is not element:
+                        stub.append(copy.deepcopy(child))
+                etree.SubElement(stub, 'lessons')
+                schema.assertValid(stub)
+                yield cls._read_course(stub)
+
+            elif event == 'end' and element.tag == 'lesson':
+                schema.assertValid(element)
+                yield cls._read_lesson(element)
+
+                # Drop the finished lesson and everything before it
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+        # The lessons are valid, what is left must be a valid course without them
+        if lessons_element is not None:
+            for element in lessons_element.findall('lesson'):
+                lessons_element.remove(element)
+        course_schema().assertValid(context.root)
+
+    @classmethod
+    def _read_files(cls, files):
+        """ Parse and validate the given files, spread over a process pool if more than one job is configured.
+
+        :param files: A list of (filename, data) tuples.
+        :return: A list with a :class:`CourseRecord` or None for every file.
+        """
+        jobs = min(cls.jobs or os.cpu_count() or 1, len(files))
+        if jobs > 1:
+            # The class is passed to the workers by reference, a class defined in a function can't be found there
+            try:
+                pickle.dumps(cls)
+            except (pickle.PicklingError, AttributeError, TypeError):
+                logging.debug('Parsing files serially, {} can not be passed to other processes'.format(cls.__qualname__))
+                jobs = 1
+        if jobs <= 1:
+            return [cls._read_file(filename, data) for filename, data in files]
+
+        logging.debug('Parsing {} files with {} processes'.format(len(files), jobs))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # Submit the largest files first to keep all workers busy until the end
+            order = sorted(range(len(files)), key=lambda i: len(files[i][1]), reverse=True)
+            futures = {i: executor.submit(_read_course_file, cls, *files[i]) for i in order}
+            return [futures[i].result() for i in range(len(files))]
+
+    @classmethod
+    def _course_records(cls):
+        """ Get the records of all valid course files.
+
+        Only files whose content is not found in the course cache are parsed and validated.
+        """
+        from pkg_resources import resource_string
+
+        cache = CourseCache(cls.cache_path, schema_digest()) if cls.cache_path else None
+        records = list()
+        missing = list()
         for filename in cls._course_file_names:
-            with resource_stream(cls.RESOURCE, filename) as file:
-                xml = etree.parse(file)
-                if cls._schema.validate(xml):
-                    logging.debug('Validated file: {}'.format(file.name))
-                    yield cls._parse_course(xml.getroot())
+            data = resource_string(cls.RESOURCE, filename)
+            digest = hashlib.sha256(data).hexdigest()
+            if cache is not None and digest in cache:
+                record = cache[digest]
+                if record is None:
+                    logging.warning('Unable to validate file: {}'.format(filename))
+                records.append(record)
+            else:
+                records.append(None)
+                missing.append((len(records) - 1, digest, filename, data))
+
+        parsed = cls._read_files([(filename, data) for _, _, filename, data in missing])
+        for (i, digest, _, _), record in zip(missing, parsed):
+            records[i] = record
+            if cache is not None:
+                cache[digest] = record
+
+        if cache is not None:
+            try:
+                cache.save()
+            except OSError as e:
+                logging.warning('Unable to write course cache {}: {}'.format(cache.path, e))
+        return [record for record in records if record is not None]
+
+    @classmethod
+    def _parse_courses(cls):
+        for record in cls._course_records():
+            yield cls._build_course(record)
+
+    # Key prefix of the course digests in the meta table
+    DIGEST_KEY = 'course-digest:'
+
+    @staticmethod
+    def init_courses():
+        with session_scope() as session:
+            alphabets = Alphabets(session)
+            for record in CourseService._course_records():
+                session.add(CourseService._build_course(record, alphabets))
+                session.add(Meta(key=CourseService.DIGEST_KEY + record.uuid, value=record_digest(record)))
+
+    @staticmethod
+    def _sync_course(session, record, alphabets):
+        """ Bring a course and its lessons in the database up to date with the given record using bulk statements.
+
+        :return: The number of inserted and updated lessons and the set of uuids of lessons dropped from the course.
+        """
+        course = dict(uuid=record.uuid, title=record.title, description=record.description, builtin=True,
+                      keyboard_layout=record.keyboard_layout)
+        if session.query(Course.uuid).filter(Course.uuid == record.uuid).first() is None:
+            session.bulk_insert_mappings(Course, [course])
+        else:
+            session.bulk_update_mappings(Course, [course])
+
+        lessons = [dict(uuid=l.uuid, title=l.title, new_chars=l.new_chars, builtin=True, text=l.text,
+                        charset=alphabets.signature(record.keyboard_layout, l.text)) for l in record.lessons]
+        existing = {row.uuid: dict(uuid=row.uuid, title=row.title, new_chars=row.new_chars, builtin=row.builtin, text=row.text,
+                                   charset=row.charset)
+                    for row in session.query(Lesson.uuid, Lesson.title, Lesson.new_chars, Lesson.builtin, Lesson.text, Lesson.charset)
+                    .filter(Lesson.uuid.in_([l['uuid'] for l in lessons]))}
+        inserts = [l for l in lessons if l['uuid'] not in existing]
+        updates = [l for l in lessons if l['uuid'] in existing and existing[l['uuid']] != l]
+        session.bulk_insert_mappings(Lesson, inserts)
+        session.bulk_update_mappings(Lesson, updates)
+
+        order = [(l['uuid'], i) for i, l in enumerate(lessons)]
+        current = session.query(LessonList.lesson_uuid, LessonList.position) \
+            .filter(LessonList.course_uuid == record.uuid).order_by(LessonList.position).all()
+        dropped = set()
+        if [tuple(row) for row in current] != order:
+            session.query(LessonList).filter(LessonList.course_uuid == record.uuid).delete(synchronize_session=False)
+            session.bulk_insert_mappings(LessonList, [dict(course_uuid=record.uuid, lesson_uuid=uuid, position=i) for uuid, i in order])
+            dropped = set(row.lesson_uuid for row in current) - set(uuid for uuid, _ in order)
+
+        # The drill index is rebuilt from the new lesson texts on demand
+        session.query(DrillIndex).filter(DrillIndex.course_uuid == record.uuid).delete(synchronize_session=False)
+
+        return len(inserts), len(updates), dropped
+
+    @staticmethod
+    def _delete_orphans(session, uuids):
+        """ Delete the builtin lessons of the given uuids that are not part of any course anymore.
+
+        A lesson can be moved from one course file to another, it must survive the course it left.
+        Call it once all courses are synchronized.
+
+        :return: The number of deleted lessons.
+        """
+        if not uuids:
+            return 0
+        referenced = set(uuid for uuid, in session.query(LessonList.lesson_uuid).filter(LessonList.lesson_uuid.in_(uuids)))
+        orphans = set(uuids) - referenced
+        if not orphans:
+            return 0
+        return session.query(Lesson).filter(Lesson.uuid.in_(orphans), Lesson.builtin == True) \
+            .delete(synchronize_session=False)
+
+    @staticmethod
+    def sync_courses(**kwargs):
+        """ Synchronize the builtin courses in the database with the course files.
+
+        In contrast to init_courses the database is not expected to be empty. A digest of every course
+        is kept in the meta table and only courses whose digest changed are written.
+        Courses that are no longer shipped are removed.
+
+        Additional arguments are passed to the session.
+
+        :return: A :class:`SyncResult` with the number of changed courses and inserted, updated and deleted lessons.
+        """
+        inserted = updated = courses = 0
+        # Lessons dropped from a course, they are deleted unless another course still contains them
+        dropped = set()
+        with session_scope(**kwargs) as session:
+            alphabets = Alphabets(session)
+            digests = {meta.key[len(CourseService.DIGEST_KEY):]: meta
+                       for meta in session.query(Meta).filter(Meta.key.startswith(CourseService.DIGEST_KEY))}
+
+            for record in CourseService._course_records():
+                digest = record_digest(record)
+                meta = digests.pop(record.uuid, None)
+                if meta is not None and meta.value == digest:
+                    continue
+
+                logging.info('Synchronizing course: {}'.format(record.title))
+                lessons_inserted, lessons_updated, lessons_dropped = CourseService._sync_course(session, record, alphabets)
+                inserted += lessons_inserted
+                updated += lessons_updated
+                dropped |= lessons_dropped
+                courses += 1
+
+                if meta is None:
+                    session.add(Meta(key=CourseService.DIGEST_KEY + record.uuid, value=digest))
                 else:
-                    logging.warning('Unable to validate file: {}'.format(file.name))
+                    meta.value = digest
+
+            # Remaining digests belong to courses that are gone
+            for uuid, meta in digests.items():
+                logging.info('Removing course: {}'.format(uuid))
+                dropped.update(row.lesson_uuid for row in session.query(LessonList.lesson_uuid).filter(LessonList.course_uuid == uuid))
+                session.query(Course).filter(Course.uuid == uuid, Course.builtin == True).delete(synchronize_session=False)
+                session.delete(meta)
+                courses += 1
+
+            deleted = CourseService._delete_orphans(session, dropped)
+            CourseService._update_charsets(session, alphabets)
+
+        rv = SyncResult(courses, inserted, updated, deleted)
+        logging.info('Synchronized courses: {}'.format(rv))
+        return rv
+
+    @staticmethod
+    def _update_charsets(session, alphabets):
+        """ Compute the missing signatures of lessons, e.g. of lessons created before signatures existed. """
+        rows = session.query(Lesson.uuid, Lesson.text, Course.keyboard_layout) \
+            .join(LessonList, LessonList.lesson_uuid == Lesson.uuid).join(Course, Course.uuid == LessonList.course_uuid) \
+            .filter(Lesson.charset.is_(None)).all()
+        if rows:
+            logging.info('Computing the character set of {} lessons'.format(len(rows)))
+            session.bulk_update_mappings(Lesson, [dict(uuid=uuid, charset=alphabets.signature(layout, text))
+                                                  for uuid, text, layout in rows])
+
+    @staticmethod
+    def find_lessons_by_chars(only=None, including=None, layout=None):
+        """ Find lessons by the keys their texts use. Whitespace is ignored.
+
+        The character sets of all lessons are compared as bitmaps, no lesson text is loaded.
+
+        :param only: Find lessons that use no other keys than these characters.
+        :param including: Find lessons that use at least all of these characters.
+        :param layout: Only search courses of the given keyboard layout.
+        :return: A list of :class:`LessonMatch` ordered by course and position.
+        """
+        with session_scope() as session:
+            alphabets = Alphabets(session)
+            rows = session.query(Lesson.uuid, Lesson.title, Course.title, Course.keyboard_layout, Lesson.charset) \
+                .join(LessonList, LessonList.lesson_uuid == Lesson.uuid).join(Course, Course.uuid == LessonList.course_uuid) \
+                .filter(Lesson.charset.isnot(None)).order_by(Course.title, LessonList.position)
+            if layout is not None:
+                rows = rows.filter(Course.keyboard_layout == layout)
+
+            # Bitmaps of the allowed and required keys per layout, None if a required key is not in the alphabet
+            masks = dict()
+            matches = list()
+            for uuid, title, course, course_layout, charset in rows:
+                mask = masks.get(course_layout)
+                if mask is None:
+                    allowed = alphabets.mask(course_layout, only)[0] if only is not None else None
+                    required, unknown = alphabets.mask(course_layout, including or '')
+                    mask = masks[course_layout] = (allowed, None if unknown else required)
+                allowed, required = mask
+
+                bitmap = charset_decode(charset)
+                if allowed is not None and bitmap & ~allowed:
+                    continue
+                if required is None or bitmap & required != required:
                     continue
+                matches.append(LessonMatch(uuid, title, course, None, None))
+            return matches
 
     @staticmethod
-    def init_courses():
+    def drill_index(course_uuid):
+        """ Get the :class:`NgramIndex` of a course. It is built and stored on first use. """
+        with session_scope() as session:
+            return NgramIndex.for_course(session, course_uuid)
+
+    @staticmethod
+    def search_lessons(words=(), chars='', limit=20):
+        """ Search lessons by words in their title, new characters or text and by characters in their text.
+
+        Word matches are ranked by relevance with matches in the title weighing most. Lessons found by characters
+        only are ordered by course and position, lessons introducing the characters first.
+        Every lesson is found once, a lesson contained in several courses with the first of them by title.
+
+        :param words: Words that must all occur. A trailing '*' matches all words starting with it.
+        :param chars: Characters that must all occur in the text.
+        :param limit: The maximal number of results.
+        :return: A list of :class:`LessonMatch`.
+        :raises RuntimeError: If words are given but the database has no search index.
+        """
+        query = fts_query(words)
+        chars = sorted(set(chars))
+        if not query and not chars:
+            return []
+
+        params = {'char{}'.format(i): char for i, char in enumerate(chars)}
+        params['limit'] = limit
+        contained = ['instr(l.cText, :char{}) > 0'.format(i) for i in range(len(chars))]
+        joins = ('LEFT JOIN tblLessonList ll ON ll.pkLessonListId = ('
+                 'SELECT fll.pkLessonListId FROM tblLessonList fll JOIN tblCourse fc ON fc.pkCourseUuid = fll.fkCourseUuid '
+                 'WHERE fll.fkLessonUuid = l.pkLessonUuid ORDER BY fc.cCourseTitle, fll.position LIMIT 1) '
+                 'LEFT JOIN tblCourse c ON c.pkCourseUuid = ll.fkCourseUuid ')
+
+        if query:
+            params['query'] = query
+            statement = ('SELECT l.pkLessonUuid, l.cLessonTitle, c.cCourseTitle, bm25(tblLessonSearch, 10.0, 5.0, 1.0) AS rank, '
+                         "snippet(tblLessonSearch, 2, '[', ']', '...', 8) FROM tblLessonSearch "
+                         'JOIN tblLessonSearchMap m ON m.cSearchId = tblLessonSearch.rowid '
+                         'JOIN tblLesson l ON l.pkLessonUuid = m.pkLessonUuid ' + joins +
+                         'WHERE ' + ' AND '.join(['tblLessonSearch MATCH :query'] + contained) +
+                         ' ORDER BY rank LIMIT :limit')
+        else:
+            introduced = ' AND '.join("instr(coalesce(l.cNewChars, ''), :char{}) > 0".format(i) for i in range(len(chars)))
+            statement = ('SELECT l.pkLessonUuid, l.cLessonTitle, c.cCourseTitle, NULL, NULL FROM tblLesson l ' + joins +
+                         'WHERE ' + ' AND '.join(contained) +
+                         ' ORDER BY NOT ({}), c.cCourseTitle, ll.position LIMIT :limit'.format(introduced))
+
         with session_scope() as session:
-            for course in CourseService._parse_courses():
-                session.add(course)
+            if query and not has_search_index(session.connection()):
+                raise RuntimeError('The database has no lesson search index')
+            rows = session.execute(text(statement), params)
+            return [LessonMatch(*row) for row in rows]
 
     @staticmethod
     def find_lesson(uuid):
-        return Session().query(Lesson).filter(Lesson.uuid == uuid).first()
+        return Session().query(Lesson).options(undefer(Lesson.text)).filter(Lesson.uuid == uuid).first()
@@ -0,0 +1,21 @@
+""" Settings needed before the database and GUI modules are imported, e.g. to build the command line parser.
+
+This module must not import anything heavy, it is loaded on every start.
+"""
+
+# Named SQLite profiles. Every entry is applied as PRAGMA on each new connection.
+SQLITE_PROFILES = {
+    'default': {},
+    'performance': {
+        'journal_mode': 'WAL',
+        # Safe in WAL mode, only the last transactions may be lost on power loss
+        'synchronous': 'NORMAL',
+        # Negative values are KiB
+        'cache_size': '-16384',
+        'mmap_size': '268435456',
+        'temp_store': 'MEMORY',
+    },
+}
+
+# journal_mode must be set first, synchronous depends on it
+SQLITE_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
@@ -1,6 +1,7 @@
-import copy
 import logging
-from datetime import datetime, timedelta
+import time
+from array import array
+from datetime import timedelta
 
 from collections import namedtuple
 
@@ -8,32 +9,20 @@ from blinker import Signal
 
 __all__ = [
     'Event',
+    'LightEvent',
+    'Change',
     'TrainingMachineObserver',
+    'KeyStrokeLog',
     'TrainingMachine',
 ]
 
 logger = logging.getLogger(__name__)
 
 
-class Event(dict):
-    """ Events that are expected by the process_event function.
-    Use the factory methods to create appropriate events.
-    """
+class EventFactory(object):
+    """ Factory methods shared by all event types. """
 
-    def __init__(self, type, **kwargs):
-        super().__init__(type=type, **kwargs)
-
-    @property
-    def type(self):
-        return self['type']
-
-    @property
-    def index(self):
-        return self.get('index')
-
-    @property
-    def char(self):
-        return self.get('char')
+    __slots__ = ()
 
     @classmethod
     def input_event(cls, index, char):
@@ -59,12 +48,66 @@ class Event(dict):
         return cls(type='restart')
 
 
+class Event(EventFactory, dict):
+    """ Events that are expected by the process_event function.
+    Use the factory methods to create appropriate events.
+    """
+
+    def __init__(self, type, **kwargs):
+        super().__init__(type=type, **kwargs)
+
+    @property
+    def type(self):
+        return self['type']
+
+    @property
+    def index(self):
+        return self.get('index')
+
+    @property
+    def char(self):
+        return self.get('char')
+
+
+class LightEvent(EventFactory):
+    """ Lightweight slotted event with the same interface as :class:`Event`.
+    Intended for large batches passed to the process_events function.
+    """
+
+    __slots__ = ('type', 'index', 'char')
+
+    def __init__(self, type, index=None, char=None):
+        self.type = type
+        self.index = index
+        self.char = char
+
+    def __repr__(self):
+        return 'LightEvent(type={self.type!r}, index={self.index!r}, char={self.char!r})'.format(self=self)
+
+
+Change = namedtuple('Change', ['method', 'args'])
+Change.__doc__ = """ A notification collected while processing a batch of events.
+The method is the name of the observer callback, the args are passed after the sender.
+"""
+
+
 class TrainingMachineObserver(object):
     """ TrainingMachine observer interface.
 
     A client should implement this interface to get feedback from the machine.
     """
 
+    def on_batch(self, sender, changes):
+        """ Called once after a batch of events was processed.
+
+        The default implementation dispatches every change to its callback.
+
+        :param sender: The sending machine.
+        :param changes: A list of :class:`Change` in the order they occurred.
+        """
+        for method, args in changes:
+            getattr(self, method)(sender, *args)
+
     def on_pause(self, sender):
         raise NotImplementedError
 
@@ -92,23 +135,114 @@ class TrainingMachineObserver(object):
         raise NotImplementedError
 
 
+class KeyStrokeLog(object):
+    """ Struct-of-arrays storage of all key strokes of a training session.
+
+    Every key stroke is stored as one entry in a set of typed arrays instead of one object per stroke:
+
+    * ``codes``: The code point of the typed character or ``UNDO_CODE`` for an undo.
+    * ``indices``: The index in the text the key stroke was expected at.
+    * ``times``: The elapsed session time of the key stroke in integer nanoseconds.
+    * ``previous``: The number of the previous key stroke at the same index or ``NO_STROKE``.
+
+    Additionally a per-index table ``last`` holds the number of the last key stroke at each index of
+    the text, which makes hit/miss checks O(1) and allows to walk all strokes at an index without
+    scanning the log.
+
+    Memory used by a :class:`TrainingMachine` for the longest lesson of a course (measured with
+    tracemalloc, including the lesson text) after construction and after typing the whole lesson
+    with a typo and an undo on every tenth character:
+
+    ============= ====== ================================ ================================
+    Course        Chars  Char objects (construct/typed)   Key stroke log (construct/typed)
+    ============= ====== ================================ ================================
+    bg2.xml        2355  606 KiB / 1131 KiB               16 KiB / 78 KiB
+    de.neo.xml     6667  1276 KiB / 2300 KiB              34 KiB / 205 KiB
+    de.dvorak.xml  6666  1276 KiB / 2301 KiB              34 KiB / 205 KiB
+    ============= ====== ================================ ================================
+
+    The arrays support the buffer protocol and can be consumed without copying, e.g. by numpy.
+    """
+
+    UNDO_CODE = -1
+    NO_STROKE = -1
+
+    def __init__(self, size):
+        """ Create an empty log.
+
+        :param size: The length of the text the key strokes are recorded for.
+        """
+        self.codes = array('i')
+        self.indices = array('i')
+        self.times = array('q')
+        self.previous = array('i')
+        self.last = array('i', [KeyStrokeLog.NO_STROKE]) * size
+
+    def __len__(self):
+        return len(self.codes)
+
+    @staticmethod
+    def encode(char):
+        return KeyStrokeLog.UNDO_CODE if char == '<UNDO>' else ord(char)
+
+    @staticmethod
+    def decode(code):
+        return '<UNDO>' if code == KeyStrokeLog.UNDO_CODE else chr(code)
+
+    def append(self, index, char, time):
+        """ Record a key stroke.
+
+        :param index: The index in the text.
+        :param char: The typed character or '<UNDO>'.
+        :param time: The elapsed time in nanoseconds.
+        """
+        self.codes.append(self.encode(char))
+        self.indices.append(index)
+        self.times.append(time)
+        self.previous.append(self.last[index])
+        self.last[index] = len(self.codes) - 1
+
+    def last_code(self, index):
+        """ Get the code of the last key stroke at the given index or None if nothing was recorded. """
+        stroke = self.last[index]
+        return self.codes[stroke] if stroke != KeyStrokeLog.NO_STROKE else None
+
+    def strokes(self, index):
+        """ Get the numbers of all key strokes at the given index in chronological order. """
+        rv = list()
+        stroke = self.last[index]
+        while stroke != KeyStrokeLog.NO_STROKE:
+            rv.append(stroke)
+            stroke = self.previous[stroke]
+        rv.reverse()
+        return rv
+
+    def clear(self):
+        del self.codes[:]
+        del self.indices[:]
+        del self.times[:]
+        del self.previous[:]
+        self.last = array('i', [KeyStrokeLog.NO_STROKE]) * len(self.last)
+
+
 class Char(object):
     KeyStroke = namedtuple('KeyStroke', ['char', 'time'])
 
-    def __init__(self, idx, char, undo_typo):
+    def __init__(self, idx, char, undo_typo, log):
         """ Internal representation of a character in the text of a lesson.
 
-        An additional list of all key strokes at this index is maintained.
-
+        This is a read-only view on the key strokes recorded at this index in the given log, key strokes are
+        only recorded by the machine.
 
         :param idx: The absolute index in the text starting at 0.
         :param char: The utf-8 character in the text.
         :param undo_typo: Should undos (<UNDO>) counts as typos.
+        :param log: The :class:`KeyStrokeLog` of the machine.
         """
         self._idx = idx
         self._char = char
-        self._keystrokes = list()
         self._undo_typo = undo_typo
+        self._log = log
 
     @property
     def index(self):
@@ -123,7 +257,7 @@ class Char(object):
         """ Is the last recorded key stroke a hit?
         :return: True on hit, else False.
         """
-        return self._keystrokes[-1].char == self._char if self._keystrokes else False
+        return self._log.last_code(self._idx) == ord(self._char)
 
     @property
     def miss(self):
@@ -134,27 +268,56 @@ class Char(object):
 
     @property
     def keystrokes(self):
-        return self._keystrokes
+        log = self._log
+        return [Char.KeyStroke(log.decode(log.codes[s]), timedelta(microseconds=log.times[s] // 1000))
+                for s in log.strokes(self._idx)]
 
     @property
     def typos(self):
-        return [ks for ks in self._keystrokes if (ks.char != '<UNDO>' and ks.char != self._char) or (ks.char == '<UNDO>' and self._undo_typo)]
-
-    def append(self, char, elapsed):
-        self._keystrokes.append(Char.KeyStroke(char, elapsed))
+        return [ks for ks in self.keystrokes if (ks.char != '<UNDO>' and ks.char != self._char) or (ks.char == '<UNDO>' and self._undo_typo)]
 
     def __getitem__(self, item):
-        return self._keystrokes[item].char
+        return self.keystrokes[item].char
 
     def __iter__(self):
-        for ks in self._keystrokes:
+        for ks in self.keystrokes:
             yield ks
 
 
+class CharList(object):
+    """ Read-only sequence of :class:`Char` views on the text of a machine.
+
+    Views are created on first access and kept for later accesses.
+    """
+
+    def __init__(self, text, undo_typo, log):
+        self._text = text
+        self._undo_typo = undo_typo
+        self._log = log
+        self._views = dict()
+
+    def __len__(self):
+        return len(self._text)
+
+    def __getitem__(self, item):
+        # Note that this may produce an IndexError like the text itself.
+        char = self._text[item]
+        if item < 0:
+            item += len(self._text)
+        view = self._views.get(item)
+        if view is None:
+            view = self._views[item] = Char(item, char, self._undo_typo, self._log)
+        return view
+
+    def __iter__(self):
+        for i in range(len(self._text)):
+            yield self[i]
+
+
 class TrainingMachine(object):
     PauseEntry = namedtuple('PauseEntry', ['action', 'time'])
 
-    def __init__(self, text, auto_unpause=False, undo_typo=False, **kwargs):
+    def __init__(self, text, auto_unpause=False, undo_typo=False, clock=time.perf_counter_ns, **kwargs):
         """ Training machine.
 
         A client should never manipulate internal attributes on its instance.
@@ -170,6 +333,7 @@ class TrainingMachine(object):
         :param text: The lesson text.
         :param undo_typo: If enabled wrong undos count as typos.
         :param auto_unpause: True to enable the auto transition from pause to input on input event.
+        :param clock: A monotonic clock returning the current time in integer nanoseconds.
         """
 
         # Ensure the text ends with NL
@@ -177,9 +341,25 @@ class TrainingMachine(object):
             text += '\n'
 
         self._state_fn = self._state_pause
-        self._text = [Char(i, c, undo_typo) for i, c in enumerate(text)]
+        self._chars = text
+        self._log = KeyStrokeLog(len(text))
+        self._text = CharList(text, undo_typo, self._log)
         self._pause_history = list()
         self._observers = list()
+        # Notifications collected by process_events or None
+        self._changes = None
+
+        # Time accounting in clock nanoseconds, maintained by _start_clock and _stop_clock
+        self._clock = clock
+        self._started = None
+        self._stopped = None
+        self._pause_time = 0
+
+        # Running statistics, maintained by _record and _reset
+        self._hits = 0
+        self._keystrokes = 0
+        self._undos = 0
+        self._typos = 0
 
         self.auto_unpause = auto_unpause
         self.undo_typo = undo_typo
@@ -217,9 +397,36 @@ class TrainingMachine(object):
 
         :param event: An event.
         """
-        logger.debug('processing event: {}'.format(event))
+        logger.debug('processing event: %s', event)
         self._state_fn(event)
 
+    def process_events(self, events):
+        """ Process a batch of external events.
+
+        The observers are notified once after the whole batch has been processed. Observers that implement
+        on_batch receive all changes at once, all others receive the usual callbacks for every change.
+
+        :param events: An iterable of events, e.g. :class:`LightEvent`.
+        """
+        self._changes = changes = list()
+        try:
+            for event in events:
+                self._state_fn(event)
+        finally:
+            self._changes = None
+            if changes:
+                self._notify_batch(changes)
+
+    @property
+    def text(self):
+        """ The trained text, always ending with NL. """
+        return self._chars
+
+    @property
+    def log(self):
+        """ The :class:`KeyStrokeLog` of the machine. A client must not modify it. """
+        return self._log
+
     @property
     def paused(self):
         return self._state_fn is self._state_pause
@@ -228,111 +435,149 @@ class TrainingMachine(object):
     def running(self):
         return not self.paused and self._state_fn is not self._state_end
 
-    def _keystrokes(self):
-        for char in self._text:
-            for ks in char:
-                yield ks
-
     @property
     def keystrokes(self):
-        return len([ks for ks in self._keystrokes() if ks.char != '<UNDO>'])
+        """ Number of recorded key strokes without undos. """
+        return self._keystrokes
 
     @property
     def hits(self):
-        return len([char for char in self._text if char.hit])
+        """ Number of characters whose last recorded key stroke is a hit. """
+        return self._hits
+
+    @property
+    def undos(self):
+        """ Number of recorded undos. """
+        return self._undos
+
+    @property
+    def typos(self):
+        """ Number of recorded typos. Undos are included if undo_typo is enabled. """
+        return self._typos
 
     @property
     def progress(self):
-        rv = self.hits / len(self._text)
+        rv = self.hits / len(self._chars)
         return rv
 
+    def elapsed_ns(self):
+        """ Get the overall runtime without pauses in nanoseconds. """
+        if self._started is None:
+            return 0
+        now = self._stopped if self._stopped is not None else self._clock()
+        return now - self._started - self._pause_time
+
     def elapsed(self):
         """ Get the overall runtime.
 
         :return: The runtime as :class:`datetime.timedelta`
         """
+        return timedelta(microseconds=self.elapsed_ns() // 1000)
+
+    def _start_clock(self, action):
+        now = self._clock()
+        if self._started is None:
+            self._started = now
+        elif self._stopped is not None:
+            self._pause_time += now - self._stopped
+        self._stopped = None
+        self._pause_history.append(TrainingMachine.PauseEntry(action, now))
+
+    def _stop_clock(self, action):
+        now = self._clock()
+        self._stopped = now
+        self._pause_history.append(TrainingMachine.PauseEntry(action, now))
+
+    def _notify(self, method, *args):
+        if self._changes is not None:
+            self._changes.append(Change(method, args))
+            return
+        for observer in self._observers:
+            getattr(observer, method)(self, *args)
 
-        if not self._pause_history:
-            return timedelta(0)
-
-        # Sort all inputs by input time
-        # keystrokes = sorted(self._keystrokes(), key=lambda ks: ks.time)
-
-        overall = datetime.utcnow() - self._pause_history[0].time
-
-        pause_time = timedelta(0)
-
-        # make a deep copy of the pause history
-        history = copy.deepcopy(self._pause_history)
-        # pop last event if we are still running or just started
-        if history[-1].action in ['start', 'unpause']:
-            history.pop()
-
-        def pairs(iterable):
-            it = iter(iterable)
-            return zip(it, it)
-
-        for start, stop in pairs(history):
-            pause_time += (stop.time - start.time)
-
-        return overall - pause_time
-
-    def _notify(self, method, *args, **kwargs):
+    def _notify_batch(self, changes):
         for observer in self._observers:
-            getattr(observer, method)(self, *args, **kwargs)
+            on_batch = getattr(observer, 'on_batch', None)
+            if on_batch is not None:
+                on_batch(self, changes)
+            else:
+                for method, args in changes:
+                    getattr(observer, method)(self, *args)
+
+    def _record(self, index, char):
+        """ Record a key stroke at the given index and update the running statistics. """
+        log = self._log
+        expected = ord(self._chars[index])
+        was_hit = log.last_code(index) == expected
+        log.append(index, char, self.elapsed_ns())
+
+        if char == '<UNDO>':
+            self._undos += 1
+            if self.undo_typo:
+                self._typos += 1
+        else:
+            self._keystrokes += 1
+            if char != self._chars[index]:
+                self._typos += 1
+
+        self._hits += (log.last_code(index) == expected) - was_hit
 
     def _reset(self):
         self._state_fn = self._state_pause
-        for char in self._text:
-            char.keystrokes.clear()
+        self._log.clear()
+        self._pause_history.clear()
+        self._started = None
+        self._stopped = None
+        self._pause_time = 0
+        self._hits = 0
+        self._keystrokes = 0
+        self._undos = 0
+        self._typos = 0
 
     def _state_input(self, event):
         if event.type == 'pause':
             self._state_fn = self._state_pause
-            self._pause_history.append(TrainingMachine.PauseEntry('pause', datetime.utcnow()))
+            self._stop_clock('pause')
             self._notify('on_pause')
 
         elif event.type == 'undo':
             if event.index > 0:
-                self._text[event.index - 1].append('<UNDO>', self.elapsed())
+                self._record(event.index - 1, '<UNDO>')
 
                 # report wrong undos if desired
                 if self.undo_typo:
-                    self._notify('on_miss', event.index - 1, '<UNDO>', self._text[event.index - 1].char)
+                    self._notify('on_miss', event.index - 1, '<UNDO>', self._chars[event.index - 1])
 
-                self._notify('on_undo', event.index - 1, self._text[event.index - 1].char)
+                self._notify('on_undo', event.index - 1, self._chars[event.index - 1])
 
         elif event.type == 'input':
             # Note that this may produce an IndexError. Let it happen! It's a bug in the caller.
-            if self._text[event.index].char == event.char:  # hit
-                self._text[event.index].append(event.char, self.elapsed())
+            if self._chars[event.index] == event.char:  # hit
+                self._record(event.index, event.char)
                 self._notify('on_hit', event.index, event.char)
 
-                if event.index == self._text[-1].index:
+                if event.index == len(self._chars) - 1:
                     self._state_fn = self._state_end
-                    self._pause_history.append(TrainingMachine.PauseEntry('stop', datetime.utcnow()))
+                    self._stop_clock('stop')
                     self._notify('on_end')
 
             else:  # miss
-                if self._text[event.index].char == '\n':  # misses at line ending
+                if self._chars[event.index] == '\n':  # misses at line ending
                     return  # TODO: Make misses on line ending configurable
 
                 if event.char == '\n':  # 'Return' hits in line
                     # TODO: Make misses on wrong returns configurable
                     return
 
-                self._text[event.index].append(event.char, self.elapsed())
-                self._notify('on_miss', event.index, event.char, self._text[event.index].char)
+                self._record(event.index, event.char)
+                self._notify('on_miss', event.index, event.char, self._chars[event.index])
 
     def _state_pause(self, event):
         if event.type == 'unpause' or (event.type == 'input' and self.auto_unpause):
             self._state_fn = self._state_input
-            if self._pause_history:
-                # Only append start time if we've already had a pause event.
-                # Currently we're detecting the start view first keystroke time.
-                self._pause_history.append(TrainingMachine.PauseEntry('unpause', datetime.utcnow()))
-            else:
-                self._pause_history.append(TrainingMachine.PauseEntry('start', datetime.utcnow()))
+            # The first unpause starts the clock.
+            # Currently we're detecting the start view first keystroke time.
+            self._start_clock('unpause' if self._pause_history else 'start')
             self._notify('on_unpause')
             if event.type == 'input' and self.auto_unpause:
                 # Auto transition to input state
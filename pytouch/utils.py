@@ -15,3 +15,23 @@ class cached_property(object):
             return self
         value = obj.__dict__[self.func.__name__] = self.func(obj)
         return value
+
+
+class cached_classproperty(object):
+    """ A class attribute that is computed on first access and then replaces itself with an ordinary
+    attribute of the class it is defined in. Subclasses can still override it with a plain attribute.
+    """
+
+    def __init__(self, func):
+        self.__doc__ = getattr(func, '__doc__')
+        self.func = func
+        self.owner = None
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, obj, cls):
+        value = self.func(self.owner)
+        setattr(self.owner, self.name, value)
+        return value
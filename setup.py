@@ -17,10 +17,14 @@ setup(
     # Bootstrap nose to be able to replace setuptools test command by nosetests
     setup_requires=['nose>=1.0'],
     install_requires=[
-        'SQLAlchemy',
+        'SQLAlchemy>=1.2',
         'lxml',
         'blinker',
     ],
+    extras_require={
+        # Vectorised typing analytics
+        'analytics': ['numpy'],
+    },
     tests_require=['coverage'],
     entry_points={
         'console_scripts': [
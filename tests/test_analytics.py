@@ -0,0 +1,155 @@
+import os
+import random
+import tempfile
+from unittest import SkipTest
+
+from nose.tools import eq_, assert_almost_equal
+
+from sqlalchemy import create_engine
+
+from pytouch import analytics
+from pytouch.analytics import Analytics
+from pytouch.model import Session, Lesson
+from pytouch.model.super import Base
+from pytouch.recorder import SessionRecorder
+from pytouch.replay import VirtualClock
+from pytouch.trainingmachine import TrainingMachine, Event
+
+TEXT = 'ffj'
+
+
+def type_text(tm, clock, strokes, index=0):
+    """ Type (time in microseconds, char) pairs starting at index, which is tracked like the training widget does. """
+    for time, char in strokes:
+        clock.now = time * 1000
+        if char == '<UNDO>':
+            tm.process_event(Event.undo_event(index))
+            index -= 1
+        else:
+            tm.process_event(Event.input_event(index, char))
+            index += 1
+    return index
+
+
+def random_session(rng, text, count):
+    """ Create the key strokes of a sloppy typist as (codes, indices, times). """
+    codes, indices, times = list(), list(), list()
+    index, time = 0, 0
+    while len(codes) < count:
+        time += rng.randrange(50000, 2000000)
+        if index and rng.random() < 0.05:
+            index -= 1
+            codes.append(-1)
+        else:
+            codes.append(ord(text[index]) if rng.random() < 0.9 else ord('x'))
+            index = (index + 1) % len(text)
+        indices.append(index if codes[-1] == -1 else (index - 1) % len(text))
+        times.append(time)
+    return codes, indices, times
+
+
+class TestAnalytics(object):
+    def setup(self):
+        self.clock = VirtualClock()
+        self.tm = TrainingMachine(TEXT, auto_unpause=True, clock=self.clock)
+        type_text(self.tm, self.clock, [(0, 'f'), (100, 'f'), (300, 'x'), (400, '<UNDO>'), (600, 'j'), (800, '\n')])
+        self.uut = Analytics()
+
+    def test_add_machine(self):
+        eq_(self.uut.add_machine(self.tm), 6)
+        eq_(self.uut.strokes, 6)
+        eq_([s.key for s in self.uut.chars()], ['\n', 'f', 'j'])
+        eq_([s.key for s in self.uut.bigrams()], ['ff', 'fj', 'j\n'])
+
+        f = self.uut.char('f')
+        eq_((f.hits, f.misses, f.undos, f.latency.count), (2, 0, 0, 1))
+        nl = self.uut.char('\n').summary('\n')
+        eq_(nl.attempts, 1)
+        assert_almost_equal(nl.mean, 0.2)
+
+        j = self.uut.char('j').summary('j')
+        eq_((j.attempts, j.error_rate, j.undo_rate, j.mean, j.p99), (2, 0.5, 0.5, None, None))
+
+        ff = self.uut.bigram('ff').summary('ff')
+        assert_almost_equal(ff.mean, 0.1)
+        assert_almost_equal(ff.p50, 0.1)
+        eq_(self.uut.bigram('fj').attempts, 2)
+        eq_(self.uut.bigrams(min_attempts=2)[0].key, 'fj')
+
+    def test_incremental(self):
+        self.uut.add_machine(self.tm)
+        self.uut.add_machine(self.tm)
+        eq_(self.uut.strokes, 12)
+        eq_(self.uut.char('f').hits, 4)
+        eq_(self.uut.char('\n').latency.count, 2)
+
+    def test_numpy(self):
+        if analytics.numpy is None:
+            raise SkipTest('numpy is not installed')
+
+        rng = random.Random(0)
+        text = 'the quick brown fox jumps over the lazy dog\n'
+        vectorised, python = Analytics(), Analytics()
+        for _ in range(5):
+            session = random_session(rng, text, 2000)
+            vectorised.add(text, *session, start=10)
+            analytics.numpy, numpy = None, analytics.numpy
+            try:
+                python.add(text, *session, start=10)
+            finally:
+                analytics.numpy = numpy
+
+        eq_(vectorised.chars(), python.chars())
+        eq_(vectorised.bigrams(), python.bigrams())
+        eq_(vectorised.char('o').latency.counts, python.char('o').latency.counts)
+
+    def test_save_load(self):
+        self.uut.add_machine(self.tm)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'analytics.cache')
+            self.uut.save(path)
+            loaded = Analytics.load(path)
+            eq_(loaded.chars(), self.uut.chars())
+            eq_(loaded.bigrams(), self.uut.bigrams())
+            eq_(Analytics.load(path, profile_name='other').strokes, 0)
+        eq_(Analytics.load(path).strokes, 0)
+
+
+class TestAnalyticsUpdate(object):
+    @classmethod
+    def setup_class(cls):
+        cls.e = create_engine('sqlite:///tests.sqlite')
+
+    def setup(self):
+        Base.metadata.drop_all(self.e)
+        Base.metadata.create_all(self.e)
+        self.s = Session(bind=self.e)
+
+        self.lesson = Lesson(title='lesson', text=TEXT)
+        self.s.add(self.lesson)
+        self.s.commit()
+
+    def teardown(self):
+        self.s.close()
+
+    def test_update(self):
+        clock = VirtualClock()
+        tm = TrainingMachine(TEXT, auto_unpause=True, clock=clock)
+        recorder = SessionRecorder(self.e, lesson=self.lesson)
+        tm.add_observer(recorder)
+        uut = Analytics()
+
+        index = type_text(tm, clock, [(0, 'f'), (100, 'f')])
+        tm.process_event(Event.pause_event())
+        recorder.flush(tm).result()
+        eq_(uut.update(self.s), 2)
+        eq_(uut.update(self.s), 0)
+
+        type_text(tm, clock, [(300, 'j'), (500, '\n')], index)
+        recorder.close()
+        eq_(uut.update(self.s), 2)
+
+        expect = Analytics()
+        expect.add_machine(tm)
+        eq_(uut.chars(), expect.chars())
+        eq_(uut.bigrams(), expect.bigrams())
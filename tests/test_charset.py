@@ -0,0 +1,48 @@
+from nose.tools import eq_
+
+from sqlalchemy import create_engine
+
+from pytouch.charset import Alphabets, key_chars, encode, decode
+from pytouch.model import Session, Meta
+from pytouch.model.super import Base
+
+
+class TestCharset(object):
+    @classmethod
+    def setup_class(cls):
+        cls.e = create_engine('sqlite:///tests.sqlite')
+
+    def setup(self):
+        Base.metadata.drop_all(self.e)
+        Base.metadata.create_all(self.e)
+        self.s = Session(bind=self.e)
+
+    def teardown(self):
+        self.s.close()
+
+    def test_key_chars(self):
+        eq_(key_chars('ab a\nb\tc'), {'a', 'b', 'c'})
+        eq_(key_chars(None), set())
+
+    def test_encode(self):
+        for bitmap in (0, 1, 255, 256, 2 ** 121 + 5):
+            eq_(decode(encode(bitmap)), bitmap)
+        eq_(encode(0), b'')
+
+    def test_signature(self):
+        uut = Alphabets(self.s)
+        eq_(decode(uut.signature('de', 'fj jf')), 0b11)
+        eq_(decode(uut.signature('de', 'dk fj')), 0b1111)
+        eq_(uut.alphabet('de'), 'fjdk')
+        # Every layout has its own alphabet
+        eq_(decode(uut.signature('us', 'k')), 0b1)
+        self.s.commit()
+
+        # Alphabets are persisted and only grow
+        uut = Alphabets(Session(bind=self.e))
+        eq_(uut.alphabet('de'), 'fjdk')
+        eq_(decode(uut.signature('de', 'af')), 0b10001)
+        eq_(uut.alphabet('de'), 'fjdka')
+        eq_(uut.mask('de', 'k a x'), (0b11000, {'x'}))
+        eq_(uut.mask('fr', 'a'), (0, {'a'}))
+        eq_(self.s.query(Meta).count(), 2)
@@ -0,0 +1,125 @@
+import random
+
+from nose.tools import eq_, ok_, assert_raises
+
+from sqlalchemy import create_engine
+
+from pytouch.analytics import Analytics
+from pytouch.drill import NgramIndex, weakest
+from pytouch.model import Session, Course, Lesson, DrillIndex
+from pytouch.model.super import Base
+from pytouch.trainingmachine import TrainingMachine
+
+TEXTS = ['fjf jfj fj jf', 'the quick brown fox\njumps over the lazy dog', None, 'quick quick fox']
+
+
+class TestNgramIndex(object):
+    def setup(self):
+        self.uut = NgramIndex.build(TEXTS)
+
+    def test_build(self):
+        eq_(len(self.uut), 12)
+        eq_(self.uut.counts[self.uut.words.index('quick')], 3)
+        eq_(sorted(self.uut.words[n] for n in self.uut.postings['qu']), ['quick'])
+        eq_(sorted(self.uut.words[n] for n in self.uut.postings['j']), ['fj', 'fjf', 'jf', 'jfj', 'jumps'])
+        eq_(sorted(self.uut.words[n] for n in self.uut.postings['fj']), ['fj', 'fjf', 'jfj'])
+
+    def test_serialize(self):
+        loaded = NgramIndex.loads(self.uut.dumps())
+        eq_(loaded.words, self.uut.words)
+        eq_(loaded.counts, self.uut.counts)
+        eq_(loaded.postings, self.uut.postings)
+
+    def test_scores(self):
+        scores = self.uut.scores({'o': 1, 'ox': 2})
+        eq_({self.uut.words[n]: score for n, score in scores.items()}, {'brown': 1, 'fox': 3, 'over': 1, 'dog': 1})
+
+    def test_drill(self):
+        lesson = self.uut.drill({'o': 1, 'ox': 2}, length=200, line_length=20, rng=random.Random(0))
+        eq_(lesson.new_chars, 'ox')
+        ok_(len(lesson.text) >= 200)
+        for line in lesson.lines:
+            ok_(0 < len(line) <= 20)
+            for word in line.split(' '):
+                ok_('o' in word)
+
+        tm = TrainingMachine.from_lesson(lesson)
+        eq_(tm.text, lesson.text + '\n')
+
+    def test_drill_fallback(self):
+        lesson = self.uut.drill({'ä': 1}, length=50, rng=random.Random(0))
+        ok_(len(lesson.text) >= 50)
+        ok_(set(lesson.text.split()) <= set(self.uut.words))
+        assert_raises(ValueError, NgramIndex.build([]).drill, {})
+
+    def test_drill_zero_weights(self):
+        # Only a single word has a positive score, it is repeated
+        lesson = self.uut.drill({'qu': 1, 'o': 0}, length=20, rng=random.Random(0))
+        eq_(set(lesson.text.split()), {'quick'})
+        lesson = self.uut.drill({'o': 0}, length=20, rng=random.Random(0))
+        ok_(set(lesson.text.split()) <= set(self.uut.words))
+
+
+class TestDrillIndex(object):
+    @classmethod
+    def setup_class(cls):
+        cls.e = create_engine('sqlite:///tests.sqlite')
+
+    def setup(self):
+        Base.metadata.drop_all(self.e)
+        Base.metadata.create_all(self.e)
+        self.s = Session(bind=self.e)
+
+        self.course = Course(title='course')
+        self.course.lessons = [Lesson(title=str(i), text=text) for i, text in enumerate(TEXTS)]
+        self.s.add(self.course)
+        self.s.commit()
+
+    def teardown(self):
+        self.s.close()
+
+    def test_for_course(self):
+        uut = NgramIndex.for_course(self.s, self.course.uuid)
+        eq_(len(uut), 12)
+        self.s.commit()
+        eq_(self.s.query(DrillIndex).count(), 1)
+
+        # The stored index is used, even if the texts changed
+        self.course.lessons[0].text = 'changed'
+        self.s.commit()
+        eq_(NgramIndex.for_course(self.s, self.course.uuid).words, uut.words)
+
+        # An outdated index is rebuilt
+        self.s.query(DrillIndex).one().version = 0
+        eq_(len(NgramIndex.for_course(self.s, self.course.uuid)), 9)
+
+        self.s.delete(self.course)
+        self.s.commit()
+        eq_(self.s.query(DrillIndex).count(), 0)
+
+    def test_for_unknown_course(self):
+        assert_raises(ValueError, NgramIndex.for_course, self.s, 'unknown')
+        self.s.commit()
+        eq_(self.s.query(DrillIndex).count(), 0)
+
+
+class TestWeakest(object):
+    def test_weakest(self):
+        uut = Analytics()
+        text = 'fj fj fj fj fj fj\n'
+        codes, indices, times = list(), list(), list()
+        for i, c in enumerate(text):
+            if c == 'j':
+                # A typo and its undo before every j
+                codes.extend((ord('x'), -1))
+                indices.extend((i, i))
+                times.extend((i * 10 ** 9, i * 10 ** 9 + 1))
+            codes.append(ord(c))
+            indices.append(i)
+            times.append(i * 10 ** 9 + 2)
+        uut.add(text, codes, indices, times)
+
+        weights = weakest(uut, limit=2)
+        eq_(sorted(weights), ['fj', 'j'])
+        eq_(weights['j'], 11)
+        eq_(weakest(uut, min_attempts=100), {})
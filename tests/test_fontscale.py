@@ -0,0 +1,40 @@
+from nose.tools import eq_, ok_
+
+from pytouch.gui.tk.fontscale import FontScaler
+
+
+class TestFontScaler(object):
+    def setup(self):
+        self.calls = 0
+        self.uut = FontScaler(self.measure, extra=25)
+
+    def measure(self, size, line):
+        """ Mimic hinting, glyphs are a rounded 0.6 size wide. """
+        self.calls += 1
+        return int(size * 0.6 + 0.5) * len(line)
+
+    def fits(self, size, width, line):
+        return self.measure(size, line) + 25 <= width
+
+    def test_fit(self):
+        line = 'f' * 60
+        for width in range(100, 2000, 37):
+            size = self.uut.fit(width, line, 40)
+            ok_(size == 1 or self.fits(size, width, line), width)
+            ok_(not self.fits(size + 1, width, line), width)
+
+    def test_cache(self):
+        line = 'f' * 60
+        size = self.uut.fit(1000, line, 40)
+        calls = self.calls
+        eq_(self.uut.fit(1000, line, size), size)
+        eq_(self.calls, calls)
+        eq_(self.uut.measurements, calls)
+
+        # The ratio is kept, a new width is solved from it
+        self.uut.fit(1200, line, size)
+        ok_(self.calls - calls <= 3)
+
+    def test_minimum(self):
+        eq_(self.uut.fit(10, 'f' * 60, 40), 1)
+        eq_(self.uut.fit(100, '', 40), 40)
@@ -0,0 +1,56 @@
+from nose.tools import eq_, assert_raises
+
+from pytouch.histogram import Histogram
+
+
+class TestHistogram(object):
+    def setup(self):
+        self.uut = Histogram(significant_bits=4, max_value=2 ** 20)
+
+    def test_buckets(self):
+        previous = -1
+        for value in range(2 ** 12):
+            bucket = self.uut.bucket(value)
+            low, high = self.uut.bucket_range(bucket)
+            assert low <= value <= high
+            assert bucket in (previous, previous + 1)
+            assert high - low <= value / 8
+            previous = bucket
+        eq_(len(self.uut.counts), self.uut.bucket(2 ** 20) + 1)
+
+    def test_empty(self):
+        eq_(self.uut.count, 0)
+        eq_(self.uut.mean, None)
+        eq_(self.uut.percentile(50), None)
+
+    def test_record(self):
+        for value in range(1, 101):
+            self.uut.record(value * 1000)
+        eq_(self.uut.count, 100)
+        eq_(self.uut.min, 1000)
+        eq_(self.uut.max, 100000)
+        eq_(self.uut.mean, 50500)
+        for percent in (1, 50, 90, 99):
+            exact = percent * 1000
+            assert exact <= self.uut.percentile(percent) <= exact * 1.125
+        eq_(self.uut.percentile(100), 100000)
+
+    def test_clamp(self):
+        self.uut.record(2 ** 30)
+        self.uut.record(-5)
+        eq_(self.uut.counts[-1], 1)
+        eq_(self.uut.counts[0], 1)
+        eq_(self.uut.max, 2 ** 30)
+        eq_(self.uut.percentile(100), 2 ** 30)
+
+    def test_merge(self):
+        other = Histogram(significant_bits=4, max_value=2 ** 20)
+        for value in (3, 300, 30000):
+            self.uut.record(value)
+            other.record(value * 2)
+        self.uut.merge(other)
+        eq_(self.uut.count, 6)
+        eq_(self.uut.total, 3 * 30303)
+        eq_(self.uut.min, 3)
+        eq_(self.uut.max, 60000)
+        assert_raises(ValueError, self.uut.merge, Histogram())
@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+
+from nose.tools import eq_, ok_
+
+from pytouch.trainingmachine import TrainingMachine, Event
+from pytouch.gui.tk.latency import KeyLatency, STAGES
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, us):
+        self.now += us * 1000
+
+
+class SlowObserver(object):
+    """ An observer taking 200 us per callback. """
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def __getattr__(self, name):
+        return lambda *args: self.clock.advance(200)
+
+
+class TestKeyLatency(object):
+    def setup(self):
+        self.clock = Clock()
+        self.uut = KeyLatency(clock=self.clock)
+        self.tm = self.machine('fjj')
+        self.dir = tempfile.TemporaryDirectory()
+
+    def machine(self, text):
+        tm = TrainingMachine(text, auto_unpause=True)
+        tm.add_observer(self.uut)
+        tm.add_observer(SlowObserver(self.clock))
+        return tm
+
+    def teardown(self):
+        self.dir.cleanup()
+
+    def press(self, char, event_time=None, queued_us=0, index=None):
+        self.clock.advance(queued_us)
+        self.uut.key_press(event_time)
+        self.clock.advance(50)
+        self.tm.process_event(Event.input_event(len(self.tm.log) if index is None else index, char))
+        self.uut.processed()
+
+    def test_stages(self):
+        # The first key is handled right away, it synchronizes the clocks
+        self.clock.now = 10 ** 9
+        self.press('f', event_time=5000)
+        self.clock.advance(1000)
+        self.uut.painted()
+        eq_(self.uut.count, 1)
+        eq_(self.uut.histograms['queue'].max, 0)
+        eq_(self.uut.histograms['machine'].max, 50)
+        # The unpause and the hit
+        eq_(self.uut.histograms['observers'].max, 400)
+        eq_(self.uut.histograms['paint'].max, 1000)
+        eq_(self.uut.histograms['total'].max, 1450)
+
+        # The second key waited 3 ms in the queue
+        self.clock.now = 10 ** 9 + 2 * 1000000
+        self.press('x', event_time=5002, queued_us=3000)
+        self.press('j', queued_us=100)
+        eq_(self.uut.count, 1)
+        self.uut.painted()
+        eq_(self.uut.count, 3)
+        eq_(self.uut.histograms['queue'].max, 3000)
+        eq_(self.uut.histograms['paint'].min, 0)
+
+    def test_ignored(self):
+        self.tm = self.machine('f\nj')
+        self.press('f')
+        self.uut.painted()
+        # A miss at the line end is ignored by the machine, nothing is drawn for it
+        self.press('x', index=1)
+        eq_(self.uut.histograms['queue'].count, 1)
+        self.clock.advance(5 * 1000000)
+        self.press('\n', index=1)
+        self.clock.advance(1000)
+        self.uut.painted()
+        eq_(self.uut.count, 2)
+        eq_(self.uut.histograms['total'].max, 1250)
+
+    def test_ignored_unpause(self):
+        self.tm = self.machine('f\nj')
+        self.press('f')
+        self.uut.painted()
+        self.tm.process_event(Event.pause_event())
+        # A miss at the line end unpauses the machine but nothing is drawn for it
+        self.press('x', index=1)
+        eq_(self.uut.histograms['queue'].count, 1)
+        self.clock.advance(5 * 1000000)
+        self.press('\n', index=1)
+        self.uut.painted()
+        eq_(self.uut.count, 2)
+        # The slowest key is the first one with its unpause, the think time before the line feed is not counted
+        eq_(self.uut.histograms['total'].max, 450)
+
+    def test_offset(self):
+        # A later event handled faster lowers the offset between the clocks
+        self.clock.now = 10 ** 9
+        self.uut.key_press(100)
+        self.uut.on_hit(None, 0, 'f')
+        self.uut.processed()
+        self.clock.now = 10 ** 9 + 10 * 1000000
+        self.uut.key_press(120)
+        self.uut.on_hit(None, 1, 'j')
+        self.uut.processed()
+        eq_(self.uut.histograms['queue'].min, 0)
+        eq_(self.uut.histograms['queue'].max, 0)
+
+    def test_export(self):
+        path = os.path.join(self.dir.name, 'latency.jsonl')
+        self.uut.export(path)
+        ok_(not os.path.exists(path))
+
+        for char in 'fj':
+            self.press(char)
+        self.uut.painted()
+        self.uut.export(path, lesson='l1')
+        eq_(self.uut.count, 0)
+        self.press('f')
+        self.uut.painted()
+        self.uut.export(path, lesson='l2')
+
+        with open(path, encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        eq_([r['lesson'] for r in records], ['l1', 'l2'])
+        eq_(sorted(records[0]['stages']), sorted(STAGES))
+        eq_(records[0]['stages']['total']['count'], 2)
+        eq_(records[0]['stages']['machine']['max'], 0.05)
@@ -1,10 +1,13 @@
+import os
+import tempfile
 from random import randrange
 
-from nose.tools import eq_
+from nose.tools import eq_, assert_raises
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 
-from pytouch.model import Session, Course, LessonList, Lesson, Profile, Meta
+from pytouch.model import Session, Course, LessonList, Lesson, Profile, Meta, get_engine, sqlite_pragmas, create_db
+from pytouch.model.search import has_search_index, drop_search_index
 from pytouch.model.super import Base
 
 
@@ -77,3 +80,174 @@ class TestModel(object):
         # therefore the we can expect 9 lessons when we access the uut.
         eq_(9, len(uut.lessons))
         eq_(9, len(self.s.query(Course).one().lessons))
+
+    def _count_queries(self):
+        queries = list()
+        event.listen(self.e, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+        return queries
+
+    def test_find_all(self):
+        for c in range(3):
+            course = Course(title='course {}'.format(c))
+            course.lessons = [Lesson(title=i, text='text {} {}'.format(c, i)) for i in range(10)]
+            self.s.add(course)
+        self.s.commit()
+        self.s.close()
+
+        queries = self._count_queries()
+        courses = Course.find_all(self.s).all()
+        titles = [[lesson.title for lesson in course.lessons] for course in courses]
+
+        eq_(titles, [[str(i) for i in range(10)]] * 3)
+        eq_(len(queries), 3)
+        # Lesson texts are deferred
+        eq_('text' in inspect(courses[0].lessons[0]).unloaded, True)
+
+        eq_(courses[0].lessons[0].text, 'text 0 0')
+        eq_(len(queries), 4)
+
+    def test_find_all_with_text(self):
+        course = Course(title='course')
+        course.lessons = [Lesson(title=i, text=str(i)) for i in range(10)]
+        self.s.add(course)
+        self.s.commit()
+        uuid = course.uuid
+        self.s.close()
+
+        queries = self._count_queries()
+        course = Course.find(self.s, uuid, with_text=True)
+        eq_([lesson.text for lesson in course.lessons], [str(i) for i in range(10)])
+        eq_(len(queries), 3)
+
+
+class TestLesson(object):
+    @staticmethod
+    def _positions(text):
+        line = 0
+        column = 0
+        rv = list()
+        for c in text:
+            rv.append((line, column))
+            column += 1
+            if c == '\n':
+                line += 1
+                column = 0
+        return rv
+
+    def test_position(self):
+        for lesson_text in ('f j\nf', 'f j\nf\n', '\n\nab\n\nc', 'a'):
+            uut = Lesson(text=lesson_text)
+            for i, expect in enumerate(self._positions(lesson_text)):
+                eq_(uut.position(i), expect)
+                eq_(uut.position(i, (1, 2)), (expect[0] + 1, expect[1] + 2))
+                eq_(uut.index(*expect), i)
+                eq_(uut.index(expect[0] + 1, expect[1] + 2, (1, 2)), i)
+            eq_(uut.position(-1), self._positions(lesson_text)[-1])
+            assert_raises(IndexError, uut.position, len(lesson_text))
+            assert_raises(IndexError, uut.position, -len(lesson_text) - 1)
+
+        uut = Lesson(text='ab\nc')
+        assert_raises(IndexError, uut.index, 0, 3)
+        assert_raises(IndexError, uut.index, 1, 1)
+        assert_raises(IndexError, uut.index, 2, 0)
+        assert_raises(IndexError, uut.index, 0, -1)
+
+    def test_longest_line(self):
+        uut = Lesson(text='zz\nabcd\nb')
+        eq_(uut.longest_line, 'abcd')
+        eq_(uut.longest_line_len, 4)
+
+
+class TestEngine(object):
+    def test_sqlite_pragmas(self):
+        eq_(sqlite_pragmas({}), [])
+        eq_(sqlite_pragmas({'sqlite.profile': 'performance', 'sqlite.cache_size': -100, 'sqlite.busy_timeout': '10'}), [
+            ('journal_mode', 'WAL'),
+            ('synchronous', 'NORMAL'),
+            ('cache_size', '-100'),
+            ('mmap_size', '268435456'),
+            ('temp_store', 'MEMORY'),
+            ('busy_timeout', '10'),
+        ])
+        assert_raises(ValueError, sqlite_pragmas, {'sqlite.profile': 'unknown'})
+        assert_raises(ValueError, sqlite_pragmas, {'sqlite.page_size': '1'})
+        assert_raises(ValueError, sqlite_pragmas, {'sqlite.synchronous': 'OFF; DROP TABLE tblLesson'})
+
+    def test_profile(self):
+        # WAL mode is persisted in the database file, keep it away from the shared test database
+        with tempfile.TemporaryDirectory() as path:
+            engine = get_engine({'sqlalchemy.url': 'sqlite:///' + os.path.join(path, 'profile.sqlite'),
+                                 'sqlite.profile': 'performance', 'sqlite.cache_size': '-100'})
+            with engine.connect() as connection:
+                eq_(connection.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+                eq_(connection.execute(text('PRAGMA cache_size')).scalar(), -100)
+                eq_(connection.execute(text('PRAGMA foreign_keys')).scalar(), 1)
+            engine.dispose()
+
+
+class TestCreateDb(object):
+    def test_add_missing_columns(self):
+        engine = create_engine('sqlite:///tests.sqlite')
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE tblLesson DROP COLUMN cCharset'))
+        create_db(engine)
+        eq_('cCharset' in [column['name'] for column in inspect(engine).get_columns('tblLesson')], True)
+        engine.dispose()
+
+
+class TestSearchIndex(object):
+    @classmethod
+    def setup_class(cls):
+        cls.e = create_engine('sqlite:///tests.sqlite')
+
+    def setup(self):
+        Base.metadata.drop_all(self.e)
+        Base.metadata.create_all(self.e)
+        self.s = Session(bind=self.e)
+
+    def teardown(self):
+        self.s.close()
+
+    def match(self, query):
+        return sorted(row[0] for row in self.s.execute(text(
+            'SELECT m.pkLessonUuid FROM tblLessonSearch JOIN tblLessonSearchMap m ON m.cSearchId = tblLessonSearch.rowid '
+            'WHERE tblLessonSearch MATCH :query'), {'query': query}))
+
+    def test_triggers(self):
+        course = Course(title='course')
+        course.lessons = [Lesson(uuid='a', title='first', text='alpha beta'), Lesson(uuid='b', title='second', new_chars='äö', text='beta gamma')]
+        self.s.add(course)
+        self.s.commit()
+        eq_(self.match('beta'), ['a', 'b'])
+        eq_(self.match('title:second'), ['b'])
+        eq_(self.match('äö'), ['b'])
+
+        course.lessons[0].text = 'delta'
+        self.s.commit()
+        eq_(self.match('beta'), ['b'])
+        eq_(self.match('delta'), ['a'])
+
+        # Bulk statements and cascades are covered by the triggers as well
+        self.s.bulk_update_mappings(Lesson, [dict(uuid='b', text='epsilon')])
+        self.s.commit()
+        eq_(self.match('epsilon'), ['b'])
+        self.s.query(Lesson).filter(Lesson.uuid == 'a').delete(synchronize_session=False)
+        self.s.commit()
+        eq_(self.match('delta'), [])
+        eq_(self.s.execute(text('SELECT count(*) FROM tblLessonSearchMap')).scalar(), 1)
+
+    def test_create_existing(self):
+        self.s.add(Lesson(uuid='a', title='first', text='alpha'))
+        self.s.commit()
+        with self.e.begin() as connection:
+            drop_search_index(connection)
+            eq_(has_search_index(connection), False)
+        create_db(self.e)
+        eq_(self.match('alpha'), ['a'])
+
+        # The index is dropped with the lessons
+        Base.metadata.drop_all(self.e)
+        with self.e.connect() as connection:
+            eq_(has_search_index(connection), False)
@@ -0,0 +1,111 @@
+from nose.tools import eq_
+
+from sqlalchemy import create_engine
+
+from pytouch.model import Session, Lesson, Profile, TrainingSession, KeyStroke
+from pytouch.model.super import Base
+from pytouch.recorder import SessionRecorder
+from pytouch.trainingmachine import TrainingMachine, Event
+
+TEXT = 'f j\nf'
+
+
+class FailingEngine(object):
+    """ An engine whose first transaction fails. """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.failures = 1
+
+    def begin(self):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is locked')
+        return self.engine.begin()
+
+
+class TestSessionRecorder(object):
+    @classmethod
+    def setup_class(cls):
+        cls.e = create_engine('sqlite:///tests.sqlite')
+
+    def setup(self):
+        Base.metadata.drop_all(self.e)
+        Base.metadata.create_all(self.e)
+        self.s = Session(bind=self.e)
+
+        self.lesson = Lesson(title='lesson', text=TEXT)
+        self.profile = Profile(name='profile')
+        self.s.add_all([self.lesson, self.profile])
+        self.s.commit()
+
+        self.tm = TrainingMachine(TEXT, auto_unpause=True)
+        self.uut = SessionRecorder(self.e, lesson=self.lesson, profile=self.profile)
+        self.tm.add_observer(self.uut)
+
+    def teardown(self):
+        self.uut.close()
+        self.s.close()
+
+    def test_record(self):
+        self.tm.process_event(Event.input_event(0, 'f'))
+        self.tm.process_event(Event.input_event(1, 'x'))
+        self.tm.process_event(Event.pause_event())
+        self.uut.close()
+
+        session = self.s.query(TrainingSession).one()
+        eq_(session.uuid, self.uut.session_uuid)
+        eq_(session.lesson, self.lesson)
+        eq_(session.profile, self.profile)
+        eq_(session.finished, False)
+        eq_(session.hits, 1)
+        eq_(session.keystrokes, 2)
+        eq_(session.elapsed, self.tm.elapsed_ns())
+        eq_([(ks.index, ks.char, ks.time) for ks in session.strokes],
+            list(zip(self.tm.log.indices, ['f', 'x'], self.tm.log.times)))
+
+    def test_record_end(self):
+        self.tm.process_event(Event.input_event(0, 'f'))
+        self.tm.process_event(Event.pause_event())
+        self.tm.process_event(Event.unpause_event())
+        self.tm.process_event(Event.undo_event(1))
+        for i, c in enumerate(TEXT + '\n'):
+            self.tm.process_event(Event.input_event(i, c))
+        self.uut.close()
+
+        session = self.s.query(TrainingSession).one()
+        eq_(session.finished, True)
+        eq_(session.hits, len(TEXT) + 1)
+        eq_([ks.char for ks in session.strokes], ['f', '<UNDO>'] + list(TEXT + '\n'))
+
+    def test_failed_create(self):
+        self.uut.close()
+        self.tm = TrainingMachine(TEXT, auto_unpause=True)
+        self.uut = SessionRecorder(FailingEngine(self.e), lesson=self.lesson, profile=self.profile)
+        self.tm.add_observer(self.uut)
+
+        self.tm.process_event(Event.input_event(0, 'f'))
+        self.tm.process_event(Event.pause_event())
+        # Neither the session nor its key strokes were written, the next write writes them
+        self.tm.process_event(Event.unpause_event())
+        self.tm.process_event(Event.input_event(1, ' '))
+        self.tm.process_event(Event.pause_event())
+        self.uut.close()
+
+        session = self.s.query(TrainingSession).one()
+        eq_(session.uuid, self.uut.session_uuid)
+        eq_(session.keystrokes, 2)
+        eq_([ks.char for ks in session.strokes], ['f', ' '])
+
+    def test_restart(self):
+        for i, c in enumerate(TEXT + '\n'):
+            self.tm.process_event(Event.input_event(i, c))
+        first = self.uut.session_uuid
+        self.tm.process_event(Event.restart_event())
+        self.tm.process_event(Event.input_event(0, 'f'))
+        self.tm.process_event(Event.pause_event())
+        self.uut.close()
+
+        eq_(self.s.query(TrainingSession).count(), 2)
+        eq_(self.s.query(KeyStroke).filter(KeyStroke.session_uuid == first).count(), len(TEXT) + 1)
+        eq_(self.s.query(KeyStroke).filter(KeyStroke.session_uuid == self.uut.session_uuid).count(), 1)
@@ -0,0 +1,171 @@
+from nose.tools import eq_, ok_, assert_raises
+
+from pytouch.gui.tk.render import RenderScheduler
+
+
+class FakeWidget(object):
+    """ Records scheduled callbacks instead of running a Tk event loop. """
+
+    def __init__(self):
+        self.idle = list()
+        self.timers = list()
+        self._next_id = 0
+
+    def _add(self, queue, callback):
+        self._next_id += 1
+        queue.append((self._next_id, callback))
+        return self._next_id
+
+    def after_idle(self, callback):
+        return self._add(self.idle, callback)
+
+    def after(self, ms, callback):
+        return self._add(self.timers, callback)
+
+    def after_cancel(self, callback_id):
+        self.idle = [(i, c) for i, c in self.idle if i != callback_id]
+        self.timers = [(i, c) for i, c in self.timers if i != callback_id]
+
+    def run_idle(self):
+        idle, self.idle = self.idle, list()
+        for _, callback in idle:
+            callback()
+
+    def run_timers(self):
+        timers, self.timers = self.timers, list()
+        for _, callback in timers:
+            callback()
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRenderScheduler(object):
+    def setup(self):
+        self.widget = FakeWidget()
+        self.clock = Clock()
+        self.applied = list()
+        self.stats = 0
+
+    def create(self, mode):
+        return RenderScheduler(self.widget, self.apply_chars, self.apply_stats, mode=mode, clock=self.clock)
+
+    def apply_chars(self, runs, cursor):
+        self.applied.append((runs, cursor))
+
+    def apply_stats(self):
+        self.stats += 1
+
+    def test_unknown_mode(self):
+        with assert_raises(ValueError):
+            self.create('never')
+
+    def test_runs(self):
+        eq_(RenderScheduler.runs({}), [])
+        chars = {3: ('c', 'hit'), 1: ('a', 'hit'), 2: ('b', 'hit'), 4: ('x', 'miss'), 6: ('e', 'hit')}
+        eq_(RenderScheduler.runs(chars), [(1, 'abc', 'hit'), (4, 'x', 'miss'), (6, 'e', 'hit')])
+
+    def test_immediate(self):
+        uut = self.create('immediate')
+        uut.char(0, 'a', 'hit', 1)
+        uut.stats()
+        eq_(self.applied, [([(0, 'a', 'hit')], 1)])
+        eq_(self.stats, 1)
+        ok_(not uut.pending)
+
+    def test_idle(self):
+        uut = self.create('idle')
+        for index, char in enumerate('abc'):
+            uut.input()
+            uut.char(index, char, 'hit', index + 1)
+            uut.stats()
+        ok_(uut.pending)
+        eq_(uut.cursor, 3)
+        eq_(self.applied, [])
+        eq_(len(self.widget.idle), 1)
+
+        self.widget.run_idle()
+        eq_(self.applied, [([(0, 'abc', 'hit')], 3)])
+        eq_(self.stats, 1)
+        eq_(uut.frames, 1)
+        ok_(not uut.pending)
+        eq_(uut.cursor, None)
+
+    def test_frame(self):
+        uut = self.create('frame')
+        uut.char(0, 'x', 'miss', 1)
+        uut.char(0, 'a', 'untyped', 0)
+        uut.char(0, 'a', 'hit', 1)
+        eq_(len(self.widget.timers), 1)
+        eq_(self.widget.idle, [])
+
+        self.widget.run_timers()
+        eq_(self.applied, [([(0, 'a', 'hit')], 1)])
+
+    def test_flush(self):
+        uut = self.create('frame')
+        uut.char(0, 'a', 'hit', 1)
+        uut.flush()
+        eq_(self.applied, [([(0, 'a', 'hit')], 1)])
+        eq_(self.widget.timers, [])
+        uut.flush()
+        eq_(len(self.applied), 1)
+
+    def test_latency(self):
+        uut = self.create('idle')
+        uut.input()
+        uut.char(0, 'a', 'hit', 1)
+        self.clock.now = 1000000
+        uut.input()
+        uut.char(1, 'b', 'hit', 2)
+
+        self.clock.now = 3000000
+        self.widget.run_idle()
+        eq_(uut.latency.count, 0)
+        # The second idle callback runs after Tk redrew the widget
+        self.clock.now = 5000000
+        self.widget.run_idle()
+        eq_(uut.latency.count, 2)
+        eq_(uut.latency.max, 5000)
+        eq_(uut.latency.min, 4000)
+
+    def test_ignored_input(self):
+        uut = self.create('idle')
+        # Nothing changes for the first input
+        uut.input()
+        self.clock.now = 10000000
+        uut.input()
+        uut.char(0, 'a', 'hit', 1)
+        self.clock.now = 11000000
+        self.widget.run_idle()
+        self.widget.run_idle()
+        eq_(uut.latency.count, 1)
+        eq_(uut.latency.max, 1000)
+
+    def test_on_paint(self):
+        painted = list()
+        uut = RenderScheduler(self.widget, self.apply_chars, self.apply_stats, on_paint=lambda: painted.append(True))
+        uut.stats()
+        self.widget.run_idle()
+        eq_(painted, [])
+        uut.input()
+        uut.char(0, 'a', 'hit', 1)
+        self.widget.run_idle()
+        self.widget.run_idle()
+        eq_(painted, [True])
+
+    def test_cancel(self):
+        uut = self.create('idle')
+        uut.input()
+        uut.char(0, 'a', 'hit', 1)
+        uut.stats()
+        uut.cancel()
+        ok_(not uut.pending)
+        eq_(self.widget.idle, [])
+        eq_(self.applied, [])
+        eq_(self.stats, 0)
@@ -0,0 +1,52 @@
+from datetime import timedelta
+from io import StringIO
+
+from nose.tools import eq_
+
+from pytouch.replay import *
+from pytouch.trainingmachine import TrainingMachine, Event
+
+TEXT = 'f j\nf'
+
+
+class TestReplay(object):
+    def test_replay(self):
+        ms = 1000000
+        strokes = [
+            Stroke(0, 'f'),
+            Stroke(100 * ms, 'x'),  # miss
+            Stroke(200 * ms, '<UNDO>'),
+            Stroke(300 * ms, ' '),
+            Stroke(400 * ms, '<PAUSE>'),
+            Stroke(5000 * ms, '<UNPAUSE>'),
+            Stroke(5100 * ms, 'j'),
+            Stroke(5200 * ms, '\n'),
+            Stroke(5300 * ms, 'f'),
+            Stroke(5400 * ms, '\n'),
+        ]
+        result = replay(TEXT, strokes)
+
+        eq_(result.hits, len(TEXT) + 1)
+        eq_(result.keystrokes, len(TEXT) + 2)
+        eq_(result.accuracy, (len(TEXT) + 1) / (len(TEXT) + 2))
+        eq_(result.elapsed, timedelta(milliseconds=400 + 400))
+        eq_(result.events, len(strokes))
+
+    def test_replay_log(self):
+        tm = TrainingMachine(TEXT, auto_unpause=True, clock=VirtualClock(0))
+        for i, c in enumerate('f j\nx'):
+            tm._clock.now = i * 1000000
+            tm.process_event(Event.input_event(i, c))
+        tm.process_event(Event.undo_event(5))
+
+        result = replay(TEXT, from_log(tm._log))
+        eq_(result.hits, tm.hits)
+        eq_(result.keystrokes, tm.keystrokes)
+        eq_(result.elapsed, timedelta(milliseconds=4))
+
+    def test_load_dump(self):
+        strokes = [Stroke(0, 'f'), Stroke(10, '\n'), Stroke(20, '<UNDO>')]
+        file = StringIO()
+        dump(strokes, file)
+        file.seek(0)
+        eq_(load(file), strokes)
@@ -1,9 +1,32 @@
-from nose.tools import eq_
-from pytouch.service import CourseService
+import os
+import tempfile
+from io import BytesIO
+from unittest.mock import patch
+
+from lxml import etree
+from nose.tools import eq_, ok_, assert_raises
+from pkg_resources import resource_string
+from sqlalchemy import create_engine
+from pytouch.drill import NgramIndex
+from pytouch.model import Course, LessonList, Lesson, Meta, Session, DrillIndex
+from pytouch.model.super import Base
+from pytouch.service import CourseService, CourseCache, CourseRecord, LessonRecord, SyncResult, fts_query
+
+
+class ParallelService(CourseService):
+    """ A service overriding the parser, defined at module level so that worker processes can find it. """
+    _course_file_names = ('testcourse.xml', 'de1.xml', 'us.xml')
+    cache_path = None
+
+    @staticmethod
+    def _read_course(course_element):
+        record = CourseService._read_course(course_element)
+        return record._replace(title=record.title.upper())
 
 
 class TestService(CourseService):
     _course_file_names = ('testcourse.xml', )
+    cache_path = None
 
     def test_course_parser(self):
         tcs = list(self._parse_courses())
@@ -29,3 +52,317 @@ class TestService(CourseService):
         eq_(tc.lessons[1].new_chars, 'dk')
         eq_(tc.lessons[1].builtin, True)
         eq_(tc.lessons[1].text, 'ddd kkk\nkkk ddd')
+
+    def test_course_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            class Service(TestService):
+                cache_path = os.path.join(directory, 'courses.cache')
+
+            with patch.object(Service, '_read_file', wraps=Service._read_file) as read_file:
+                first = [(c.uuid, [l.text for l in c.lessons]) for c in Service._parse_courses()]
+                eq_(read_file.call_count, 1)
+                ok_(os.path.exists(Service.cache_path))
+
+                second = [(c.uuid, [l.text for l in c.lessons]) for c in Service._parse_courses()]
+                eq_(read_file.call_count, 1)
+                eq_(first, second)
+
+    def test_course_cache_invalidation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CourseCache(os.path.join(directory, 'courses.cache'))
+            cache['a'] = 'record a'
+            cache['b'] = None
+            cache.save()
+
+            cache = CourseCache(cache.path)
+            ok_('a' in cache)
+            ok_('b' in cache)
+            eq_(cache['a'], 'record a')
+            cache.save()
+
+            # Entries that were not used are dropped
+            cache = CourseCache(cache.path)
+            ok_('a' in cache)
+            ok_('b' not in cache)
+
+    def test_course_cache_schema(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CourseCache(os.path.join(directory, 'courses.cache'), 'schema 1')
+            cache['a'] = None
+            cache.save()
+
+            ok_('a' in CourseCache(cache.path, 'schema 1'))
+            # Files that failed validation may be valid with a changed schema
+            ok_('a' not in CourseCache(cache.path, 'schema 2'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            class Service(TestService):
+                cache_path = os.path.join(directory, 'courses.cache')
+
+            with patch.object(Service, '_read_file', wraps=Service._read_file) as read_file:
+                list(Service._parse_courses())
+                with patch('pytouch.service.schema_digest', return_value='changed'):
+                    list(Service._parse_courses())
+                eq_(read_file.call_count, 2)
+
+    def test_parallel_parser(self):
+        class Service(TestService):
+            _course_file_names = ('testcourse.xml', 'de1.xml', 'us.xml')
+
+        serial = Service._course_records()
+        # A class defined in a function can't be passed to the workers, it is parsed serially
+        Service.jobs = 2
+        eq_(Service._course_records(), serial)
+
+    def test_parallel_parser_override(self):
+        serial = ParallelService._course_records()
+        eq_(serial[0].title, 'TESTCOURSE')
+        with patch.object(ParallelService, 'jobs', 2):
+            eq_(ParallelService._course_records(), serial)
+
+    def test_stream_course(self):
+        data = resource_string(self.RESOURCE, 'testcourse.xml')
+        course = self._read_course(etree.fromstring(data))
+
+        records = list(self.stream_course(BytesIO(data)))
+        eq_(records[0], course._replace(lessons=()))
+        eq_(tuple(records[1:]), course.lessons)
+
+    def test_stream_course_invalid_lesson(self):
+        data = resource_string(self.RESOURCE, 'testcourse.xml')
+        data = data.replace(b'<title>TestLesson2</title>', b'')
+
+        stream = self.stream_course(BytesIO(data))
+        eq_(next(stream).title, 'TestCourse')
+        eq_(next(stream).title, 'TestLesson1')
+        assert_raises(etree.DocumentInvalid, next, stream)
+
+    def test_stream_course_invalid_header(self):
+        data = resource_string(self.RESOURCE, 'testcourse.xml')
+        data = data.replace(b'<keyboardLayout>de</keyboardLayout>', b'')
+        assert_raises(etree.DocumentInvalid, list, self.stream_course(BytesIO(data)))
+
+    def test_read_file(self):
+        # Course files are loaded with the streaming parser and accepted exactly if they are valid as a whole
+        data = resource_string(self.RESOURCE, 'testcourse.xml')
+        with patch.object(TestService, 'stream_course', wraps=TestService.stream_course) as stream_course:
+            record = self._read_file('testcourse.xml', data)
+            eq_(stream_course.call_count, 1)
+        eq_(record, self._read_course(etree.fromstring(data)))
+
+        for invalid in (data.replace(b'</lessons>', b'</lessons><extra/>'),
+                        data.replace(b'</lessons>', b'<extra/></lessons>'),
+                        data.replace(b'<title>TestLesson2</title>', b'')):
+            eq_(self._read_file('invalid.xml', invalid), None)
+
+
+class TestSync(object):
+    @classmethod
+    def setup_class(cls):
+        cls.e = create_engine('sqlite:///tests.sqlite')
+
+    def setup(self):
+        Base.metadata.drop_all(self.e)
+        Base.metadata.create_all(self.e)
+        self.s = Session(bind=self.e)
+
+        class Service(TestService):
+            _course_file_names = ('testcourse.xml', 'de1.xml')
+
+        self.records = Service._course_records()
+        self.patch = patch.object(CourseService, '_course_records', lambda: self.records)
+        self.patch.start()
+
+    def teardown(self):
+        self.patch.stop()
+        self.s.close()
+
+    def digests(self):
+        return self.s.query(Meta).filter(Meta.key.startswith(CourseService.DIGEST_KEY)).count()
+
+    def test_sync(self):
+        lessons = sum(len(r.lessons) for r in self.records)
+        eq_(CourseService.sync_courses(bind=self.e), SyncResult(2, lessons, 0, 0))
+        eq_(self.s.query(Lesson).count(), lessons)
+        eq_(self.digests(), 2)
+
+        course = Course.find(self.s, self.records[0].uuid, with_text=True)
+        eq_([l.text for l in course.lessons], [l.text for l in self.records[0].lessons])
+
+        # Nothing changed
+        eq_(CourseService.sync_courses(bind=self.e), SyncResult(0, 0, 0, 0))
+
+    def test_sync_after_init(self):
+        Session.configure(bind=self.e)
+        CourseService.init_courses()
+        eq_(CourseService.sync_courses(bind=self.e), SyncResult(0, 0, 0, 0))
+
+    def test_sync_changes(self):
+        CourseService.sync_courses(bind=self.e)
+        NgramIndex.for_course(self.s, self.records[0].uuid)
+        NgramIndex.for_course(self.s, self.records[1].uuid)
+        self.s.commit()
+
+        test_course = self.records[0]
+        changed = test_course.lessons[0]._replace(text='changed')
+        added = test_course.lessons[0]._replace(uuid='added', title='added')
+        self.records[0] = test_course._replace(lessons=(added, changed))
+        eq_(CourseService.sync_courses(bind=self.e), SyncResult(1, 1, 1, 1))
+
+        self.s.expire_all()
+        course = Course.find(self.s, test_course.uuid, with_text=True)
+        eq_([(l.uuid, l.text) for l in course.lessons], [('added', added.text), (changed.uuid, 'changed')])
+        eq_(self.s.query(Lesson).filter(Lesson.uuid == test_course.lessons[1].uuid).count(), 0)
+        # Only the drill index of the changed course is dropped
+        eq_([row.course_uuid for row in self.s.query(DrillIndex)], [self.records[1].uuid])
+
+    def test_sync_removed_course(self):
+        CourseService.sync_courses(bind=self.e)
+
+        removed = self.records.pop()
+        eq_(CourseService.sync_courses(bind=self.e), SyncResult(1, 0, 0, len(removed.lessons)))
+        eq_(self.s.query(Course).count(), 1)
+        eq_(self.s.query(LessonList).count(), len(self.records[0].lessons))
+        eq_(self.digests(), 1)
+
+    def test_sync_moved_lesson(self):
+        CourseService.sync_courses(bind=self.e)
+
+        # Move a lesson in both processing orders, to a later and to an earlier course
+        for source, target in ((0, 1), (1, 0)):
+            moved = self.records[source].lessons[0]
+            self.records[source] = self.records[source]._replace(lessons=self.records[source].lessons[1:])
+            self.records[target] = self.records[target]._replace(lessons=self.records[target].lessons + (moved,))
+            eq_(CourseService.sync_courses(bind=self.e).deleted, 0)
+
+            self.s.expire_all()
+            eq_(self.s.query(Lesson).filter(Lesson.uuid == moved.uuid).count(), 1)
+            eq_([row.course_uuid for row in self.s.query(LessonList).filter(LessonList.lesson_uuid == moved.uuid)],
+                [self.records[target].uuid])
+
+    def test_sync_removed_course_shared_lesson(self):
+        CourseService.sync_courses(bind=self.e)
+
+        # The removed course shares a lesson with the remaining one
+        shared = self.records[1].lessons[0]
+        self.records[0] = self.records[0]._replace(lessons=self.records[0].lessons + (shared,))
+        CourseService.sync_courses(bind=self.e)
+        removed = self.records.pop()
+        eq_(CourseService.sync_courses(bind=self.e).deleted, len(removed.lessons) - 1)
+        eq_(self.s.query(Lesson).filter(Lesson.uuid == shared.uuid).count(), 1)
+
+
+class TestSearch(object):
+    @classmethod
+    def setup_class(cls):
+        cls.e = create_engine('sqlite:///tests.sqlite')
+
+    def setup(self):
+        Base.metadata.drop_all(self.e)
+        Base.metadata.create_all(self.e)
+        Session.configure(bind=self.e)
+        self.s = Session()
+
+        self.course = Course(title='course')
+        self.course.lessons = [
+            Lesson(uuid='a', title='Quick', new_chars='q', text='quick quick quick'),
+            Lesson(uuid='b', title='Fox', new_chars='x', text='the quick brown fox'),
+            Lesson(uuid='c', title='Lazy', new_chars='zß', text='lazy dog, Straße'),
+        ]
+        self.s.add(self.course)
+        self.s.commit()
+
+    def teardown(self):
+        self.s.close()
+
+    def test_words(self):
+        matches = CourseService.search_lessons(['quick'])
+        eq_([m.uuid for m in matches], ['a', 'b'])
+        eq_(matches[0].course, 'course')
+        ok_(matches[0].rank < matches[1].rank)
+        eq_(matches[1].snippet, 'the [quick] brown fox')
+
+        eq_([m.uuid for m in CourseService.search_lessons(['qu*', 'fox'])], ['b'])
+        # Query syntax in words is taken literally
+        eq_([m.uuid for m in CourseService.search_lessons(['"dog,', 'AND'])], [])
+        eq_([m.uuid for m in CourseService.search_lessons(['"dog,'])], ['c'])
+        eq_(CourseService.search_lessons(['quick'], limit=1)[0].uuid, 'a')
+
+    def test_chars(self):
+        eq_([m.uuid for m in CourseService.search_lessons(chars='ß')], ['c'])
+        # Lessons introducing the characters first
+        eq_([m.uuid for m in CourseService.search_lessons(chars='q')], ['a', 'b'])
+        eq_([m.uuid for m in CourseService.search_lessons(chars='x')], ['b'])
+        eq_([m.uuid for m in CourseService.search_lessons(['quick'], chars='w')], ['b'])
+        eq_(CourseService.search_lessons(), [])
+
+    def test_several_courses(self):
+        other = Course(title='another course')
+        other.lessons = [self.course.lessons[1]]
+        self.s.add(other)
+        self.s.commit()
+
+        eq_([(m.uuid, m.course) for m in CourseService.search_lessons(['quick'])],
+            [('a', 'course'), ('b', 'another course')])
+        eq_([(m.uuid, m.course) for m in CourseService.search_lessons(chars='q')],
+            [('a', 'course'), ('b', 'another course')])
+
+    def test_fts_query(self):
+        eq_(fts_query(['a', 'b*', '*', 'say "hi"']), '"a" "b"* "say ""hi"""')
+
+
+class TestCharsetSearch(object):
+    @classmethod
+    def setup_class(cls):
+        cls.e = create_engine('sqlite:///tests.sqlite')
+
+    def setup(self):
+        Base.metadata.drop_all(self.e)
+        Base.metadata.create_all(self.e)
+        Session.configure(bind=self.e)
+        self.s = Session()
+
+        self.records = [CourseRecord('de', 'Deutsch', None, 'de', (
+            LessonRecord('home', 'home row', 'asdfjklö', 'asdf jklö\nfjfj'),
+            LessonRecord('ei', 'e and i', 'ei', 'die sie\nlies'),
+            LessonRecord('upper', 'upper row', 'qwertzuiopü', 'quer wir'),
+        )), CourseRecord('us', 'English', None, 'us', (
+            LessonRecord('us-home', 'home row', 'asdfjkl;', 'asdf jkl;'),
+        ))]
+        self.patch = patch.object(CourseService, '_course_records', lambda: self.records)
+        self.patch.start()
+
+    def teardown(self):
+        self.patch.stop()
+        self.s.close()
+
+    def find(self, **kwargs):
+        return [match.uuid for match in CourseService.find_lessons_by_chars(**kwargs)]
+
+    def test_find(self):
+        CourseService.init_courses()
+        eq_(self.find(only='asdfjklö'), ['home'])
+        eq_(self.find(only='asdfjklöei'), ['home', 'ei'])
+        eq_(self.find(only='asdfjklöei', layout='de'), ['home', 'ei'])
+        eq_(self.find(only='asdfjkl;'), ['us-home'])
+        eq_(self.find(including='e'), ['ei', 'upper'])
+        eq_(self.find(including='eq'), ['upper'])
+        eq_(self.find(including='ex'), [])
+        eq_(self.find(only='asdfjklöei', including='e'), ['ei'])
+        eq_(len(self.find()), 4)
+
+    def test_sync(self):
+        CourseService.sync_courses(bind=self.e)
+        eq_(self.find(only='asdfjklöei'), ['home', 'ei'])
+
+        # Lessons without signature get one on the next sync
+        self.s.query(Lesson).update({Lesson.charset: None}, synchronize_session=False)
+        self.s.commit()
+        eq_(self.find(only='asdfjklöei'), [])
+        CourseService.sync_courses(bind=self.e)
+        eq_(self.find(only='asdfjklöei'), ['home', 'ei'])
+
+        # Changed texts get a new signature
+        self.records[0] = self.records[0]._replace(lessons=(self.records[0].lessons[0]._replace(text='asdf e'),))
+        CourseService.sync_courses(bind=self.e)
+        eq_(self.find(including='e', layout='de'), ['home'])
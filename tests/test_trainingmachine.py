@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from unittest.mock import MagicMock, call
 
 from nose.tools import eq_, assert_raises, assert_almost_equal, assert_list_equal
@@ -16,10 +16,22 @@ def check_char_list(list, expect):
             eq_(char[0], expect[i])
 
 
+class FakeClock(object):
+    def __init__(self, now=1000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, ns):
+        self.now += ns
+
+
 class TestTrainingMachine(object):
     def setup(self):
         self.feedback_mock = MagicMock()
-        self.uut = TrainingMachine(TEXT, auto_unpause=True)
+        self.clock = FakeClock()
+        self.uut = TrainingMachine(TEXT, auto_unpause=True, clock=self.clock)
         self.uut.add_observer(self.feedback_mock)
 
     def test_init(self):
@@ -36,28 +48,61 @@ class TestTrainingMachine(object):
         self.uut.process_event(Event.unpause_event())
         eq_(self.uut._state_fn, self.uut._state_input)
         eq_(self.uut._pause_history[-1].action, 'start')
-        assert_almost_equal(self.uut._pause_history[-1].time,
-                            datetime.utcnow(), delta=timedelta(milliseconds=5))
+        eq_(self.uut._pause_history[-1].time, self.clock.now)
 
         # pause and check inner state change
+        self.clock.advance(10)
         self.uut.process_event(Event.pause_event())
         eq_(self.uut._state_fn, self.uut._state_pause)
         eq_(self.uut._pause_history[-1].action, 'pause')
-        assert_almost_equal(self.uut._pause_history[-1].time,
-                            datetime.utcnow(), delta=timedelta(milliseconds=5))
+        eq_(self.uut._pause_history[-1].time, self.clock.now)
 
         # unpause and check inner state change
+        self.clock.advance(10)
         self.uut.process_event(Event.unpause_event())
         eq_(self.uut._state_fn, self.uut._state_input)
         eq_(self.uut._pause_history[-1].action, 'unpause')
-        assert_almost_equal(self.uut._pause_history[-1].time,
-                            datetime.utcnow(), delta=timedelta(milliseconds=5))
+        eq_(self.uut._pause_history[-1].time, self.clock.now)
 
         # check feedback
         self.feedback_mock.assert_has_calls(
             [call.on_unpause(self.uut), call.on_pause(self.uut),
              call.on_unpause(self.uut)])
 
+    def test_elapsed(self):
+        eq_(self.uut.elapsed_ns(), 0)
+        self.clock.advance(1000)
+        eq_(self.uut.elapsed(), timedelta(0))
+
+        self.uut.process_event(Event.unpause_event())
+        self.clock.advance(3000)
+        eq_(self.uut.elapsed_ns(), 3000)
+        eq_(self.uut.elapsed(), timedelta(microseconds=3))
+
+        # time does not advance during pause
+        self.uut.process_event(Event.pause_event())
+        self.clock.advance(5000)
+        eq_(self.uut.elapsed_ns(), 3000)
+
+        self.uut.process_event(Event.unpause_event())
+        self.clock.advance(2000)
+        eq_(self.uut.elapsed_ns(), 5000)
+
+        # key strokes are recorded with the elapsed time
+        self.uut.process_event(Event.input_event(0, TEXT[0]))
+        eq_(self.uut._text[0].keystrokes[0].time, timedelta(microseconds=5))
+        eq_(self.uut._log.times[0], 5000)
+
+        # time stops at the end
+        for i, c in enumerate(TEXT[1:] + '\n', 1):
+            self.uut.process_event(Event.input_event(i, c))
+        self.clock.advance(4000)
+        eq_(self.uut.elapsed_ns(), 5000)
+
+        # and starts over on restart
+        self.uut.process_event(Event.restart_event())
+        eq_(self.uut.elapsed_ns(), 0)
+
     def test_hit(self):
         self.uut.process_event(Event.input_event(0, TEXT[0]))
         eq_(self.uut._state_fn, self.uut._state_input)
@@ -149,10 +194,138 @@ class TestTrainingMachine(object):
         eq_(self.uut._state_fn, self.uut._state_input)
         self.feedback_mock.assert_not_called()
 
+    def test_batch(self):
+        self.uut.process_events([
+            LightEvent.input_event(0, TEXT[0]),  # hit
+            LightEvent.input_event(1, TEXT[0]),  # miss
+            LightEvent.undo_event(2),
+        ])
+        eq_(self.uut.hits, 1)
+        eq_(self.uut.keystrokes, 2)
+
+        self.feedback_mock.on_batch.assert_called_once_with(self.uut, [
+            Change('on_unpause', ()),
+            Change('on_hit', (0, TEXT[0])),
+            Change('on_miss', (1, TEXT[0], TEXT[1])),
+            Change('on_undo', (1, TEXT[1])),
+        ])
+        self.feedback_mock.on_hit.assert_not_called()
+
+    def test_batch_fallback(self):
+        class Observer(object):
+            def __init__(self):
+                self.calls = list()
+
+            def __getattr__(self, item):
+                if not item.startswith('on_') or item == 'on_batch':
+                    raise AttributeError(item)
+                return lambda *args: self.calls.append((item, ) + args)
+
+        observer = Observer()
+        self.uut.remove_observer(self.feedback_mock)
+        self.uut.add_observer(observer)
+        self.uut.process_events([LightEvent.input_event(0, TEXT[0]), LightEvent.pause_event()])
+
+        eq_(observer.calls, [
+            ('on_unpause', self.uut),
+            ('on_hit', self.uut, 0, TEXT[0]),
+            ('on_pause', self.uut),
+        ])
+
+    def test_batch_observer_interface(self):
+        observer = TrainingMachineObserver()
+        observer.on_unpause = MagicMock()
+        observer.on_hit = MagicMock()
+        self.uut.add_observer(observer)
+        self.uut.process_events([LightEvent.input_event(0, TEXT[0])])
+
+        observer.on_unpause.assert_called_once_with(self.uut)
+        observer.on_hit.assert_called_once_with(self.uut, 0, TEXT[0])
+
+    def test_batch_error(self):
+        assert_raises(IndexError, self.uut.process_events, [
+            LightEvent.input_event(0, TEXT[0]),
+            LightEvent.input_event(len(TEXT) + 1, 'A'),
+        ])
+        # Changes made before the error are reported
+        self.feedback_mock.on_batch.assert_called_once_with(self.uut, [
+            Change('on_unpause', ()),
+            Change('on_hit', (0, TEXT[0])),
+        ])
+
     def test_index_out_of_range(self):
         assert_raises(IndexError, self.uut.process_event, Event.input_event(len(TEXT) + 1, 'A'))
         eq_(self.uut._state_fn, self.uut._state_input)
         self.feedback_mock.assert_not_called()
 
+    def test_statistics(self):
+        events = [
+            Event.input_event(0, TEXT[0]),  # hit
+            Event.input_event(1, TEXT[0]),  # miss
+            Event.undo_event(2),
+            Event.undo_event(1),
+            Event.input_event(0, TEXT[0]),  # hit
+            Event.input_event(1, TEXT[1]),  # hit
+            Event.input_event(2, TEXT[0]),  # miss
+        ]
+
+        for event in events:
+            self.uut.process_event(event)
+            strokes = [ks for char in self.uut._text for ks in char.keystrokes]
+            eq_(self.uut.hits, len([char for char in self.uut._text if char.hit]))
+            eq_(self.uut.keystrokes, len([ks for ks in strokes if ks.char != '<UNDO>']))
+            eq_(self.uut.undos, len([ks for ks in strokes if ks.char == '<UNDO>']))
+            eq_(self.uut.typos, sum(len(char.typos) for char in self.uut._text))
+
+        eq_(self.uut.hits, 2)
+        eq_(self.uut.keystrokes, 5)
+        eq_(self.uut.undos, 2)
+        eq_(self.uut.typos, 2)
+        assert_almost_equal(self.uut.progress, 2 / len(TEXT + '\n'))
+
+    def test_statistics_reset(self):
+        text = TEXT + '\n'
+        for i, c in enumerate(text):
+            self.uut.process_event(Event.input_event(i, c))
+        eq_(self.uut.hits, len(text))
+        eq_(self.uut.progress, 1)
+
+        self.uut.process_event(Event.restart_event())
+        eq_(self.uut.hits, 0)
+        eq_(self.uut.keystrokes, 0)
+        eq_(self.uut.undos, 0)
+        eq_(self.uut.typos, 0)
+
+
+class TestKeyStrokeLog(object):
+    def setup(self):
+        self.uut = KeyStrokeLog(3)
+
+    def test_append(self):
+        self.uut.append(0, 'a', 10)
+        self.uut.append(1, 'b', 20)
+        self.uut.append(1, '<UNDO>', 30)
+        self.uut.append(1, 'c', 40)
+
+        eq_(len(self.uut), 4)
+        assert_list_equal(list(self.uut.codes), [ord('a'), ord('b'), KeyStrokeLog.UNDO_CODE, ord('c')])
+        assert_list_equal(list(self.uut.indices), [0, 1, 1, 1])
+        assert_list_equal(list(self.uut.times), [10, 20, 30, 40])
+
+        assert_list_equal(self.uut.strokes(0), [0])
+        assert_list_equal(self.uut.strokes(1), [1, 2, 3])
+        assert_list_equal(self.uut.strokes(2), [])
+
+        eq_(self.uut.last_code(1), ord('c'))
+        eq_(self.uut.last_code(2), None)
+
+    def test_clear(self):
+        self.uut.append(0, 'a', 10)
+        self.uut.clear()
+
+        eq_(len(self.uut), 0)
+        assert_list_equal(self.uut.strokes(0), [])
+        eq_(self.uut.last_code(0), None)
+
 # def test_space(self):
 # def test_linefeed(self):